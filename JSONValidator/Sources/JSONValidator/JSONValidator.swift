@@ -75,6 +75,11 @@ public struct FileDefinition: Codable {
 	public var installOnRepair: Bool?
 	/// A list of various requirements determining whether the file will be installed
 	public var requirementsList: [String]?
+	/// The SHA-256 of the file at `url`. If set, the download is checked against it as it is downloaded, instead of
+	/// testing the archive with 7z afterwards. Not used for metalinks (which contain their own checksums)
+	public var sha256: String?
+	/// The names of lower priority files which this file overwrites, so must be re-installed after whenever they are updated
+	public var dependsOn: [String]?
 }
 
 public struct FileOverrideDefinition: Codable {
@@ -107,6 +112,9 @@ public struct FileOverrideDefinition: Codable {
 	/// If set to True, this file override should be installed if the target install is using Wine or Proton
 	/// even if the OS does not match
 	public var wine: Bool?
+	/// The SHA-256 of the file at `url`. If set, the download is checked against it as it is downloaded, instead of
+	/// testing the archive with 7z afterwards. Not used for metalinks (which contain their own checksums)
+	public var sha256: String?
 }
 
 public enum OS: String, Codable, CaseIterable {
@@ -151,4 +159,7 @@ public struct ModOptionFileDefinition: Codable {
 	public var priority: Int
 	/// A file or folder path relative to the *top-level game directory*, to be deleted before extraction
 	public var deletePath: String?
+	/// The SHA-256 of the file at `url`. If set, the download is checked against it as it is downloaded, instead of
+	/// testing the archive with 7z afterwards. Not used for metalinks (which contain their own checksums)
+	public var sha256: String?
 }
@@ -0,0 +1,352 @@
+from __future__ import print_function, unicode_literals
+
+import base64
+import binascii
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+import common
+import progressEvents
+
+try:
+	from urllib.request import build_opener, ProxyHandler, Request
+except ImportError:
+	from urllib2 import build_opener, ProxyHandler, Request
+
+try:
+	from typing import Optional, List, Dict, Callable, Any
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+class AriaRPCException(Exception):
+	def __init__(self, errorReason):
+		# type: (str) -> None
+		self.errorReason = errorReason  # type: str
+
+	def __str__(self):
+		return self.errorReason
+
+
+def _getFreeLoopbackPort():
+	# type: () -> int
+	"""Ask the OS for a free TCP port on the loopback interface"""
+	s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	try:
+		s.bind(('127.0.0.1', 0))
+		return s.getsockname()[1]
+	finally:
+		s.close()
+
+
+def formatAriaStatusLine(gid, completedLength, totalLength, numConnections, downloadSpeed):
+	# type: (str, int, int, int, int) -> str
+	"""
+	Formats a download status in the same way as aria2c's console readout, like:
+	[#7f0d78 27MiB/910MiB(3%) CN:8 DL:4.2MiB ETA:3m27s]
+	so that it is recognized by commandLineParser.tryGetAriaStatusUpdate()
+	"""
+	def mebibytes(numBytes):
+		return "{:.1f}MiB".format(numBytes / 1048576.0)
+
+	percent = int(completedLength * 100 / totalLength) if totalLength > 0 else 0
+
+	if downloadSpeed > 0 and totalLength > 0:
+		etaSeconds = int((totalLength - completedLength) / downloadSpeed)
+		eta = "{}m{:02d}s".format(etaSeconds // 60, etaSeconds % 60)
+	else:
+		eta = "N/A"
+
+	return "[#{} {}/{}({}%) CN:{} DL:{} ETA:{}]".format(gid[:6], mebibytes(completedLength), mebibytes(totalLength),
+	                                                   percent, numConnections, mebibytes(downloadSpeed), eta)
+
+
+class AriaRPCDownloader:
+	"""
+	Runs a single, long-lived aria2c process in RPC mode, listening only on the loopback interface.
+
+	Downloads are submitted with aria2.addUri/aria2.addMetalink, and their progress is polled with aria2.tellStatus,
+	which gives exact byte counts, speed and error codes instead of scraping aria2c's console output.
+	This avoids starting a new aria2c process (and a new TLS handshake) for every file and every retry.
+
+	Usage: call start(), then download() (which is thread safe) as many times as needed, then shutdown().
+	The downloader can also be used as a context manager, which calls start() and shutdown() automatically.
+	"""
+	POLL_INTERVAL_SECONDS = 0.5
+	STARTUP_TIMEOUT_SECONDS = 15
+
+	def __init__(self, downloadDir, ariaExecutable=None, maxConcurrentDownloads=None, useIPV6=False):
+		# type: (str, Optional[str], Optional[int], bool) -> None
+		self.downloadDir = downloadDir
+		self.ariaExecutable = common.Globals.ARIA_EXECUTABLE if ariaExecutable is None else ariaExecutable
+		self.maxConcurrentDownloads = common.Globals.MAX_CONCURRENT_DOWNLOADS if maxConcurrentDownloads is None else maxConcurrentDownloads
+		self.useIPV6 = useIPV6
+		self.port = None  # type: Optional[int]
+		self.secret = binascii.hexlify(os.urandom(16)).decode('utf-8')
+		self.process = None  # type: Optional[subprocess.Popen]
+		self.requestID = 0
+		self.requestIDLock = threading.Lock()
+		# Set by cancelAll() - no more downloads are added once set
+		self.cancelled = False
+
+		# Never use a system proxy to talk to our own aria2c process
+		self.opener = build_opener(ProxyHandler({}))
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.shutdown()
+
+	def start(self):
+		common.makeDirsExistOK(self.downloadDir)
+		self.port = _getFreeLoopbackPort()
+
+		# The secret is passed in a config file only readable by the current user, as other users can read the
+		# command line arguments of a process. aria2c only reads it on startup, so it's deleted once aria2c is ready.
+		confFileHandle, confPath = tempfile.mkstemp(prefix='aria2rpc', suffix='.conf')
+		try:
+			os.write(confFileHandle, 'rpc-secret={}\n'.format(self.secret).encode('utf-8'))
+		finally:
+			os.close(confFileHandle)
+
+		try:
+			self._startProcess(confPath)
+		finally:
+			os.remove(confPath)
+
+	def _startProcess(self, confPath):
+		# type: (str) -> None
+		arguments = [
+			self.ariaExecutable,
+			'--conf-path={}'.format(confPath),
+			'--enable-rpc=true',
+			'--rpc-listen-all=false',  # Only listen on the loopback interface
+			'--rpc-listen-port={}'.format(self.port),
+			'--rpc-max-request-size=16M',  # Metalinks are submitted base64 encoded as part of the request
+			'--dir={}'.format(self.downloadDir),
+			'--max-concurrent-downloads={}'.format(self.maxConcurrentDownloads),
+			'--console-log-level=warn',
+			'--summary-interval=0',
+		]
+
+		if common.Globals.ARIA2_CERT_PATH is not None:
+			arguments.append("--ca-certificate=" + common.Globals.ARIA2_CERT_PATH)
+
+		print("AriaRPCDownloader: Starting aria2c in RPC mode on port {}".format(self.port))
+		self.process = subprocess.Popen(arguments)
+
+		# Wait until aria2c is ready to accept requests
+		startTime = time.time()
+		while True:
+			try:
+				version = self.call('aria2.getVersion')
+				print("AriaRPCDownloader: Connected to aria2c {}".format(version.get('version')))
+				return
+			except Exception as e:
+				if self.process.poll() is not None:
+					raise AriaRPCException("aria2c RPC process exited on startup with code {}".format(self.process.returncode))
+
+				if time.time() - startTime > AriaRPCDownloader.STARTUP_TIMEOUT_SECONDS:
+					self.shutdown()
+					raise AriaRPCException("Timed out connecting to aria2c RPC server: {}".format(e))
+
+			time.sleep(.1)
+
+	def shutdown(self):
+		if self.process is None:
+			return
+
+		try:
+			self.call('aria2.shutdown')
+			for _ in range(50):
+				if self.process.poll() is not None:
+					break
+				time.sleep(.1)
+		except Exception as e:
+			print("AriaRPCDownloader: Failed to shut down aria2c cleanly: {}".format(e))
+
+		if self.process.poll() is None:
+			print("AriaRPCDownloader: Killing aria2c process")
+			self.process.kill()
+			self.process.wait()
+
+		self.process = None
+
+	def call(self, method, *params):
+		# type: (str, Any) -> Any
+		"""Make a JSON-RPC call to the aria2c process, returning the result or raising AriaRPCException on error"""
+		with self.requestIDLock:
+			self.requestID += 1
+			requestID = self.requestID
+
+		payload = json.dumps({
+			'jsonrpc': '2.0',
+			'id': str(requestID),
+			'method': method,
+			'params': ['token:' + self.secret] + list(params),
+		}).encode('utf-8')
+
+		request = Request('http://127.0.0.1:{}/jsonrpc'.format(self.port), data=payload, headers={'Content-Type': 'application/json'})
+
+		try:
+			response = self.opener.open(request, timeout=10)
+			responseJSON = json.loads(common.ensureUnicodeOrStr(response.read()))
+			response.close()
+		except Exception as e:
+			# aria2c replies with a HTTP error code if the request failed, but the body still contains the JSON error
+			body = getattr(e, 'read', None)
+			if body is None:
+				raise
+			responseJSON = json.loads(common.ensureUnicodeOrStr(body()))
+
+		if 'error' in responseJSON:
+			raise AriaRPCException("aria2c RPC call {} failed: {}".format(method, responseJSON['error'].get('message')))
+
+		return responseJSON['result']
+
+	def _downloadOptions(self, followMetaLink, outputFile, numConnections=1, sha256=None):
+		# type: (bool, Optional[str], int, Optional[str]) -> Dict[str, str]
+		# These options should match the command line arguments used in common.aria()
+		options = {
+			'file-allocation': 'none',
+			'continue': 'true',
+			'retry-wait': '5',
+			'max-tries': '0',
+			'max-connection-per-server': str(numConnections),
+			'split': str(max(8, numConnections)),
+			'auto-file-renaming': 'false',
+			'allow-overwrite': 'true',
+			'follow-metalink': 'mem' if followMetaLink else 'false',
+		}
+
+		if followMetaLink:
+			options['check-integrity'] = 'true'
+
+		if sha256:
+			# Checked once the download completes - see common.aria() for why check-integrity isn't used
+			options['checksum'] = 'sha-256=' + sha256
+
+		if not self.useIPV6:
+			options['disable-ipv6'] = 'true'
+
+		if outputFile:
+			options['out'] = outputFile
+
+		return options
+
+	def addDownload(self, url, followMetaLink=False, outputFile=None, numConnections=1, sha256=None):
+		# type: (str, bool, Optional[str], int, Optional[str]) -> List[str]
+		"""
+		Submit a url to be downloaded. Returns a list of aria2 GIDs - normally one GID, but a metalink will return
+		one GID for each file it contains.
+		"""
+		options = self._downloadOptions(followMetaLink, outputFile, numConnections, sha256)
+
+		if followMetaLink:
+			metalinkData = common.downloadFile(url, is_text=False)
+			return self.call('aria2.addMetalink', base64.b64encode(metalinkData).decode('utf-8'), options)
+		else:
+			return [self.call('aria2.addUri', [url], options)]
+
+	def removeDownloads(self, gids):
+		# type: (List[str]) -> None
+		"""Stop and forget the given downloads, ignoring any errors (eg. if a download has already finished)"""
+		for gid in gids:
+			for method in ['aria2.forceRemove', 'aria2.removeDownloadResult']:
+				try:
+					self.call(method, gid)
+				except Exception:
+					pass
+
+	def cancelAll(self):
+		"""
+		Stop every running or waiting download, and don't start any more. download() calls which are in progress return
+		an error. aria2c keeps the partial downloads (and their control files), so they can be resumed later.
+		"""
+		self.cancelled = True
+		try:
+			statuses = self.call('aria2.tellActive', ['gid']) + self.call('aria2.tellWaiting', 0, 1000, ['gid'])
+		except Exception as e:
+			print("AriaRPCDownloader: Failed to list downloads to cancel: {}".format(e))
+			return
+
+		for status in statuses:
+			try:
+				self.call('aria2.forceRemove', status['gid'])
+			except Exception:
+				pass
+
+	def tellStatus(self, gid):
+		# type: (str) -> Dict[str, Any]
+		return self.call('aria2.tellStatus', gid, ['gid', 'status', 'totalLength', 'completedLength', 'downloadSpeed',
+		                                         'connections', 'errorCode', 'errorMessage', 'followedBy'])
+
+	def download(self, url, followMetaLink=False, outputFile=None, statusCallback=None, numConnections=1, sha256=None):
+		# type: (str, bool, Optional[str], Optional[Callable[[str], None]], int, Optional[str]) -> int
+		"""
+		Downloads a url (or all files in a metalink), blocking until the download completes or fails.
+
+		:param statusCallback: Called with a status line on each poll. Defaults to progressEvents.printProgressLine(),
+		                       which prints the status and shows it in the GUI.
+		:param numConnections: The maximum number of connections to use to download each file
+		:param sha256: If specified, aria2c checks the downloaded file has this SHA-256 hex digest (not used for metalinks)
+		:return: 0 on success, or a non-zero aria2 error code on failure, like common.aria()
+		"""
+		if statusCallback is None:
+			statusCallback = progressEvents.printProgressLine
+
+		if self.cancelled:
+			print("AriaRPCDownloader: Not downloading [{}] as downloads were cancelled".format(url))
+			return 1
+
+		try:
+			pendingGIDs = self.addDownload(url, followMetaLink, outputFile, numConnections, sha256)
+		except Exception as e:
+			print("AriaRPCDownloader: Failed to add download [{}]: {}".format(url, e))
+			return 1
+
+		print("AriaRPCDownloader: Downloading [{}] as GIDs {}".format(url, pendingGIDs))
+
+		exitCode = 0
+		while pendingGIDs:
+			time.sleep(AriaRPCDownloader.POLL_INTERVAL_SECONDS)
+
+			for gid in list(pendingGIDs):
+				try:
+					status = self.tellStatus(gid)
+				except Exception as e:
+					print("AriaRPCDownloader: Failed to get status of [{}]: {}".format(gid, e))
+					# Stop the remaining downloads, otherwise a retry would download the same files at the same time
+					self.removeDownloads(pendingGIDs)
+					return 1
+
+				state = status['status']
+				if state in ['active', 'waiting', 'paused']:
+					statusCallback(formatAriaStatusLine(gid, int(status['completedLength']), int(status['totalLength']),
+					                                    int(status['connections']), int(status['downloadSpeed'])))
+					continue
+
+				pendingGIDs.remove(gid)
+
+				# A download may be replaced by other downloads (eg if aria2c follows a metalink itself)
+				pendingGIDs.extend(status.get('followedBy', []))
+
+				if state == 'complete':
+					print("AriaRPCDownloader: Finished [{}] ({} bytes)".format(gid, status['completedLength']))
+				else:
+					exitCode = int(status.get('errorCode', 1)) or 1
+					print("AriaRPCDownloader: Download [{}] {} with error {}: {}".format(gid, state, exitCode, status.get('errorMessage')))
+
+				try:
+					self.call('aria2.removeDownloadResult', gid)
+				except Exception:
+					pass
+
+		return exitCode
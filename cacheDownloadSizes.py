@@ -65,7 +65,7 @@ def generateCachedDownloadSizes():
 	allURLs = getAllURLsFromModList(modList)
 
 	def queryAndPrint(url):
-		res = common.DownloaderAndExtractor.getExtractableItem(url, '.')
+		res = common.DownloaderAndExtractor.getExtractableItem(url, '.', forceRevalidate=True)
 		return url, res
 
 	# Only works on python 3
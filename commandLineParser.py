@@ -2,6 +2,8 @@ from __future__ import unicode_literals
 
 import re
 
+import progressEvents
+
 try:
 	from typing import Optional
 except:
@@ -131,4 +133,6 @@ def tryGetOverallStatus(overallStatusString):
 # Print a status update which will be recognized by the command line parser
 def printSeventhModStatusUpdate(overallPercentage, currentTask):
 	# type: (int, str) -> None
-	print("<<< Status: {}% {} >>>".format(overallPercentage, currentTask))
+	eventBus = progressEvents.getEventBus()
+	eventBus.publishOverallStatus(overallPercentage, currentTask)
+	eventBus.printWithoutLogEvent("<<< Status: {}% {} >>>\n".format(overallPercentage, currentTask))
@@ -1,7 +1,9 @@
 from __future__ import print_function, unicode_literals
 
+import codecs
 import datetime
 import io
+import multiprocessing
 import re
 import shutil
 import sys, os, platform, subprocess, json
@@ -10,10 +12,17 @@ import time
 import traceback
 import tempfile
 import webbrowser
-import zlib
 
 import commandLineParser
+import downloadStore
+import extractionPlanner
+import fileHasher
 import installConfiguration
+import installJournal
+import installManifest
+import progressEvents
+import urlMetadataCache
+import zipExtractor
 
 try:
 	"".decode("utf-8")
@@ -48,7 +57,7 @@ except:
 	from HTMLParser import HTMLParser
 
 try:
-	from typing import Optional, List, Tuple, Dict, Callable, Any
+	from typing import Optional, List, Tuple, Dict, Callable, Any, Set
 except:
 	pass
 
@@ -183,6 +192,113 @@ class Globals:
 	FREE_SPACE_ESTIMATE_FIXED = 5000000000
 
 	URL_FILE_SIZE_LOOKUP_TABLE = {}
+	# Maps url -> SHA-256 hex digest, for urls which have a 'sha256' in installData.json. See loadDownloadChecksums()
+	URL_SHA256_LOOKUP_TABLE = {}
+
+	DOWNLOAD_ENGINE_ARIA2C = 'aria2c'
+	DOWNLOAD_ENGINE_ARIA2C_RPC = 'aria2c-rpc'
+	DOWNLOAD_ENGINE_PYTHON = 'python'
+	DOWNLOAD_ENGINE = DOWNLOAD_ENGINE_ARIA2C
+	"""Selects how DownloaderAndExtractor downloads files:
+	- 'aria2c': start a new aria2c process for each url, and parse its console output for progress
+	- 'aria2c-rpc': start a single aria2c process in RPC mode, and submit/monitor all downloads via JSON-RPC
+	- 'python': download in-process using pooled keep-alive connections (see httpDownloader.py) - does not need aria2c"""
+
+	PIPELINE_DOWNLOAD_AND_EXTRACT = True
+	"""If True, installers extract each archive as soon as it is downloaded, while the remaining archives are still
+	downloading (see DownloaderAndExtractor.downloadAndExtract()). If False, everything is downloaded before extraction starts."""
+
+	CACHE_FOLDER = '07th-mod_cache'
+	URL_METADATA_CACHE_PATH = os.path.join(CACHE_FOLDER, 'urlMetadataCache.json')
+	URL_METADATA_CACHE_TTL_SECONDS = 30 * 60
+	"""When previewing a download, URL metadata (filename, size etc.) younger than this is used without contacting the
+	server. Older metadata is revalidated with a conditional request (If-None-Match/If-Modified-Since) before it is used.
+	Installs always revalidate the metadata, so a file which changed on the server is never downloaded with a stale size."""
+	FILE_HASH_CACHE_PATH = os.path.join(CACHE_FOLDER, 'fileHashCache.json')
+
+	SEGMENTED_DOWNLOAD_MIN_SIZE = 100 * 1024 * 1024
+	"""When segmented downloads are enabled, files at least this large are downloaded over several connections at once"""
+	SEGMENTED_DOWNLOAD_CONNECTIONS = 8
+	"""The number of connections used for a segmented download (aria2c allows at most 16)"""
+
+	DOWNLOAD_STORE_FOLDER = os.path.join(CACHE_FOLDER, 'downloads')
+	DOWNLOAD_STORE_MAX_SIZE = 0
+	"""Maximum total size of previously downloaded files kept for re-use by later installs (see downloadStore.py).
+	The download store is disabled by default (0). If enabled, up to this much disk space is used in DOWNLOAD_STORE_FOLDER
+	even after the installer deletes its download folder, and this is included in the free space check (see checkFreeSpace())."""
+
+	MAX_URL_QUERY_WORKERS = 10
+	"""The maximum number of URLs to query at the same time (eg. when getting the size/filename of each file to download)"""
+
+	MAX_CONCURRENT_DOWNLOADS = 4
+	"""The number of URLs DownloaderAndExtractor.download() will download at the same time.
+	Each URL is fetched over a single connection, so downloading several URLs at once helps when the per-connection
+	speed from the server is the bottleneck. Set to 1 to download one URL at a time."""
+
+	PLAN_EXTRACTION_OVERLAYS = True
+	"""If True, files which would be overwritten by a later archive are not extracted at all (see extractionPlanner.py)"""
+
+	SKIP_UNCHANGED_FILES_DURING_EXTRACTION = True
+	"""If True, archive members are not extracted if the file already at their destination has the same size and CRC32
+	as recorded in the archive, so re-installs only write the files which changed (see extractionPlanner.py).
+	This only has an effect when files are extracted directly into the game folder (Umineko, and Higurashi on Windows).
+	Higurashi on Linux/Mac extracts into an empty "<mod> Extraction" folder which is then moved into place, so every
+	file is still extracted there."""
+
+	EXTRACT_ZIPS_IN_PROCESS = True
+	"""If True, .zip files are extracted with Python's zipfile module on several threads, instead of with 7z.
+	7z is still used for .7z files, split archives, and zips which zipfile can't handle. See zipExtractor.py"""
+
+	ZIP_EXTRACTION_THREADS = max(1, min(8, multiprocessing.cpu_count()))
+	"""The number of threads used to extract each .zip file (see EXTRACT_ZIPS_IN_PROCESS)"""
+
+	REPAIR_VERIFY_WITH_MANIFEST = True
+	"""If True, repair mode checks the installed files against the install manifest (see installManifest.py), and only
+	re-installs the mod files which have missing or modified files. Mod files with nothing in the manifest are
+	re-installed as before if they are marked 'installOnRepair'."""
+
+	UPDATE_ONLY_DEPENDENT_FILES = True
+	"""If True, when a mod file is re-installed, only the files which depend on it are re-installed too - those which
+	declare it in 'dependsOn', or which overwrote its files during the last install (as recorded in the install manifest).
+	A new version of a file may contain files which weren't in the last install, so when a file is updated, this only
+	applies if some file declares it in 'dependsOn'.
+	If False, or if the install manifest doesn't record which files overwrote each other, every higher priority file
+	is re-installed (see fileVersionManagement.getFilesNeedingUpdate())"""
+
+	HASH_THREADS = max(1, min(8, multiprocessing.cpu_count()))
+	"""The number of files hashed at the same time when several files need hashing (see fileHasher.py)"""
+
+	USE_FILE_HASH_CACHE = True
+	"""If True, file hashes are cached by path, size and modified time, so unchanged files aren't hashed again (see fileHasher.FileHashCache)"""
+
+	FILE_HASH_CACHE_MIN_PERSISTED_SIZE = 1024 * 1024
+	"""Only hashes of files at least this large are saved to FILE_HASH_CACHE_PATH - smaller files are quick to hash again"""
+
+	VERIFY_THREADS = HASH_THREADS
+	"""The number of files hashed at the same time when verifying installed files (see REPAIR_VERIFY_WITH_MANIFEST)"""
+
+	FAST_DIRECTORY_MOVE = not IS_WINDOWS
+	"""If True, extracted files are moved into the game folder by renaming whole folders where possible (see directoryMover.py).
+	Not used on Windows, which can't rename over existing files."""
+
+	DIRECTORY_MOVE_THREADS = 4
+	"""The number of top-level folders which are merged into the game folder at the same time (see FAST_DIRECTORY_MOVE)"""
+
+	LIBRARY_UPDATE_PLANNER_THREADS = 4
+	"""The number of game installs whose update status is checked at the same time (see libraryUpdatePlanner.py)"""
+
+	RESUME_INSTALLS_WITH_JOURNAL = True
+	"""If True, each step of an install is recorded as it completes, so a stopped install can be continued from the last
+	completed step by running the same install again (see installJournal.py)"""
+
+	CHECKPOINT_INSTALLED_FILE_VERSIONS = True
+	"""If True, mod files are removed from the local version file when an install starts, and added back as soon as each
+	one has been extracted into the game folder, so a stopped install only re-installs the files which didn't finish
+	(see fileVersionManagement.VersionManager.saveVersionCheckpoint())"""
+
+	USE_PROCESS_SUPERVISOR = True
+	"""If True, child processes (aria2c, 7z) are run on a shared asyncio event loop on Python 3.8+, rather than with
+	one thread per output pipe. See processSupervisor.py and runProcessOutputToTempFile()."""
 
 	PERMISSON_DENIED_ERROR_MESSAGE = "Permission error: See our installer wiki FAQ about this error at https://07th-mod.com/wiki/Installer/faq/#extraction-stage-fails-i-get-an-acess-denied-error-when-overwriting-files"
 
@@ -418,6 +534,33 @@ You can try manually running [{}] once so the installer can use the file.""".for
 			print("Developer ERROR: Failed to read URL File Size Lookup Table")
 			traceback.print_exc()
 
+	@staticmethod
+	def loadDownloadChecksums(modList):
+		"""
+		Fill in Globals.URL_SHA256_LOOKUP_TABLE from the (optional) 'sha256' field of each file, file override and
+		downloadAndExtract mod option in installData.json. Downloads with a known checksum are verified while they are
+		downloaded, instead of by testing the archive with 7z afterwards.
+
+		:param modList: The JSON object returned by common.getModList()
+		"""
+		urlToSHA256 = {}
+		try:
+			for mod in modList:
+				for subMod in mod['submods']:
+					subModConfig = installConfiguration.SubModConfig(mod, subMod)
+					for file in subModConfig.files + subModConfig.fileOverrides:
+						if file.url is not None and file.sha256 is not None:
+							urlToSHA256[file.url] = file.sha256.lower()
+
+					for option in subModConfig.modOptions:
+						if option.type == 'downloadAndExtract' and option.data is not None and option.data.get('sha256') is not None:
+							urlToSHA256[option.data['url']] = option.data['sha256'].lower()
+		except Exception:
+			print("ERROR: Failed to read download checksums - downloads will be verified with 7z instead")
+			traceback.print_exc()
+
+		Globals.URL_SHA256_LOOKUP_TABLE = urlToSHA256
+
 	@staticmethod
 	def getBuildInfo():
 		if Globals.DEVELOPER_MODE:
@@ -534,89 +677,208 @@ def trySystemOpen(path, normalizePath=False):
 def openURLInBrowser(url):
 	webbrowser.open(url, new=2, autoraise=True)
 
-#TODO: capture both stdout and stderr
+class ProcessOutputSplitter:
+	"""
+	Splits the raw output of a process into lines, for runProcessOutputToTempFile().
+
+	Output is fed in as chunks of bytes (of any size), and is decoded with an incremental UTF-8 decoder, so multi-byte
+	characters which are split between two chunks are decoded correctly.
+	A line is emitted at each newline, and also after each ']' char in ariaMode and each '%' char in sevenZipMode
+	(a newline is appended to these lines). '\r' chars are replaced with spaces.
+	"""
+	def __init__(self, ariaMode=False, sevenZipMode=False):
+		# type: (bool, bool) -> None
+		delimiters = '\n'
+		if ariaMode:
+			delimiters += '\\]'
+		if sevenZipMode:
+			delimiters += '%'
+
+		# On Python 2, output is passed through as a byte string (like the rest of the installer), so str() is used
+		# below to give native string literals on both Python 2 and 3
+		self.decoder = None if Globals.IS_PYTHON_2 else codecs.getincrementaldecoder('utf-8')(errors='replace')
+		self.pending = str('')
+
+		# Matches each complete line, including its delimiter
+		self.lineRegex = re.compile(str('[^{0}]*[{0}]'.format(delimiters)))
+
+	def feed(self, data):
+		# type: (bytes) -> List[Tuple[str, bool]]
+		"""
+		:param data: The next chunk of output from the process
+		:return: A list of (line, endsWithNewline) for each line completed by this chunk
+		"""
+		text = data if self.decoder is None else self.decoder.decode(data)
+		return self._split(text, final=False)
+
+	def finish(self):
+		# type: () -> List[Tuple[str, bool]]
+		"""Call once the process has exited, to get any remaining output which didn't end with a delimiter (a newline is appended)"""
+		text = str('') if self.decoder is None else self.decoder.decode(b'', final=True)
+		return self._split(text, final=True)
+
+	def _split(self, text, final):
+		text = self.pending + text.replace(str('\r'), str(' '))
+
+		lines = []
+		end = 0
+		for match in self.lineRegex.finditer(text):
+			line = match.group(0)
+			end = match.end()
+			if line.endswith(str('\n')):
+				lines.append((line, True))
+			else:
+				lines.append((line + str('\n'), False))
+
+		self.pending = text[end:]
+		if final and self.pending:
+			lines.append((self.pending + str('\n'), True))
+			self.pending = str('')
+
+		return lines
+
+def outputProcessLines(lines, lineMonitor=None):
+	# type: (List[Tuple[str, bool]], Any) -> None
+	"""
+	Print the lines returned by ProcessOutputSplitter, and pass them to lineMonitor.process() (if given).
+	Lines split at a ']' or '%' char are aria2c/7z progress ticks, so are sent to the GUI as progress events.
+	"""
+	for line, endsWithNewline in lines:
+		if endsWithNewline:
+			print(line, end='')
+		else:
+			progressEvents.printProgressLine(line.lstrip())
+
+		if lineMonitor:
+			lineMonitor.process(line)
+
 # TODO: in the future, this function could be simplified (remove aria2c specific hacks) by:
 # - using --summary-interval=5 for aria2c to force the long summary to be printed more often (which gives a newline)
 # - OR running aria2c in RPC mode
 # 7z would also need to be checked on all platforms as working correctly.
 # lineMonitor must be an object with a "process(line)" function, which will be called at each newline, %, or ']' char
 # It can be used to monitor the output of the process being run.
-def runProcessOutputToTempFile(arguments, ariaMode=False, sevenZipMode=False, lineMonitor=None):
-	print("----- BEGIN EXECUTING COMMAND: [{}] -----".format(" ".join(arguments)))
+class RunningProcesses:
+	"""
+	Keeps track of processes started by runProcessOutputToTempFile(), so that they can be stopped from another thread
+	(for example, to stop downloads which are no longer needed). Once cancelAll() has been called, any process which is
+	started afterwards is stopped straight away.
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.cancelled = False
+		self.stopFunctions = set()
+
+	def add(self, stopFunction):
+		# type: (Callable[[], Any]) -> None
+		with self.lock:
+			if not self.cancelled:
+				self.stopFunctions.add(stopFunction)
+				return
 
-	# need universal_newlines=True so stdout is opened in normal. However, this might result in garbled japanese(unicode) characters!
-	# to fix this properly, you would need to make a custom class which takes in raw bytes using stdout.read(10)
-	# and then periodically convert newline delimited sections of the text to utf-8 (or whatever encoding), and catch bad encoding errors
-	# See comments on https://stackoverflow.com/a/15374326/848627 and answer https://stackoverflow.com/a/48880977/848627
-	# drojf: Removed universal_newlines, to fix issues with non-windows locales breaking this part of the installer
-	# see https://stackoverflow.com/questions/38181494/what-is-the-difference-between-using-universal-newlines-true-with-bufsize-1-an?rq=1
-	# The default bufsize works fine on Windows (seems to be line buffered, or maybe the flush() works as expected on Windows)
-	proc = subprocess.Popen(arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		RunningProcesses._tryStop(stopFunction)
 
-	def readUntilEOF(proc, fileLikeObject):
-		stringBuffer = []
-		while proc.poll() is None:
-			try:
-				fileLikeObject.flush()
-				while True:
-					if Globals.IS_PYTHON_2:
-						character = fileLikeObject.read(1)
-					else:
-						character = fileLikeObject.read(1).decode(encoding='utf-8', errors='replace')
+	def remove(self, stopFunction):
+		# type: (Callable[[], Any]) -> None
+		with self.lock:
+			self.stopFunctions.discard(stopFunction)
 
-					if character:
-						if character == '\r':
-							character = ' '
+	def cancelAll(self):
+		with self.lock:
+			self.cancelled = True
+			stopFunctions = list(self.stopFunctions)
 
-						stringBuffer.append(character)
+		for stopFunction in stopFunctions:
+			RunningProcesses._tryStop(stopFunction)
 
-						writeOutBuffer = False
-						writeOutCausedByNewline = False
+	@staticmethod
+	def _tryStop(stopFunction):
+		try:
+			stopFunction()
+		except OSError:
+			# The process has already exited
+			pass
+
+def runProcessOutputToTempFile(arguments, ariaMode=False, sevenZipMode=False, lineMonitor=None, runningProcesses=None):
+	"""
+	:param runningProcesses: If provided, the process is added to this RunningProcesses while it runs, so it can be stopped
+	from another thread. A stopped process returns a non-zero return code.
+	"""
+	print("----- BEGIN EXECUTING COMMAND: [{}] -----".format(" ".join(arguments)))
 
-						# Write out buffer if newline detected
-						if character == '\n':
-							writeOutBuffer = True
-							writeOutCausedByNewline = True
+	# On Python 3.8+, run the process on the shared asyncio event loop, so that concurrent downloads and extractions
+	# don't need two threads per process to read their output
+	if Globals.USE_PROCESS_SUPERVISOR and not Globals.IS_PYTHON_2:
+		import concurrent.futures
+		import processSupervisor
+		supervisor = processSupervisor.getSharedProcessSupervisor()
+		if supervisor is not None:
+			future = supervisor.submit(arguments, ariaMode=ariaMode, sevenZipMode=sevenZipMode, lineMonitor=lineMonitor)
+			if runningProcesses is not None:
+				runningProcesses.add(future.cancel)
+			try:
+				returnCode = future.result()
+			except concurrent.futures.CancelledError:
+				print("Process was stopped")
+				returnCode = 1
+			finally:
+				if runningProcesses is not None:
+					runningProcesses.remove(future.cancel)
+			print("--------------- EXECUTION FINISHED ---------------\n")
+			return returnCode
+
+	# drojf: Removed universal_newlines, to fix issues with non-windows locales breaking this part of the installer
+	# see https://stackoverflow.com/questions/38181494/what-is-the-difference-between-using-universal-newlines-true-with-bufsize-1-an?rq=1
+	# Instead, the raw bytes are read and decoded by ProcessOutputSplitter, which handles bad encoding and
+	# characters split between reads. See comments on https://stackoverflow.com/a/15374326/848627
+	proc = subprocess.Popen(arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	if runningProcesses is not None:
+		runningProcesses.add(proc.kill)
 
-						# Insert newline after ']' characters
-						if ariaMode and character == ']':
-							stringBuffer.append('\n')
-							writeOutBuffer = True
+	# Both streams call print()/lineMonitor.process(), so only let one stream output a line at a time
+	outputLock = threading.Lock()
 
-						# Insert newline after % characters
-						if sevenZipMode and character == '%':
-							stringBuffer.append('\n')
-							writeOutBuffer = True
+	def readUntilEOF(proc, fileLikeObject):
+		splitter = ProcessOutputSplitter(ariaMode=ariaMode, sevenZipMode=sevenZipMode)
+		fd = fileLikeObject.fileno()
 
-						if writeOutBuffer:
-							line = ''.join(stringBuffer)
+		def outputLines(lines):
+			with outputLock:
+				outputProcessLines(lines, lineMonitor)
 
-							if writeOutCausedByNewline:
-								print(line, end='')
-							else:
-								print(line.lstrip(), end='')
+		while True:
+			try:
+				# os.read() returns as soon as any output is available (up to the given size), so progress
+				# updates are still shown immediately, but large amounts of output are processed in big chunks
+				data = os.read(fd, 65536)
+				if not data:
+					break
 
-							if lineMonitor:
-								lineMonitor.process(line)
-							stringBuffer = []
-					else:
-						break
+				outputLines(splitter.feed(data))
 			except Exception as e:
 				#reduce cpu usage if some exception is continously thrown
 				print("Error in [runProcessOutputToTempFile()]: {}".format(traceback.format_exc()))
+				if proc.poll() is not None:
+					break
 				time.sleep(.1)
 
+		outputLines(splitter.finish())
+
 	# Monitor stderr on one thread, and monitor stdout on main thread
 	t = threading.Thread(target=readUntilEOF, args=(proc, proc.stderr))
 	t.start()
 
 	readUntilEOF(proc, proc.stdout)
+	t.join()
+	proc.wait()
+	if runningProcesses is not None:
+		runningProcesses.remove(proc.kill)
 
 	print("--------------- EXECUTION FINISHED ---------------\n")
 	return proc.returncode
 
 #when calling this function, use named arguments to avoid confusion!
-def aria(downloadDir=None, inputFile=None, url=None, followMetaLink=False, useIPV6=False, outputFile=None):
+def aria(downloadDir=None, inputFile=None, url=None, followMetaLink=False, useIPV6=False, outputFile=None, numConnections=1, sha256=None, runningProcesses=None, lineMonitor=None):
 	"""
 	Calls aria2c with some default arguments:
 
@@ -628,6 +890,10 @@ def aria(downloadDir=None, inputFile=None, url=None, followMetaLink=False, useIP
 	:param downloadDir: The directory to store the downloaded file(s)
 	:param inputFile: The path to a file containing multiple URLS to download (see aria2c documentation)
 	:param outputFile: When downloading a single file, if this is specified, it will be downloaded with the given name
+	:param numConnections: If more than 1, each file is split into segments which are downloaded over this many connections at once
+	:param sha256: If specified, aria2c will check the downloaded file has this SHA-256 hex digest, and fail if it doesn't
+	:param runningProcesses: If provided, the aria2c process is added to this RunningProcesses, so the download can be stopped
+	:param lineMonitor: If provided, each line of aria2c's output is passed to lineMonitor.process() (see runProcessOutputToTempFile())
 	:return Returns the exit code of the aria2c call
 	"""
 	arguments = [
@@ -636,8 +902,8 @@ def aria(downloadDir=None, inputFile=None, url=None, followMetaLink=False, useIP
 		'--continue=true', # Allow continuing the download of a partially downloaded file (is this flag actually necessary?)
 		'--retry-wait=5',  # Seconds to wait between retries
 		'-m 0', # max number of retries (0=unlimited). In some cases, like server rejects download, aria2c won't retry.
-		'-x 1', # max connections to the same server
-		'-s 8', # how many mirrors to use to download each file - currently we only have one download source though
+		'-x {}'.format(numConnections), # max connections to the same server
+		'-s {}'.format(max(8, numConnections)), # how many connections/mirrors to use to download each file - limited by '-x' as we only have one download source
 		'-j 1', # how many files to download at the same time (eg number of separate urls which can be downloaded in parallel)
 		'--auto-file-renaming=false',
 		# By default, if aria2c detects a file already exists with the same name, and is different size to the file
@@ -654,6 +920,11 @@ def aria(downloadDir=None, inputFile=None, url=None, followMetaLink=False, useIP
 	else:
 		arguments.append('--follow-metalink=false')
 
+	if sha256:
+		# aria2c checks the file against the checksum once the download completes. --check-integrity is not used, as it
+		# would also hash the existing file before the download starts, and can't resume a partial download without piece hashes.
+		arguments.append('--checksum=sha-256=' + sha256)
+
 	if not useIPV6:
 		arguments.append('--disable-ipv6=true')
 
@@ -681,7 +952,7 @@ def aria(downloadDir=None, inputFile=None, url=None, followMetaLink=False, useIP
 
 	# with open('seven_zip_stdout.txt', "w", buffering=100) as outfile:
 	# 	return subprocess.call(arguments, stdout=outfile)
-	return runProcessOutputToTempFile(arguments, ariaMode=True)
+	return runProcessOutputToTempFile(arguments, ariaMode=True, lineMonitor=lineMonitor, runningProcesses=runningProcesses)
 
 
 class SevenZipMonitor:
@@ -726,7 +997,7 @@ class SevenZipMonitor:
 
 		return '\n'.join(errors)
 
-def sevenZipExtract(archive_path, outputDir=None, lineMonitor=None):
+def sevenZipExtract(archive_path, outputDir=None, lineMonitor=None, excludedMembers=None):
 	arguments = [Globals.SEVEN_ZIP_EXECUTABLE,
 				 "x",
 				 archive_path,
@@ -738,7 +1009,23 @@ def sevenZipExtract(archive_path, outputDir=None, lineMonitor=None):
 
 	if outputDir:
 		arguments.append('-o' + outputDir)
-	return runProcessOutputToTempFile(arguments, sevenZipMode=True, lineMonitor=lineMonitor)
+
+	# 7z treats '*' and '?' as wildcards in exclusions, so just extract any file with those in its name
+	excludedMembers = [x for x in (excludedMembers or []) if '*' not in x and '?' not in x]
+	excludeListPath = None
+	if excludedMembers:
+		with tempfile.NamedTemporaryFile(mode='wb', suffix='.txt', delete=False) as excludeListFile:
+			excludeListFile.write('\n'.join(excludedMembers).encode('utf-8'))
+			excludeListPath = excludeListFile.name
+		print("Skipping {} files in [{}] which don't need to be extracted".format(len(excludedMembers), archive_path))
+		arguments.append('-scsUTF-8')  # the exclude list file is UTF-8
+		arguments.append('-xr-@' + excludeListPath)  # exclude the listed paths (matched from the archive root)
+
+	try:
+		return runProcessOutputToTempFile(arguments, sevenZipMode=True, lineMonitor=lineMonitor)
+	finally:
+		if excludeListPath is not None:
+			os.remove(excludeListPath)
 
 def sevenZipTest(archive_path):
 	"""
@@ -853,9 +1140,13 @@ def makeExecutable(executablePath):
 	os.chmod(executablePath, current.st_mode | 0o111)
 
 def getMetalinkFilenames(url):
+	return parseMetalinkFilenames(downloadFile(url, is_text=True))
+
+def parseMetalinkFilenames(metalinkText):
+	# type: (str) -> List[Tuple[str, int, Optional[str]]]
 	import xml.etree.ElementTree as ET
 
-	root = ET.fromstring(downloadFile(url, is_text=True))
+	root = ET.fromstring(metalinkText)
 
 	def getTagNoNamespace(tag):
 		return tag.split('}')[-1]
@@ -890,21 +1181,39 @@ class SevenZipException(Exception):
 # Split archives are usually something like 'test.7z.001', 'test.7z.002' or 'test.zip.013'
 split_file_regex = re.compile(r'\.(\d+)$')
 
-def extractOrCopyFile(filename, sourceFolder, destinationFolder, copiedOutputFileName=None):
+def isArchiveFilename(filename):
+	# type: (str) -> bool
+	return '.7z' in filename.lower() or '.zip' in filename.lower()
+
+def getSplitArchiveNumber(filename):
+	# type: (str) -> Optional[int]
+	""":return: The part number of a split archive (eg. 2 for 'test.7z.002'), or None if not a split archive"""
+	split_extension = split_file_regex.search(filename.lower())
+	if split_extension:
+		return int(split_extension.group(1))
+	return None
+
+def extractOrCopyFile(filename, sourceFolder, destinationFolder, copiedOutputFileName=None, excludedMembers=None):
+	# type: (str, str, str, Optional[str], Optional[Set[str]]) -> None
+	"""
+	:param excludedMembers: If given, these files are not extracted from the archive (see extractionPlanner.py)
+	"""
 	makeDirsExistOK(destinationFolder)
 	sourcePath = os.path.join(sourceFolder, filename)
 
-	if '.7z' in filename.lower() or '.zip' in filename.lower():
-		split_extension = split_file_regex.search(filename.lower())
-		if split_extension:
-			split_archive_number = int(split_extension.group(1))
-			# Assume archive numbers start at 1
-			# Only process split archives where the index is '1', ignore all others as they will be processed automatically
-			if split_archive_number != 1:
-				return
+	if isArchiveFilename(filename):
+		split_archive_number = getSplitArchiveNumber(filename)
+		# Assume archive numbers start at 1
+		# Only process split archives where the index is '1', ignore all others as they will be processed automatically
+		if split_archive_number is not None and split_archive_number != 1:
+			return
+
+		if Globals.EXTRACT_ZIPS_IN_PROCESS and zipExtractor.canExtractInProcess(sourcePath):
+			zipExtractor.extractZip(sourcePath, destinationFolder, excludedMembers=excludedMembers)
+			return
 
 		monitor = SevenZipMonitor()
-		if sevenZipExtract(sourcePath, outputDir=destinationFolder, lineMonitor=monitor) != 0:
+		if sevenZipExtract(sourcePath, outputDir=destinationFolder, lineMonitor=monitor, excludedMembers=excludedMembers) != 0:
 			raise SevenZipException("{}\n\n Could not extract [{}]".format(monitor.getErrorMessage(), sourcePath))
 	else:
 		try:
@@ -945,7 +1254,7 @@ class DownloaderAndExtractor:
 	#
 	# Downloads and/or Extracts a list of ModFile objects
 	#
-	# Usage: Call 'download' then 'extract'.
+	# Usage: Call 'download' then 'extract', or call 'downloadAndExtract' to extract while downloading
 	# If you have metalinks in your path, callin only 'extract' may require fetching the metafiles to determine what
 	# to extract
 	#
@@ -968,6 +1277,10 @@ class DownloaderAndExtractor:
 	# Folder Creation:
 	# - All folders will be created if they don't already exist
 	#
+	# Concurrent Downloads:
+	# - Up to 'maxConcurrentDownloads' URLs are downloaded at the same time (one aria2c process per URL)
+	# - Download order does not affect extraction order, which is always determined by the list ordering
+	#
 	# Failure Modes:
 	# - if any downloads or extractions fail, the script will terminate
 	# - TODO: could improve success rate by retrying aria downloads multiple times
@@ -981,15 +1294,29 @@ class DownloaderAndExtractor:
 	"""
 	MAX_DOWNLOAD_ATTEMPTS_METALINK = 10
 	MAX_DOWNLOAD_ATTEMPTS = 3
+	# How often the overall download progress is written to the log, while downloading
+	DOWNLOAD_PROGRESS_STATUS_INTERVAL_SECONDS = 2
+
+	# The download store shared by all installs. Use getDownloadStore() to access it.
+	sharedDownloadStore = None  # type: Optional[downloadStore.DownloadStore]
+	sharedDownloadStoreLock = threading.Lock()
+
+	# The on-disk url metadata cache, shared by all DownloaderAndExtractors. Use getURLMetadataCache() to access it.
+	sharedURLMetadataCache = None  # type: Optional[urlMetadataCache.URLMetadataCache]
+	sharedURLMetadataCacheLock = threading.Lock()
 
 	class ExtractableItem:
-		def __init__(self, filename, length, destinationPath, fromMetaLink, remoteLastModified, fileURL=None):
+		def __init__(self, filename, length, destinationPath, fromMetaLink, remoteLastModified, fileURL=None, sha256=None):
 			self.filename = filename
 			self.length = length
 			self.destinationPath = os.path.normpath(destinationPath)
 			self.fromMetaLink = fromMetaLink
 			self.remoteLastModified = remoteLastModified
 			self.fileURL = fileURL
+			# If not None, the download engine verifies the file against this checksum as it is downloaded
+			self.sha256 = sha256 # type: Optional[str]
+			# The ModFile id (or mod option name) this item came from - see addItemsManually()
+			self.sourceID = None # type: Optional[str]
 
 		def __repr__(self):
 			return '[{} ({})] to [{}] {}'.format(self.filename, prettyPrintFileSize(self.length), self.destinationPath, "(metalink)" if self.fromMetaLink else "")
@@ -1050,11 +1377,14 @@ class DownloaderAndExtractor:
 					os.remove(oldDownloadPath)
 				if os.path.exists(oldDownloadPath + ".aria2"):
 					os.remove(oldDownloadPath + ".aria2")
+				# Control file used by the python download engine for segmented downloads
+				if os.path.exists(oldDownloadPath + ".segments"):
+					os.remove(oldDownloadPath + ".segments")
 			except Exception as e:
 				print("ExtractableItem: Failed to delete {}: {}".format(oldDownloadPath, e))
 
-	def __init__(self, modFileList, downloadTempDir, extractionDir, downloadProgressAmount=45, extractionProgressAmount=45, supressDownloadStatus=False, skipDownload=False):
-		# type: (List[installConfiguration.ModFile], str, str, int, int, bool, bool) -> None
+	def __init__(self, modFileList, downloadTempDir, extractionDir, downloadProgressAmount=45, extractionProgressAmount=45, supressDownloadStatus=False, skipDownload=False, maxConcurrentDownloads=None, segmentedDownloads=False):
+		# type: (List[installConfiguration.ModFile], str, str, int, int, bool, bool, Optional[int], bool) -> None
 		self.modFileList = modFileList
 		self.downloadTempDir = downloadTempDir
 		self.defaultExtractionDir = extractionDir
@@ -1073,6 +1403,36 @@ class DownloaderAndExtractor:
 
 		self.skipDownload = skipDownload
 
+		# How many URLs to download at the same time. Defaults to Globals.MAX_CONCURRENT_DOWNLOADS
+		self.maxConcurrentDownloads = Globals.MAX_CONCURRENT_DOWNLOADS if maxConcurrentDownloads is None else maxConcurrentDownloads
+
+		# If True, large files are downloaded over several connections at once (see Globals.SEGMENTED_DOWNLOAD_MIN_SIZE)
+		self.segmentedDownloads = segmentedDownloads
+
+		# Only set while download() is running, if the aria2c RPC download engine is selected
+		self.ariaRPCDownloader = None
+		# Only set while download() is running, if the python download engine is selected
+		self.httpDownloader = None
+		# The aria2c processes started by download(), if the aria2c download engine is selected
+		self.runningDownloadProcesses = RunningProcesses()
+
+		# Used to calculate the overall progress percentage. downloadProgress is set once downloading starts.
+		self.downloadProgress = None  # type: Optional[DownloaderAndExtractor._DownloadProgress]
+		self.numExtracted = 0
+
+		# The files written by extract(), with paths relative to extractionDir. See installManifest.py
+		self.installedFiles = installManifest.InstallManifest()
+
+		# If set, downloads and extractions are recorded in the journal as they complete, and any which were already
+		# completed by a previous (stopped) install with the same plan are skipped. See installJournal.py
+		self.journal = None  # type: Optional[installJournal.InstallJournal]
+
+		# If set, called with the sourceID (see addItemsManually()) of each ModFile/mod option once all its items have
+		# been extracted (or skipped)
+		self.onSourceExtracted = None  # type: Optional[Callable[[Optional[str]], None]]
+		# Sources whose items have all been extracted, but which are waiting on later items (see _finishItem())
+		self.sourcesAwaitingOverrides = []  # type: List[Optional[str]]
+
 	def buildDownloadAndExtractionList(self):
 		#type: () -> None
 		"""
@@ -1082,12 +1442,18 @@ class DownloaderAndExtractor:
 		"""
 		if not self.suppressDownloadStatus:
 			commandLineParser.printSeventhModStatusUpdate(1, "Querying URLs to be Downloaded")
-		for i, file in enumerate(self.modFileList):
+
+		urlsAndExtractionDirs = []
+		sourceIDs = []
+		for file in self.modFileList:
 			extractionDir = self.defaultExtractionDir
 			if file.relativeExtractionPath is not None:
 				extractionDir = os.path.join(self.defaultExtractionDir, file.relativeExtractionPath)
 
-			self.addItemManually(file.url, extractionDir)
+			urlsAndExtractionDirs.append((file.url, extractionDir))
+			sourceIDs.append(file.id)
+
+		self.addItemsManually(urlsAndExtractionDirs, sourceIDs)
 
 		self.downloadAndExtractionListsBuilt = True
 
@@ -1102,45 +1468,325 @@ class DownloaderAndExtractor:
 		if self.skipDownload:
 			return
 
+		self._downloadAll()
+
+	def _downloadAll(self, onDownloadCompleted=None):
+		# type: (Optional[Callable[[int], None]]) -> None
+		"""
+		Downloads every url in self.downloadList, raising DownloadAndVerifyError if any url fails to download.
+		:param onDownloadCompleted: If provided, called (from a download thread) with the index of each url in
+		self.downloadList as soon as it has been downloaded and verified
+		"""
 		# check if any downloads have been modified on the server - if so, delete the local downloads
 		for extractableItem in self.extractList:
 			extractableItem.clearDownloadIfNeededAndWriteControlFile(self.downloadTempDir)
 
 		totalDownloadSize = self.totalDownloadSize()
-		for i, url in enumerate(self.downloadList):
+		numDownloads = len(self.downloadList)
+		downloadSizes = [sum(max(0, x.length) for x in extractables) for extractables in self.extractablesForEachDownload]
+		progress = DownloaderAndExtractor._DownloadProgress(downloadSizes, onDownloadCompleted)
+		self.downloadProgress = progress
+		self.runningDownloadProcesses = RunningProcesses()
+		downloadStore = DownloaderAndExtractor.getDownloadStore()
+
+		def downloadWithRetries(i):
+			url = self.downloadList[i]
 			extractables = self.extractablesForEachDownload[i]
 			attempt = 0
 			max_attempts = DownloaderAndExtractor.MAX_DOWNLOAD_ATTEMPTS
 			if DownloaderAndExtractor.__urlIsMetalink(url):
 				max_attempts = DownloaderAndExtractor.MAX_DOWNLOAD_ATTEMPTS_METALINK
 
+			numConnections = self._numConnectionsForDownload(extractables)
+
+			# Only plain urls (which always have exactly one extractable) can have a checksum
+			sha256 = None
+			if len(extractables) == 1 and not extractables[0].fromMetaLink:
+				sha256 = extractables[0].sha256
+
+			# Skip the download if it was already downloaded and verified by a previous (stopped) install
+			if self._downloadIsJournaled(url, extractables):
+				print("Skipping download of [{}] as it was downloaded by the previous install".format(url))
+				progress.markCompleted(i)
+				return
+
+			# Skip the download if all files were already downloaded by a previous install
+			if downloadStore is not None and all([downloadStore.fetch(x, self.downloadTempDir) for x in extractables]):
+				self._journalDownload(url, extractables)
+				progress.markCompleted(i)
+				return
+
 			for attempt in range(max_attempts):
-				overallPercentage = int(i*self.downloadProgressAmount/len(self.downloadList))
+				# Don't start any new attempts if another download has already failed
+				if progress.failed():
+					return
+
 				if not self.suppressDownloadStatus:
-					commandLineParser.printSeventhModStatusUpdate(overallPercentage, "Downloading: {} (total) DL Folder: [{}] URL: [{}] (Attempt: {}/{})"
-					                                          .format(prettyPrintFileSize(totalDownloadSize), self.downloadTempDir, url, attempt + 1, max_attempts))
-				if aria(self.downloadTempDir, url=url, followMetaLink=DownloaderAndExtractor.__urlIsMetalink(url)) != 0:
+					commandLineParser.printSeventhModStatusUpdate(self._overallPercentage(), "Downloading: {} (total) [{}/{} complete] DL Folder: [{}] URL: [{}] (Attempt: {}/{}){}"
+					                                          .format(prettyPrintFileSize(totalDownloadSize), progress.numCompleted(), numDownloads, self.downloadTempDir, url, attempt + 1, max_attempts,
+					                                                  " (Segmented: {} connections)".format(numConnections) if numConnections > 1 else ""))
+				if self._downloadURL(url, followMetaLink=DownloaderAndExtractor.__urlIsMetalink(url), numConnections=numConnections, sha256=sha256,
+				                     lineMonitor=DownloaderAndExtractor._DownloadLineMonitor(self, i)) != 0:
+					# The download may have failed because it was cancelled
+					if progress.failed():
+						return
+
 					print("ERROR - failed to download [{}]. Trying again in 3 seconds...".format(url))
-					time.sleep(3)
+					if attempt + 1 < max_attempts:
+						time.sleep(3)
 					continue
 
 				# If all extractables were valid, then we are finished with this download item
 				# and can move on to the next one
 				if not self.extractablesHasInvalidArchives(extractables):
-					break
+					if downloadStore is not None:
+						for extractableItem in extractables:
+							downloadStore.add(extractableItem, self.downloadTempDir)
+
+					self._journalDownload(url, extractables)
+					progress.markCompleted(i)
+					return
 			else:
 				# Too many attempts
-				raise DownloadAndVerifyError("ERROR - Failed to download [{}] after {} attempts. Check aria2/7z in log for details. Installation Stopped".format(url, attempt + 1))
+				error = DownloadAndVerifyError("ERROR - Failed to download [{}] after {} attempts. Check aria2/7z in log for details. Installation Stopped".format(url, attempt + 1))
+				progress.markFailed(error)
+				raise error
+
+		maxConcurrentDownloads = max(1, min(self.maxConcurrentDownloads, numDownloads))
+		print("Downloading {} URLs, {} at a time using {}".format(numDownloads, maxConcurrentDownloads, Globals.DOWNLOAD_ENGINE))
+
+		if Globals.DOWNLOAD_ENGINE == Globals.DOWNLOAD_ENGINE_ARIA2C_RPC:
+			import ariaRPC
+			self.ariaRPCDownloader = ariaRPC.AriaRPCDownloader(self.downloadTempDir, maxConcurrentDownloads=maxConcurrentDownloads)
+			self.ariaRPCDownloader.start()
+		elif Globals.DOWNLOAD_ENGINE == Globals.DOWNLOAD_ENGINE_PYTHON:
+			import httpDownloader
+			self.httpDownloader = httpDownloader.HTTPDownloader(self.downloadTempDir)
+
+		def downloadOrStop(i):
+			# The first error is recorded in progress (and raised below), and stops any downloads which haven't started
+			try:
+				downloadWithRetries(i)
+			except DownloadAndVerifyError:
+				pass
+
+		try:
+			parallelMap(downloadOrStop, range(numDownloads), maxConcurrentDownloads)
+		finally:
+			if self.ariaRPCDownloader is not None:
+				self.ariaRPCDownloader.shutdown()
+				self.ariaRPCDownloader = None
+			self.httpDownloader = None
+
+		progress.raiseIfFailed()
+
+	def _downloadIsJournaled(self, url, extractables):
+		# type: (str, List[DownloaderAndExtractor.ExtractableItem]) -> bool
+		"""
+		True if the journal shows the url was downloaded and verified, and its files are still the same size.
+		Otherwise, the url's extractions are removed from the journal, as the files will be downloaded again.
+		"""
+		if self.journal is None:
+			return False
+
+		downloadedFiles = self.journal.getData(installJournal.downloadStep(url))
+		if downloadedFiles is not None and all(
+				os.path.isfile(os.path.join(self.downloadTempDir, filename)) and os.path.getsize(os.path.join(self.downloadTempDir, filename)) == size
+				for filename, size in downloadedFiles):
+			return True
+
+		self.journal.forget([installJournal.downloadStep(url)] + [installJournal.extractStep(x) for x in extractables])
+		return False
+
+	def _journalDownload(self, url, extractables):
+		# type: (str, List[DownloaderAndExtractor.ExtractableItem]) -> None
+		if self.journal is None:
+			return
+
+		self.journal.markDone(installJournal.downloadStep(url),
+		                      [[x.filename, os.path.getsize(os.path.join(self.downloadTempDir, x.filename))] for x in extractables])
+
+	def _numConnectionsForDownload(self, extractables):
+		# type: (List[DownloaderAndExtractor.ExtractableItem]) -> int
+		"""Large files are downloaded over several connections at once, if segmented downloads are enabled"""
+		if self.segmentedDownloads and any(x.length >= Globals.SEGMENTED_DOWNLOAD_MIN_SIZE for x in extractables):
+			return Globals.SEGMENTED_DOWNLOAD_CONNECTIONS
+
+		return 1
+
+	def _downloadURL(self, url, followMetaLink, numConnections=1, sha256=None, lineMonitor=None):
+		# type: (str, bool, int, Optional[str], Optional[DownloaderAndExtractor._DownloadLineMonitor]) -> int
+		"""
+		Downloads a single url (or all the files in a metalink) to the download folder, using the selected download engine
+		:param numConnections: The maximum number of connections to use to download the file
+		:param sha256: If specified, the download fails unless the downloaded file has this SHA-256 hex digest
+		:param lineMonitor: If provided, the download's aria2c style status lines are passed to lineMonitor.process()
+		:return: 0 on success, otherwise a non-zero error code
+		"""
+		statusCallback = None if lineMonitor is None else lineMonitor.printAndProcess
+
+		if self.ariaRPCDownloader is not None:
+			return self.ariaRPCDownloader.download(url, followMetaLink=followMetaLink, numConnections=numConnections, sha256=sha256, statusCallback=statusCallback)
+
+		if self.httpDownloader is not None:
+			return self.httpDownloader.download(url, followMetaLink=followMetaLink, numConnections=numConnections, sha256=sha256, statusCallback=statusCallback)
+
+		return aria(self.downloadTempDir, url=url, followMetaLink=followMetaLink, numConnections=numConnections, sha256=sha256,
+		            runningProcesses=self.runningDownloadProcesses, lineMonitor=lineMonitor)
+
+	def _publishDownloadProgress(self):
+		"""
+		Show the progress of all downloads combined, so that the progress bar doesn't jump between the status lines of
+		each download. The combined progress is sent to the GUI as the latest subtask progress every time any download
+		reports its progress, and the overall status is also updated every few seconds.
+		"""
+		progress = self.downloadProgress
+		if progress is None or self.suppressDownloadStatus:
+			return
+
+		completedBytes, totalBytes = progress.bytesCompleted()
+		description = "Downloading - {}/{} ({}/{} files complete)".format(
+			prettyPrintFileSize(completedBytes), prettyPrintFileSize(totalBytes), progress.numCompleted(), progress.numDownloads)
+
+		if progress.takeStatusTurn(DownloaderAndExtractor.DOWNLOAD_PROGRESS_STATUS_INTERVAL_SECONDS):
+			commandLineParser.printSeventhModStatusUpdate(self._overallPercentage(), description)
+
+		progressEvents.getEventBus().publishSubTaskProgress(int(progress.fractionCompleted() * 100), description)
+
+	class _DownloadLineMonitor:
+		"""Records the progress of one download from its aria2c style status lines (see runProcessOutputToTempFile())"""
+		def __init__(self, downloaderAndExtractor, downloadIndex):
+			# type: (DownloaderAndExtractor, int) -> None
+			self.downloaderAndExtractor = downloaderAndExtractor
+			self.downloadIndex = downloadIndex
+
+		def process(self, line):
+			# type: (str) -> None
+			status = commandLineParser.tryGetAriaStatusUpdate(line)
+			progress = self.downloaderAndExtractor.downloadProgress
+			if status is None or progress is None:
+				return
+
+			progress.setPercentCompleted(self.downloadIndex, status.percentCompleted)
+			self.downloaderAndExtractor._publishDownloadProgress()
+
+		def printAndProcess(self, line):
+			# type: (str) -> None
+			"""A statusCallback for the aria2c RPC and python download engines"""
+			progressEvents.printProgressLine(line)
+			self.process(line)
+
+	def _cancelDownloads(self, error):
+		# type: (BaseException) -> None
+		"""
+		Stop any more downloads from being started, and stop the downloads which are running. Partial downloads are
+		kept, so they can be resumed by the next install.
+		"""
+		if self.downloadProgress is not None:
+			self.downloadProgress.markFailed(error)
+
+		self.runningDownloadProcesses.cancelAll()
+
+		ariaRPCDownloader = self.ariaRPCDownloader
+		if ariaRPCDownloader is not None:
+			ariaRPCDownloader.cancelAll()
+
+		httpDownloader = self.httpDownloader
+		if httpDownloader is not None:
+			httpDownloader.cancel()
+
+	class _DownloadProgress:
+		"""
+		Thread-safe tracking of the number of completed downloads, how many bytes of each download have been downloaded,
+		and the first download error (if any)
+		"""
+		def __init__(self, downloadSizes, onDownloadCompleted=None):
+			# type: (List[int], Optional[Callable[[int], None]]) -> None
+			self.lock = threading.Lock()
+			self.numDownloads = len(downloadSizes)
+			self.downloadSizes = downloadSizes
+			self.downloadedBytes = [0] * len(downloadSizes)
+			self.completed = 0
+			self.completedIndices = set()
+			self.error = None  # type: Optional[Exception]
+			self.onDownloadCompleted = onDownloadCompleted
+			self.lastStatusTime = 0.0
+
+		def markCompleted(self, downloadIndex):
+			# type: (int) -> None
+			with self.lock:
+				self.completed += 1
+				self.completedIndices.add(downloadIndex)
+				self.downloadedBytes[downloadIndex] = self.downloadSizes[downloadIndex]
+
+			if self.onDownloadCompleted is not None:
+				self.onDownloadCompleted(downloadIndex)
+
+		def markFailed(self, error):
+			# type: (Exception) -> None
+			with self.lock:
+				if self.error is None:
+					self.error = error
+
+		def isCompleted(self, downloadIndex):
+			# type: (int) -> bool
+			with self.lock:
+				return downloadIndex in self.completedIndices
+
+		def failed(self):
+			with self.lock:
+				return self.error is not None
+
+		def numCompleted(self):
+			with self.lock:
+				return self.completed
+
+		def setPercentCompleted(self, downloadIndex, percentCompleted):
+			# type: (int, int) -> None
+			"""Record a download's progress. A download's progress never goes backwards (eg. when it is retried)."""
+			with self.lock:
+				downloadedBytes = self.downloadSizes[downloadIndex] * min(percentCompleted, 100) // 100
+				self.downloadedBytes[downloadIndex] = max(self.downloadedBytes[downloadIndex], downloadedBytes)
+
+		def bytesCompleted(self):
+			# type: () -> Tuple[int, int]
+			""":return: (the number of bytes downloaded so far, the total size of all downloads)"""
+			with self.lock:
+				return sum(self.downloadedBytes), sum(self.downloadSizes)
+
+		def fractionCompleted(self):
+			# type: () -> float
+			"""The fraction of bytes downloaded, or of downloads completed if the download sizes aren't known"""
+			with self.lock:
+				totalBytes = sum(self.downloadSizes)
+				if totalBytes > 0:
+					return float(sum(self.downloadedBytes)) / totalBytes
+				return float(self.completed) / self.numDownloads if self.numDownloads else 1.0
+
+		def takeStatusTurn(self, intervalSeconds):
+			# type: (float) -> bool
+			"""True at most once every intervalSeconds, so that only one download thread publishes the overall status"""
+			with self.lock:
+				now = time.time()
+				if now - self.lastStatusTime < intervalSeconds:
+					return False
+				self.lastStatusTime = now
+				return True
+
+		def raiseIfFailed(self):
+			if self.error is not None:
+				raise self.error
 
 	def extractablesHasInvalidArchives(self, extractables):
 		# type:(List[DownloaderAndExtractor.ExtractableItem]) -> Optional[bool]
 		"""
 		NOTE: this validation function won't check certain types of files, and just skip over them:
 		  - extractables from metalinks won't be checked as they should be guarenteed to download correctly
+		  - extractables with a sha256 were already checksummed by the download engine while they were downloaded
 		  - extractables which aren't archives don't have a method to be checked, so they will be skipped
 
-		If the file is a non-checksummed archive, test it to make sure it downloaded correctly.
-		If it did not download correctly, delete the file.
+		If the file is the wrong size, or is a non-checksummed archive which fails a 7z test, it did not download
+		correctly, so delete the file.
 
 		:param extractables:
 		:return: returns true if at least one input extractable is invalid
@@ -1152,22 +1798,56 @@ class DownloaderAndExtractor:
 			if extractableItem.fromMetaLink:
 				continue
 
-			# If the file doesn't look like an archive, skip it as we don't know how to validate it
-			_, extension = os.path.splitext(extractableItem.filename)
-			if extension not in ['.zip', '.7z']:
-				continue
-
-			# Use 7z to test if the archive is valid
 			extractableItemPath = os.path.join(self.downloadTempDir, extractableItem.filename)
-			if sevenZipTest(extractableItemPath) == 0:
-				continue
 
-			# Archive is not valid, so delete the item and flag that this set of files needs to be re-downloaded
+			# A size mismatch can be detected without reading the file. Only the checks below need a full read.
+			if extractableItem.length > 0 and os.path.isfile(extractableItemPath) and os.path.getsize(extractableItemPath) != extractableItem.length:
+				print("Downloaded file [{}] is {} bytes, but expected {} bytes".format(extractableItemPath, os.path.getsize(extractableItemPath), extractableItem.length))
+				# The file may have changed on the server since it was queried, so query it again before the next attempt
+				if extractableItem.fileURL is not None:
+					self._requeryItem(extractableItem)
+					atLeastOneInvalid = True
+					continue
+			else:
+				# If the item has a checksum, it was already verified during the download
+				if extractableItem.sha256 is not None:
+					continue
+
+				# If the file doesn't look like an archive, skip it as we don't know how to validate it
+				_, extension = os.path.splitext(extractableItem.filename)
+				if extension not in ['.zip', '.7z']:
+					continue
+
+				# Use 7z to test if the archive is valid
+				if sevenZipTest(extractableItemPath) == 0:
+					continue
+
+			# File is not valid, so delete the item and flag that this set of files needs to be re-downloaded
 			os.remove(extractableItemPath)
 			atLeastOneInvalid = True
 
 		return atLeastOneInvalid
 
+	def _requeryItem(self, extractableItem):
+		#type: (DownloaderAndExtractor.ExtractableItem) -> None
+		"""
+		Drop the cached metadata of an item's url and query it again, then clear the item's download (including any
+		partial download) so that the next attempt downloads the file from the start
+		"""
+		DownloaderAndExtractor.getURLMetadataCache().remove(extractableItem.fileURL)
+		try:
+			newItem, = DownloaderAndExtractor.getExtractableItem(extractableItem.fileURL, extractableItem.destinationPath)
+			print("Re-queried [{}]: size {} -> {}".format(extractableItem.fileURL, extractableItem.length, newItem.length))
+			extractableItem.length = newItem.length
+			extractableItem.remoteLastModified = newItem.remoteLastModified
+		except Exception:
+			print("Failed to re-query [{}]".format(extractableItem.fileURL))
+			traceback.print_exc()
+
+		extractableItem._tryDeleteOldDownloadAndAriaFile(self.downloadTempDir)
+		if extractableItem.remoteLastModified is not None:
+			extractableItem._updateLocalDateModified(os.path.join(self.downloadTempDir, extractableItem._dateModifiedControlFilename()))
+
 	def extract(self, remapPaths=lambda x,y: (x,y)):
 		#type: (Callable[[str, str], Tuple[str, str]]) -> None
 		"""
@@ -1191,16 +1871,198 @@ class DownloaderAndExtractor:
 			self.buildDownloadAndExtractionList()
 
 		# extract or copy all files from the download folder to the game directory
-		for i, extractableItem in enumerate(self.extractList):
-			overallPercentage = self.downloadProgressAmount + int(i*self.extractionProgressAmount/len(self.extractList))
-			commandLineParser.printSeventhModStatusUpdate(overallPercentage, "Extracting {}".format(extractableItem))
+		self.numExtracted = 0
+		self.sourcesAwaitingOverrides = []
+		planner = self._makeExtractionPlanner(remapPaths)
+		for itemIndex in range(len(self.extractList)):
+			self._extractItem(itemIndex, remapPaths, planner, range(itemIndex + 1, len(self.extractList)))
+
+	def downloadAndExtract(self, remapPaths=lambda x,y: (x,y), beforeExtraction=None):
+		#type: (Callable[[str, str], Tuple[str, str]], Optional[Callable[[], None]]) -> None
+		"""
+		Pipelined version of calling download() then extract().
+
+		Each download is extracted as soon as it (and all downloads before it) have finished downloading, while the
+		remaining urls continue downloading in the background. Items are still extracted in the same order as extract(),
+		so higher priority items still overwrite lower priority items.
+
+		If Globals.PIPELINE_DOWNLOAD_AND_EXTRACT is False, this just calls download() then extract().
 
-			destinationFolder, destinationFileName = remapPaths(extractableItem.destinationPath, extractableItem.filename)
+		:param remapPaths: See extract()
+		:param beforeExtraction: If provided, this function is called once, just before the first item is extracted.
+		Use it for any tasks which must happen after downloading starts, but before any files are extracted
+		(like backing up or deleting old files).
+		"""
+		if self.skipDownload or not Globals.PIPELINE_DOWNLOAD_AND_EXTRACT:
+			self.download()
+			if beforeExtraction is not None:
+				beforeExtraction()
+			self.extract(remapPaths)
+			return
+
+		if not self.downloadAndExtractionListsBuilt:
+			self.buildDownloadAndExtractionList()
+
+		makeDirsExistOK(self.downloadTempDir)
+		makeDirsExistOK(self.defaultExtractionDir)
+
+		self.downloadProgress = None
+		self.numExtracted = 0
+		self.sourcesAwaitingOverrides = []
+		downloadFinishedEvents = [threading.Event() for _ in self.downloadList]
+
+		def setAllEvents():
+			for event in downloadFinishedEvents:
+				event.set()
+
+		def downloadAllThenWakeExtractor():
+			try:
+				self._downloadAll(onDownloadCompleted=lambda i: downloadFinishedEvents[i].set())
+			finally:
+				# If a download failed, the extractor must not wait forever on a download which will never finish
+				setAllEvents()
+
+		downloadThread = makeThread(downloadAllThenWakeExtractor)
+		downloadThread.start()
+
+		# The index in self.downloadList of each item in self.extractList
+		itemDownloadIndices = [i for i, extractables in enumerate(self.extractablesForEachDownload) for _ in extractables]
+		planner = self._makeExtractionPlanner(remapPaths)
+
+		try:
+			beforeExtractionCalled = False
+			itemIndex = 0
+			for i, extractables in enumerate(self.extractablesForEachDownload):
+				downloadFinishedEvents[i].wait()
+
+				# The download failed - the error will be raised when the download thread is joined below
+				if self.downloadProgress is None or not self.downloadProgress.isCompleted(i):
+					break
 
+				if beforeExtraction is not None and not beforeExtractionCalled:
+					beforeExtractionCalled = True
+					beforeExtraction()
+
+				for _ in extractables:
+					# Only later items which have already been downloaded can be checked for files which override this item
+					laterItemIndices = [x for x in range(itemIndex + 1, len(self.extractList)) if self.downloadProgress.isCompleted(itemDownloadIndices[x])]
+					self._extractItem(itemIndex, remapPaths, planner, laterItemIndices)
+					itemIndex += 1
+		except BaseException as extractionError:
+			# Don't wait for the remaining (possibly very large) downloads to finish before reporting the error
+			self._cancelDownloads(extractionError)
+			try:
+				downloadThread.join()
+			except BaseException:
+				pass
+			raise
+
+		# Re-raises any download error
+		downloadThread.join()
+
+	def _makeExtractionPlanner(self, remapPaths):
+		#type: (Callable[[str, str], Tuple[str, str]]) -> extractionPlanner.ExtractionPlanner
+		return extractionPlanner.ExtractionPlanner(self.downloadTempDir, self.extractList, remapPaths,
+		                                           skipUnchangedFiles=Globals.SKIP_UNCHANGED_FILES_DURING_EXTRACTION)
+
+	def _extractItem(self, itemIndex, remapPaths, planner, laterItemIndices):
+		#type: (int, Callable[[str, str], Tuple[str, str]], extractionPlanner.ExtractionPlanner, List[int]) -> None
+		"""
+		Extract (or copy) self.extractList[itemIndex], then record the files it wrote in self.installedFiles.
+		If Globals.PLAN_EXTRACTION_OVERLAYS is set, files which will be overwritten by any of the items at
+		laterItemIndices are skipped.
+		"""
+		extractableItem = self.extractList[itemIndex]
+		commandLineParser.printSeventhModStatusUpdate(self._overallPercentage(), "Extracting {}".format(extractableItem))
+
+		if self.journal is not None and self.journal.isDone(installJournal.extractStep(extractableItem)):
+			print("Skipping [{}] as it was extracted by the previous install".format(extractableItem.filename))
+			planner.markWritten(itemIndex)
+			# It's not known which later items the previous install left files out for, so wait for all of them
+			planner.overridingItems[itemIndex] = set(range(itemIndex + 1, len(self.extractList)))
+			self._recordInstalledFiles(itemIndex, planner)
+			self._finishItem(itemIndex, planner)
+			return
+
+		destinationFolder, destinationFileName = remapPaths(extractableItem.destinationPath, extractableItem.filename)
+
+		skipItem, excludedMembers = planner.getExclusions(itemIndex, laterItemIndices if Globals.PLAN_EXTRACTION_OVERLAYS else [])
+
+		if skipItem:
+			print("Skipping [{}] as it will be overwritten by a later file".format(extractableItem.filename))
+		else:
 			extractOrCopyFile(extractableItem.filename,
 			                  self.downloadTempDir,
 			                  destinationFolder,
-			                  destinationFileName)
+			                  destinationFileName,
+			                  excludedMembers=excludedMembers)
+			self._recordInstalledFiles(itemIndex, planner)
+
+		if self.journal is not None:
+			self.journal.markDone(installJournal.extractStep(extractableItem))
+
+		self._finishItem(itemIndex, planner)
+
+	def _finishItem(self, itemIndex, planner):
+		#type: (int, extractionPlanner.ExtractionPlanner) -> None
+		"""
+		Called once each item has been extracted (or skipped), in order. Calls onSourceExtracted() for each source
+		whose files are now all installed - that is, all the source's items have been extracted, and so have any
+		later items which the source's items left files out for (see ExtractionPlanner.overridingItems).
+		Otherwise, if the install is stopped and re-run with different options, the source would be treated as
+		installed even though some of its files were never extracted.
+		"""
+		self.numExtracted += 1
+		if self.onSourceExtracted is None:
+			return
+
+		sourceID = self.extractList[itemIndex].sourceID
+		if all(x.sourceID != sourceID for x in self.extractList[itemIndex + 1:]):
+			self.sourcesAwaitingOverrides.append(sourceID)
+
+		for waitingSourceID in list(self.sourcesAwaitingOverrides):
+			overridingItems = set()
+			for i, item in enumerate(self.extractList):
+				if item.sourceID == waitingSourceID:
+					overridingItems.update(planner.overridingItems.get(i, set()))
+
+			# Items are extracted in order, so every item up to itemIndex has been extracted
+			if all(i <= itemIndex for i in overridingItems):
+				self.sourcesAwaitingOverrides.remove(waitingSourceID)
+				self.onSourceExtracted(waitingSourceID)
+
+	def _recordInstalledFiles(self, itemIndex, planner):
+		#type: (int, extractionPlanner.ExtractionPlanner) -> None
+		extractableItem = self.extractList[itemIndex]
+		installedFiles = planner.getInstalledFiles(itemIndex)
+		if installedFiles is None:
+			print("WARNING: Couldn't list the contents of [{}] - its files won't be in the install manifest".format(extractableItem.filename))
+			# Without the item's contents, it's not known which files it overwrote
+			self.installedFiles.overlaps = None
+			return
+
+		# Files excluded because a later item overwrites them are also recorded here, but the later item's entry replaces them
+		for path, size, crc in installedFiles:
+			relativePath = os.path.relpath(path, self.defaultExtractionDir)
+			if relativePath.startswith(os.pardir):
+				continue
+
+			if size is None or crc is None:
+				if not os.path.isfile(path):
+					continue
+				size, crc = os.path.getsize(path), crc32_of_file(path)
+
+			self.installedFiles.recordFile(relativePath, size, crc, extractableItem.sourceID)
+
+	def _overallPercentage(self):
+		# type: () -> int
+		"""
+		The overall install percentage, based on the number of downloads and extractions completed so far.
+		If no download has been started (eg only extracting), downloads are assumed to be complete.
+		"""
+		downloadFraction = 1.0 if self.downloadProgress is None else self.downloadProgress.fractionCompleted()
+		extractionFraction = float(self.numExtracted) / len(self.extractList) if self.extractList else 0.0
+		return int(downloadFraction * self.downloadProgressAmount + extractionFraction * self.extractionProgressAmount)
 
 	def addItemManually(self, url, extractionDir):
 		"""
@@ -1209,11 +2071,30 @@ class DownloaderAndExtractor:
 		:param url: The URL or metalink to download
 		:param extractionDir: The folder where the file(s) will be extracted
 		"""
-		print("Querying URL: [{}]".format(url))
-		extractables = DownloaderAndExtractor.getExtractableItem(url=url, extractionDir=extractionDir)
-		self.downloadList.append(url)
-		self.extractablesForEachDownload.append(extractables)
-		self.extractList.extend(extractables)
+		self.addItemsManually([(url, extractionDir)])
+
+	def addItemsManually(self, urlsAndExtractionDirs, sourceIDs=None):
+		#type: (List[Tuple[str, str]], Optional[List[str]]) -> None
+		"""
+		Same as addItemManually(), but for a list of (url, extractionDir) pairs. The urls are queried concurrently,
+		but are added to the download/extract lists in the same order as the input list.
+		:param urlsAndExtractionDirs: A list of (url, extractionDir) pairs - see addItemManually()
+		:param sourceIDs: If given, the ModFile id (or mod option name) of each url, which is recorded in the install manifest
+		"""
+		for url, _ in urlsAndExtractionDirs:
+			print("Querying URL: [{}]".format(url))
+
+		if sourceIDs is None:
+			sourceIDs = [None] * len(urlsAndExtractionDirs)
+
+		# The sizes and last-modified dates are used to verify and resume downloads, so they must be up to date
+		extractableItemLists = DownloaderAndExtractor.getExtractableItems(urlsAndExtractionDirs, forceRevalidate=True)
+		for (url, _), sourceID, extractables in zip(urlsAndExtractionDirs, sourceIDs, extractableItemLists):
+			for extractableItem in extractables:
+				extractableItem.sourceID = sourceID
+			self.downloadList.append(url)
+			self.extractablesForEachDownload.append(extractables)
+			self.extractList.extend(extractables)
 
 	def printPreview(self):
 		pretty_file_size = prettyPrintFileSize(self.totalDownloadSize())
@@ -1227,14 +2108,29 @@ class DownloaderAndExtractor:
 		return sum([x.length for x in self.extractList])
 
 	@staticmethod
-	def getExtractableItem(url, extractionDir):
-		#type: (str, str) -> List[ExtractableItem]
+	def getExtractableItems(urlsAndExtractionDirs, forceRevalidate=False):
+		#type: (List[Tuple[str, str]], bool) -> List[List[DownloaderAndExtractor.ExtractableItem]]
+		"""
+		Calls getExtractableItem() on each (url, extractionDir) pair, querying up to Globals.MAX_URL_QUERY_WORKERS urls
+		at the same time. The returned list is in the same order as the input list.
+		"""
+		def query(urlAndExtractionDir):
+			url, extractionDir = urlAndExtractionDir
+			return DownloaderAndExtractor.getExtractableItem(url=url, extractionDir=extractionDir, forceRevalidate=forceRevalidate)
+
+		return parallelMap(query, urlsAndExtractionDirs, Globals.MAX_URL_QUERY_WORKERS)
+
+	@staticmethod
+	def getExtractableItem(url, extractionDir, forceRevalidate=False):
+		#type: (str, str, bool) -> List[ExtractableItem]
 		"""
 		Returns a list of ExtractableItems given a url. ExtractableItems represent a file on disk which can be
 		extracted or moved to the target `extractionDir` directory
 		Normally each url represents exactly one file, but a metalink may contain multiple files.
+		The url's metadata is cached on disk - see Globals.URL_METADATA_CACHE_TTL_SECONDS
 		:param url: The url of the file or metalink to download
 		:param extractionDir: Where to extract or move the downloaded file to after download is finished
+		:param forceRevalidate: If True, always check with the server that the cached metadata is still valid
 		:return:
 		"""
 		MAX_QUERY_ATTEMPTS = 5
@@ -1242,8 +2138,10 @@ class DownloaderAndExtractor:
 			commandLineParser.printSeventhModStatusUpdate(1, "Inspecting URL '{}' (attempt {}/{})".format(url, attempt_no, MAX_QUERY_ATTEMPTS))
 
 			try:
+				metadata = DownloaderAndExtractor.__queryURLMetadata(url, forceRevalidate)
+
 				if DownloaderAndExtractor.__urlIsMetalink(url):
-					metalinkFilenames = getMetalinkFilenames(url)
+					metalinkFilenames = parseMetalinkFilenames(metadata['metalink'])
 					print("Metalink contains: ", metalinkFilenames)
 					return [DownloaderAndExtractor.ExtractableItem(
 						filename=filename,
@@ -1253,14 +2151,14 @@ class DownloaderAndExtractor:
 						remoteLastModified=None,
 						fileURL=fileURL) for filename, length, fileURL in metalinkFilenames]
 				else:
-					filename, length, remoteLastModified = DownloaderAndExtractor.__getFilenameFromURL(url)
 					return [DownloaderAndExtractor.ExtractableItem(
-						filename=filename,
-						length=length,
+						filename=metadata['filename'],
+						length=metadata['length'],
 						destinationPath=extractionDir,
 						fromMetaLink=False,
-						remoteLastModified=remoteLastModified,
-						fileURL=url)]
+						remoteLastModified=metadata['lastModified'],
+						fileURL=url,
+						sha256=Globals.URL_SHA256_LOOKUP_TABLE.get(url))]
 			except Exception as e:
 				traceback.print_exc()
 				if attempt_no >= MAX_QUERY_ATTEMPTS:
@@ -1268,20 +2166,102 @@ class DownloaderAndExtractor:
 
 			time.sleep(5)
 
+	@staticmethod
+	def getURLMetadataCache():
+		# type: () -> urlMetadataCache.URLMetadataCache
+		with DownloaderAndExtractor.sharedURLMetadataCacheLock:
+			if DownloaderAndExtractor.sharedURLMetadataCache is None:
+				DownloaderAndExtractor.sharedURLMetadataCache = urlMetadataCache.URLMetadataCache(Globals.URL_METADATA_CACHE_PATH, Globals.URL_METADATA_CACHE_TTL_SECONDS)
+
+			return DownloaderAndExtractor.sharedURLMetadataCache
+
+	@staticmethod
+	def getDownloadStore():
+		# type: () -> Optional[downloadStore.DownloadStore]
+		"""Returns the download store shared by all installs, or None if it is disabled (Globals.DOWNLOAD_STORE_MAX_SIZE = 0)"""
+		if Globals.DOWNLOAD_STORE_MAX_SIZE <= 0:
+			return None
+
+		with DownloaderAndExtractor.sharedDownloadStoreLock:
+			if DownloaderAndExtractor.sharedDownloadStore is None:
+				DownloaderAndExtractor.sharedDownloadStore = downloadStore.DownloadStore(Globals.DOWNLOAD_STORE_FOLDER, Globals.DOWNLOAD_STORE_MAX_SIZE)
+
+			return DownloaderAndExtractor.sharedDownloadStore
+
+	@staticmethod
+	def __queryURLMetadata(url, forceRevalidate):
+		# type: (str, bool) -> Dict[str, Any]
+		"""
+		Returns the metadata of a url (see urlMetadataCache.URLMetadataCache for the format), using the on-disk cache
+		where possible. Stale cache entries are revalidated with the server using a conditional request.
+		"""
+		cache = DownloaderAndExtractor.getURLMetadataCache()
+		isMetalink = DownloaderAndExtractor.__urlIsMetalink(url)
+
+		cachedEntry, isFresh = cache.lookup(url)
+		if cachedEntry is not None and isMetalink and cachedEntry.get('metalink') is None:
+			cachedEntry = None
+
+		if cachedEntry is not None and isFresh and not forceRevalidate:
+			print("Using cached metadata for URL: [{}]".format(url))
+			return cachedEntry
+
+		if isMetalink:
+			result = DownloaderAndExtractor.__getMetalinkText(url, cachedEntry)
+		else:
+			result = DownloaderAndExtractor.__getFilenameFromURL(url, cachedEntry)
+
+		if result is None:
+			print("Cached metadata for URL [{}] is still valid".format(url))
+			cache.markRevalidated(url)
+			return cachedEntry
+
+		if isMetalink:
+			metalinkText, remoteLastModified, etag = result
+			return cache.store(url, lastModified=remoteLastModified, etag=etag, metalink=metalinkText)
+		else:
+			filename, length, remoteLastModified, etag = result
+			return cache.store(url, filename=filename, length=length, lastModified=remoteLastModified, etag=etag)
+
+	@staticmethod
+	def __getMetalinkText(url, cachedEntry):
+		# type: (str, Optional[Dict[str, Any]]) -> Optional[Tuple[str, Optional[str], Optional[str]]]
+		"""
+		Downloads the text of a metalink file.
+		:return: A tuple of (metalinkText, remoteLastModified, etag), or None if cachedEntry is still valid
+		"""
+		if SSL_VERSION_IS_OLD or Globals.URLOPEN_IS_BROKEN:
+			return downloadFile(url, is_text=True), None, None
+
+		try:
+			httpResponse = _conditionalURLOpen(url, cachedEntry)
+			if httpResponse is None:
+				return None
+
+			metalinkText = httpResponse.read().decode('utf-8')
+			httpResponse.close()
+			return metalinkText, _getResponseHeader(httpResponse, "Last-Modified"), _getResponseHeader(httpResponse, "ETag")
+		except Exception:
+			print("Could not query metalink {} using URLOpen! Falling back to downloadFile()".format(url))
+			traceback.print_exc()
+			return downloadFile(url, is_text=True), None, None
+
 	@staticmethod
 	def __urlIsMetalink(url):
 		name, ext = os.path.splitext(urlparse(url).path)
 		return ext == '.meta4' or ext == '.metalink'
 
 	@staticmethod
-	def __getFilenameFromURL(url):
-		# type: (str) -> Tuple[str, int, str]
+	def __getFilenameFromURL(url, cachedEntry=None):
+		# type: (str, Optional[Dict[str, Any]]) -> Optional[Tuple[str, int, Optional[str], Optional[str]]]
 		"""
 		Returns the filename of the file at the given URL, and it's file size.
 		If the file size cannot be retrieved, returns a file size of 0
 		:param url: The url of a file or a url which will eventually redirect to a file
-		:return: A tuple of (filename, filesize, remoteLastModified) of the file pointed by the url
-		remoteLastModified can be None if not present in the http response header
+		:param cachedEntry: If provided, the query is made conditional on the cached entry's ETag/Last-Modified
+		:return: A tuple of (filename, filesize, remoteLastModified, etag) of the file pointed by the url
+		remoteLastModified and etag can be None if not present in the http response header
+		Returns None if cachedEntry is provided and the server reports the file has not been modified.
 		"""
 
 		# It's not a huge deal if the filename download is insecure (the actual download is done with Aria)
@@ -1312,46 +2292,42 @@ class DownloaderAndExtractor:
 			lengthString = lengthString[-1].strip() if lengthString else None
 			remoteLastModified = re.findall("Last-Modified: (.+)", headers, re.IGNORECASE)
 			remoteLastModified = remoteLastModified[-1].strip() if remoteLastModified else None
+			etag = re.findall("ETag: (.+)", headers, re.IGNORECASE)
+			etag = etag[-1].strip() if etag else None
 			responseURL = re.findall("Location: (.+)", headers, re.IGNORECASE)
 			responseURL = responseURL[-1].strip() if responseURL else queryUrl
 
-			return contentDisposition, remoteLastModified, responseURL, lengthString
+			return contentDisposition, remoteLastModified, etag, responseURL, lengthString
 
 		def queryUsingURLOpen(queryUrl):
-			httpResponse = urlopen(Request(queryUrl, headers={"User-Agent": ""}), context=Globals.getURLOpenContext())
-
-			try:
-				contentDisposition = httpResponse.getheader("Content-Disposition")  # python 3
-				lengthString = httpResponse.getheader('Content-Length')
-				remoteLastModified = httpResponse.getheader("Last-Modified")
-			except AttributeError:
-				# Python 2 handling: AttributeError causes below to be executed instead
-				contentDisposition = httpResponse.info().getheader("Content-Disposition")
-				if contentDisposition is not None:
-					contentDisposition = contentDisposition.decode("utf-8")
-
-				lengthString = httpResponse.info().getheader('Content-Length')
-				if lengthString is not None:
-					lengthString = lengthString.decode("utf-8")
-
-				remoteLastModified = httpResponse.info().getheader("Last-Modified")
-				if remoteLastModified is not None:
-					remoteLastModified = remoteLastModified.decode("utf-8")
+			httpResponse = _conditionalURLOpen(queryUrl, cachedEntry)
+			if httpResponse is None:
+				return None
 
+			contentDisposition = _getResponseHeader(httpResponse, "Content-Disposition")
+			lengthString = _getResponseHeader(httpResponse, 'Content-Length')
+			remoteLastModified = _getResponseHeader(httpResponse, "Last-Modified")
+			etag = _getResponseHeader(httpResponse, "ETag")
 			responseURL = httpResponse.url
 
-			return contentDisposition, remoteLastModified, responseURL, lengthString
+			return contentDisposition, remoteLastModified, etag, responseURL, lengthString
 
 		if Globals.URLOPEN_IS_BROKEN or (SSL_VERSION_IS_OLD and Globals.CURL_EXECUTABLE is not None):
-			contentDisposition, remoteLastModified, responseURL, lengthString = queryUsingCURL(url)
+			queryResult = queryUsingCURL(url)
 		else:
 			try:
-				contentDisposition, remoteLastModified, responseURL, lengthString = queryUsingURLOpen(url)
+				queryResult = queryUsingURLOpen(url)
 			except:
 				Globals.URLOPEN_IS_BROKEN = True
 				print("Could not query URL {} using URLOpen! Falling back to CURL".format(url))
 				traceback.print_exc()
-				contentDisposition, remoteLastModified, responseURL, lengthString = queryUsingCURL(url)
+				queryResult = queryUsingCURL(url)
+
+		# The server reported that the file has not changed since cachedEntry was retrieved
+		if queryResult is None:
+			return None
+
+		contentDisposition, remoteLastModified, etag, responseURL, lengthString = queryResult
 
 		try:
 			length = int(lengthString)
@@ -1376,7 +2352,38 @@ class DownloaderAndExtractor:
 			filename = os.path.basename(urlparse(url).path)
 
 
-		return filename, length, remoteLastModified
+		return filename, length, remoteLastModified, etag
+
+def _getResponseHeader(httpResponse, headerName):
+	# type: (Any, str) -> Optional[str]
+	try:
+		return httpResponse.getheader(headerName)  # python 3
+	except AttributeError:
+		# Python 2 handling
+		headerValue = httpResponse.info().getheader(headerName)
+		if headerValue is not None:
+			headerValue = headerValue.decode("utf-8")
+		return headerValue
+
+def _conditionalURLOpen(url, cachedEntry):
+	# type: (str, Optional[Dict[str, Any]]) -> Optional[Any]
+	"""
+	Open a url with urlopen. If cachedEntry is provided, the request is made conditional on its 'etag'/'lastModified'
+	values, and None is returned if the server responds with '304 Not Modified'.
+	"""
+	headers = {"User-Agent": ""}
+	if cachedEntry is not None:
+		if cachedEntry.get('etag'):
+			headers["If-None-Match"] = cachedEntry['etag']
+		if cachedEntry.get('lastModified'):
+			headers["If-Modified-Since"] = cachedEntry['lastModified']
+
+	try:
+		return urlopen(Request(url, headers=headers), context=Globals.getURLOpenContext())
+	except HTTPError as e:
+		if cachedEntry is not None and e.code == 304:
+			return None
+		raise
 
 def tryCreateLockFile():
 	# type: () -> ()
@@ -1427,6 +2434,12 @@ def checkFreeSpace(installPath, downloadSize):
 	 - true: There is  enough free space on disk
 	"""
 	recommendedFreeSpaceBytes = downloadSize * Globals.FREE_SPACE_ESTIMATE_SCALING + Globals.FREE_SPACE_ESTIMATE_FIXED
+
+	# If the download store is enabled, the downloads are kept after the install (up to the store's maximum size)
+	store = DownloaderAndExtractor.getDownloadStore()
+	if store is not None:
+		recommendedFreeSpaceBytes += max(0, min(downloadSize, store.maxSizeBytes - store.totalSize()))
+
 	recommendedFreeSpaceString = prettyPrintFileSize(recommendedFreeSpaceBytes)
 
 	# Try to calculate actual free space
@@ -1459,6 +2472,28 @@ def checkFreeSpace(installPath, downloadSize):
 
 	return haveEnoughFreeSpace, freeSpaceAdvisoryString
 
+def parallelMap(function, items, maxWorkers):
+	# type: (Callable[[Any], Any], List[Any], int) -> List[Any]
+	"""
+	Call function on each item, running up to maxWorkers calls at the same time on a thread pool.
+	The calls are made one at a time if maxWorkers is 1 or less, or on Python 2 (which has no concurrent.futures).
+	:return: The result of each call, in the same order as items. If any call raises, the first exception (in the order
+	of items) is raised once all the calls have finished.
+	"""
+	items = list(items)
+	if len(items) <= 1 or maxWorkers <= 1:
+		return [function(item) for item in items]
+
+	try:
+		import concurrent.futures
+	except ImportError:
+		return [function(item) for item in items]
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=min(maxWorkers, len(items))) as executor:
+		futures = [executor.submit(function, item) for item in items]
+
+	return [future.result() for future in futures]
+
 def group_by(values, keyFunc):
 	# type: (List, Callable[[Any], Any]) -> Dict
 	"""
@@ -1490,12 +2525,11 @@ def downloadFile(url, is_text):
 	:param url:
 	:return:
 	"""
-	def downloadUsingURLOpen(download_url):
-		print("Downloading [{}] using Python urlopen...".format(download_url))
-		file = urlopen(Request(download_url, headers={"User-Agent": ""}), context=Globals.getURLOpenContext())
-		data = file.read()
-		file.close()
-		return data
+	def downloadUsingConnectionPool(download_url):
+		# Use a pooled keep-alive connection, as many small files are usually fetched from the same server
+		import httpDownloader
+		print("Downloading [{}] using Python pooled connection...".format(download_url))
+		return httpDownloader.getSharedConnectionPool().fetch(download_url)
 
 	def downloadUsingAria2c(download_url):
 		# Download to a temporary file
@@ -1525,7 +2559,7 @@ def downloadFile(url, is_text):
 		if SSL_VERSION_IS_OLD or Globals.URLOPEN_IS_BROKEN:
 			data = downloadUsingAria2c(url)
 		else:
-			data = downloadUsingURLOpen(url)
+			data = downloadUsingConnectionPool(url)
 	except:
 		traceback.print_exc()
 		Globals.URLOPEN_IS_BROKEN = True
@@ -1570,6 +2604,21 @@ def startAndJoinThreads(threads):
 	for thread in threads:
 		thread.join()
 
+def atomicWriteText(path, text):
+	# type: (str, str) -> None
+	"""Write to a temporary file then rename it over the destination, so the file is never left half-written"""
+	tempPath = path + '.tmp'
+	with io.open(tempPath, 'w', encoding='utf-8') as f:
+		f.write(ensureUnicodeOrStr(text))
+
+	try:
+		os.replace(tempPath, path)
+	except AttributeError:
+		# Python 2 has no os.replace, and os.rename() won't overwrite an existing file on Windows
+		if os.path.exists(path):
+			os.remove(path)
+		os.rename(tempPath, path)
+
 def getInstallerTempDir():
 	"""Returns the path of a new, empty temporary directory. It will be located adjacent to the python script like:
 	 `07th-mod_temp_dir/tmpva9f1qz7`
@@ -1632,19 +2681,15 @@ def ensureUnicodeOrStr(text):
 
 
 def crc32_of_file(file_path):
-	BLOCK_SIZE = 65536
-
-	hash = 0
-	with open(file_path, 'rb') as f:
-		fb = f.read(BLOCK_SIZE)
-		while len(fb) > 0:
-			hash = zlib.crc32(fb, hash)
-			fb = f.read(BLOCK_SIZE)
+	# type: (str) -> str
+	"""Returns the CRC32 of a file as 8 lowercase hex digits. The file is only read again if its size or modified time changed."""
+	return fileHasher.cachedHashFile(file_path, 'crc32')
 
-	return "{:08x}".format(hash & 0xffffffff)
-
-def applyDeletions(installPath, optionParser):
-	#type: (str, installConfiguration.ModOptionParser) -> None
+def applyDeletions(installPath, optionParser, installedFiles=None):
+	#type: (str, installConfiguration.ModOptionParser, Optional[installManifest.InstallManifest]) -> None
+	"""
+	:param installedFiles: If given, each deleted path is recorded in it, so it is removed from the install manifest
+	"""
 	for opt in optionParser.downloadAndExtractOptionsByPriority:
 			if opt.deletePath is not None:
 				# Do not allow paths with '..' to avoid deleting stuff outside the install path
@@ -1666,3 +2711,6 @@ def applyDeletions(installPath, optionParser):
 						os.remove(fullDeletePath)
 				except Exception as e:
 					print("applyDeletions(): Failed to delete path: {}".format(e))
+
+				if installedFiles is not None and not os.path.exists(fullDeletePath):
+					installedFiles.recordDeletion(opt.deletePath)
@@ -0,0 +1,125 @@
+from __future__ import print_function, unicode_literals
+
+import errno
+import os
+import shutil
+import stat
+import time
+
+import common
+
+try:
+	from typing import Optional, List, Tuple
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+def _scanDirectory(folder):
+	# type: (str) -> List[Tuple[str, str, bool]]
+	"""
+	Returns a (name, path, isDirectory) tuple for each entry in the folder. Symlinks are never treated as directories.
+	Uses os.scandir() where available, which gets whether each entry is a directory without an extra stat() call.
+	"""
+	if hasattr(os, 'scandir'):
+		return [(entry.name, entry.path, entry.is_dir(follow_symlinks=False)) for entry in os.scandir(folder)]
+
+	# Fallback for Python 2
+	entries = []
+	for name in os.listdir(folder):
+		entryPath = os.path.join(folder, name)
+		entries.append((name, entryPath, os.path.isdir(entryPath) and not os.path.islink(entryPath)))
+	return entries
+
+def _moveReplacing(src, target):
+	# type: (str, str) -> None
+	"""
+	Move a file, or a folder whose target doesn't exist yet, to target. An existing target file is replaced.
+	On Linux/Mac, os.rename() replaces the target atomically, so there is no need to check for and delete it first.
+	"""
+	try:
+		os.rename(src, target)
+	except OSError as e:
+		if e.errno != errno.EXDEV:
+			raise
+
+		# Can't rename across filesystems, so fall back to copying
+		if os.path.lexists(target):
+			os.chmod(target, stat.S_IWRITE)
+			os.remove(target)
+		shutil.move(src, target)
+
+def _mergeDirectory(fromDir, toDir, emptiedFolders):
+	# type: (str, str, List[str]) -> int
+	"""
+	Move the contents of fromDir into the existing folder toDir. Folders which don't exist in toDir yet are moved
+	with a single rename, so only folders which exist in both are walked.
+	:param emptiedFolders: fromDir and its subfolders are appended to this list (deepest first) once they are empty
+	:return: The number of files and folders which were moved
+	"""
+	numMoved = 0
+	for name, src, isDirectory in _scanDirectory(fromDir):
+		target = os.path.join(toDir, name)
+		if isDirectory and os.path.isdir(target):
+			numMoved += _mergeDirectory(src, target, emptiedFolders)
+		else:
+			_moveReplacing(src, target)
+			numMoved += 1
+
+	emptiedFolders.append(fromDir)
+	return numMoved
+
+def moveDirectoryIntoPlace(fromDir, toDir, maxWorkers=None):
+	# type: (str, str, Optional[int]) -> None
+	"""
+	Merge the contents of fromDir into toDir, replacing any existing files, then remove fromDir. This has the same
+	result as higurashiInstaller.Installer._moveDirectoryIntoPlace(), but is much faster when moving many files:
+	- Whole folders are renamed where they don't exist in toDir yet, instead of moving each file inside them
+	- Existing files are replaced by the rename, instead of being checked for and deleted first
+	- Emptied folders are removed in one pass at the end
+	- Top-level folders which need merging are merged in parallel on a thread pool
+
+	Only used on Linux/Mac (see Globals.FAST_DIRECTORY_MOVE), as Windows can't rename over existing files,
+	and is more likely to have files locked by other programs (like antivirus) which need the slower approach.
+
+	:param maxWorkers: The number of threads to use. Defaults to Globals.DIRECTORY_MOVE_THREADS
+	"""
+	if maxWorkers is None:
+		maxWorkers = common.Globals.DIRECTORY_MOVE_THREADS
+
+	startTime = time.time()
+
+	if not os.path.exists(toDir):
+		common.makeDirsExistOK(os.path.dirname(os.path.abspath(toDir)))
+		_moveReplacing(fromDir, toDir)
+		print("directoryMover: Renamed [{}] to [{}]".format(fromDir, toDir))
+		return
+
+	# Move top level files (and folders which don't exist in toDir yet) on this thread
+	numMoved = 0
+	foldersToMerge = []
+	for name, src, isDirectory in _scanDirectory(fromDir):
+		target = os.path.join(toDir, name)
+		if isDirectory and os.path.isdir(target):
+			foldersToMerge.append((src, target))
+		else:
+			_moveReplacing(src, target)
+			numMoved += 1
+
+	def mergeFolder(srcAndTarget):
+		emptiedFolders = []
+		numMovedInFolder = _mergeDirectory(srcAndTarget[0], srcAndTarget[1], emptiedFolders)
+		return numMovedInFolder, emptiedFolders
+
+	results = common.parallelMap(mergeFolder, foldersToMerge, maxWorkers)
+
+	# Each list of emptied folders is already ordered deepest first
+	emptiedFolders = []
+	for numMovedInFolder, folders in results:
+		numMoved += numMovedInFolder
+		emptiedFolders.extend(folders)
+	emptiedFolders.append(fromDir)
+
+	for folder in emptiedFolders:
+		os.rmdir(folder)
+
+	print("directoryMover: Moved {} files/folders from [{}] to [{}] in {:.2f}s".format(numMoved, fromDir, toDir, time.time() - startTime))
@@ -0,0 +1,218 @@
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+
+import common
+
+try:
+	from typing import Optional, Dict, Any, List
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+def linkOrCopyFile(sourcePath, destinationPath):
+	# type: (str, str) -> None
+	"""
+	Hardlink sourcePath to destinationPath, falling back to a copy if hardlinks aren't supported (eg. FAT32 drives,
+	different drives, or Python 2 on Windows). Any existing file at destinationPath is replaced.
+	"""
+	if os.path.exists(destinationPath):
+		os.remove(destinationPath)
+
+	try:
+		os.link(sourcePath, destinationPath)
+	except (AttributeError, OSError):
+		shutil.copyfile(sourcePath, destinationPath)
+
+
+class DownloadStore:
+	"""
+	A download store shared by all games and submods, so that a file which has already been downloaded (for example
+	by a previous install, or by a different variant of the same mod) doesn't need to be downloaded again.
+
+	Each stored file is keyed by a hash of:
+	- for normal downloads: the url, file size and the server's Last-Modified date (files without a Last-Modified date
+	  are not stored, as there is no way to tell if they have changed)
+	- for files from a metalink: the file's url and size. These files are also checksummed against the metalink when
+	  they are downloaded.
+
+	Files are hardlinked between the store and each install's download folder (see linkOrCopyFile()), so a stored file
+	only takes no extra disk space while the install's download folder still exists (and only if hardlinks are supported).
+	Installers delete their download folder once the install finishes, so after that the stored files do take up space.
+
+	The total size of the store is capped at maxSizeBytes - the least recently used files are removed first.
+
+	Files are linked or copied without holding the store's lock, as copying a large file (where hardlinks aren't
+	supported) can take minutes, and would block every other download. Files which are being copied out of the store
+	are never evicted.
+	"""
+	INDEX_FILENAME = 'index.json'
+
+	def __init__(self, storeDir, maxSizeBytes):
+		# type: (str, int) -> None
+		self.storeDir = storeDir
+		self.maxSizeBytes = maxSizeBytes
+		self.indexPath = os.path.join(storeDir, DownloadStore.INDEX_FILENAME)
+		self.lock = threading.Lock()
+		# Maps each key to a dict of {'filename', 'size', 'lastUsed'}
+		self.index = self._loadIndex()  # type: Dict[str, Dict[str, Any]]
+		# The number of fetch() calls which are currently copying each key's file out of the store
+		self.keysInUse = {}  # type: Dict[str, int]
+
+	def _loadIndex(self):
+		# type: () -> Dict[str, Dict[str, Any]]
+		if not os.path.exists(self.indexPath):
+			return {}
+
+		try:
+			with io.open(self.indexPath, 'r', encoding='utf-8') as f:
+				return json.load(f)
+		except Exception:
+			print("DownloadStore: Failed to load index [{}] - store will be reset".format(self.indexPath))
+			traceback.print_exc()
+			return {}
+
+	def _saveIndex(self):
+		# Must be called with the lock held
+		common.makeDirsExistOK(self.storeDir)
+		common.atomicWriteText(self.indexPath, json.dumps(self.index, indent=1, sort_keys=True))
+
+	@staticmethod
+	def getKey(extractableItem):
+		# type: (Any) -> Optional[str]
+		""":return: The key used to store the given ExtractableItem, or None if the item can't be stored"""
+		if extractableItem.length <= 0:
+			return None
+
+		if extractableItem.fromMetaLink:
+			if extractableItem.fileURL is None:
+				return None
+			keyParts = ['metalink', extractableItem.fileURL, str(extractableItem.length)]
+		else:
+			if extractableItem.remoteLastModified is None:
+				return None
+			keyParts = ['url', extractableItem.fileURL, str(extractableItem.length), extractableItem.remoteLastModified.strip()]
+
+		return hashlib.sha256('\n'.join(keyParts).encode('utf-8')).hexdigest()
+
+	def _storedPath(self, key):
+		# type: (str) -> str
+		return os.path.join(self.storeDir, key)
+
+	def fetch(self, extractableItem, downloadDir):
+		# type: (Any, str) -> bool
+		"""
+		If the given ExtractableItem is in the store, link it into downloadDir.
+		:return: True if the item was retrieved from the store, False otherwise
+		"""
+		key = DownloadStore.getKey(extractableItem)
+		if key is None:
+			return False
+
+		storedPath = self._storedPath(key)
+		with self.lock:
+			entry = self.index.get(key)
+			if entry is None:
+				return False
+
+			if not os.path.isfile(storedPath) or os.path.getsize(storedPath) != entry['size']:
+				print("DownloadStore: Removing missing or corrupt entry for [{}]".format(entry['filename']))
+				self._removeEntry(key)
+				self._saveIndex()
+				return False
+
+			entry['lastUsed'] = time.time()
+			self._saveIndex()
+			self.keysInUse[key] = self.keysInUse.get(key, 0) + 1
+
+		try:
+			common.makeDirsExistOK(downloadDir)
+			linkOrCopyFile(storedPath, os.path.join(downloadDir, extractableItem.filename))
+		except Exception as e:
+			print("DownloadStore: Failed to retrieve [{}] from store: {}".format(extractableItem.filename, e))
+			return False
+		finally:
+			with self.lock:
+				self.keysInUse[key] -= 1
+				if self.keysInUse[key] == 0:
+					del self.keysInUse[key]
+
+		print("DownloadStore: Using previously downloaded [{}]".format(extractableItem.filename))
+		return True
+
+	def add(self, extractableItem, downloadDir):
+		# type: (Any, str) -> None
+		"""Add a downloaded (and verified) ExtractableItem to the store, then evict old items if the store is too large"""
+		key = DownloadStore.getKey(extractableItem)
+		if key is None or extractableItem.length > self.maxSizeBytes:
+			return
+
+		downloadedPath = os.path.join(downloadDir, extractableItem.filename)
+		if not os.path.isfile(downloadedPath) or os.path.getsize(downloadedPath) != extractableItem.length:
+			return
+
+		try:
+			with self.lock:
+				isStored = key in self.index
+
+			# Copy the file next to its final path first, so that the lock is only held to rename it into place
+			addingPath = None
+			if not isStored:
+				common.makeDirsExistOK(self.storeDir)
+				addingPath = self._storedPath(key) + '.adding{}'.format(threading.current_thread().ident)
+				linkOrCopyFile(downloadedPath, addingPath)
+
+			with self.lock:
+				if addingPath is not None:
+					if key in self.index:
+						# Another install added the same file while it was being copied
+						os.remove(addingPath)
+					else:
+						if os.path.exists(self._storedPath(key)):
+							os.remove(self._storedPath(key))
+						os.rename(addingPath, self._storedPath(key))
+
+				self.index[key] = {
+					'filename': extractableItem.filename,
+					'size': extractableItem.length,
+					'lastUsed': time.time(),
+				}
+
+				self._evict(keepKey=key)
+				self._saveIndex()
+		except Exception as e:
+			# The store is only an optimization, so never stop the install if it fails
+			print("DownloadStore: Failed to add [{}] to store: {}".format(extractableItem.filename, e))
+
+	def totalSize(self):
+		# type: () -> int
+		with self.lock:
+			return sum(entry['size'] for entry in self.index.values())
+
+	def _removeEntry(self, key):
+		# Must be called with the lock held
+		self.index.pop(key, None)
+		storedPath = self._storedPath(key)
+		if os.path.exists(storedPath):
+			os.remove(storedPath)
+
+	def _evict(self, keepKey):
+		# Must be called with the lock held
+		totalSize = sum(entry['size'] for entry in self.index.values())
+		for key in sorted(self.index.keys(), key=lambda k: self.index[k]['lastUsed']):
+			if totalSize <= self.maxSizeBytes:
+				break
+
+			if key == keepKey or key in self.keysInUse:
+				continue
+
+			print("DownloadStore: Evicting [{}] to keep store below {}".format(self.index[key]['filename'], common.prettyPrintFileSize(self.maxSizeBytes)))
+			totalSize -= self.index[key]['size']
+			self._removeEntry(key)
@@ -0,0 +1,227 @@
+from __future__ import print_function, unicode_literals
+
+import collections
+import os
+import subprocess
+import zipfile
+
+import common
+import fileHasher
+import zipExtractor
+
+try:
+	from typing import Optional, List, Dict, Tuple, Set, Callable
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+# A file in an archive. crc is a lowercase hex string (like common.crc32_of_file()), or None if the archive doesn't record it
+ArchiveMember = collections.namedtuple('ArchiveMember', ['path', 'size', 'crc'])
+
+
+def parseSevenZipTechnicalListing(listingText):
+	# type: (str) -> List[str]
+	"""
+	Parse the output of '7z l -slt' (the technical listing), returning the path of each file in the archive.
+	Folders are not returned.
+	"""
+	return [member.path for member in parseSevenZipTechnicalListingMembers(listingText)]
+
+def parseSevenZipTechnicalListingMembers(listingText):
+	# type: (str) -> List[ArchiveMember]
+	"""Same as parseSevenZipTechnicalListing(), but also returns the size and CRC of each file"""
+	# Everything before the '----------' line describes the archive itself, not its contents
+	_, separator, entriesText = listingText.replace('\r\n', '\n').partition('\n----------\n')
+	if not separator:
+		return []
+
+	members = []
+	for entryText in entriesText.split('\n\n'):
+		properties = {}
+		for line in entryText.split('\n'):
+			key, separator, value = line.partition(' = ')
+			if separator:
+				properties[key] = value
+
+		if 'Path' not in properties:
+			continue
+
+		isFolder = properties.get('Folder') == '+' or 'D' in properties.get('Attributes', '').split('_')[0]
+		if isFolder:
+			continue
+
+		try:
+			size = int(properties.get('Size', ''))
+		except ValueError:
+			size = None
+
+		crc = properties.get('CRC') or None
+		members.append(ArchiveMember(properties['Path'], size, crc.lower() if crc else None))
+
+	return members
+
+def listArchiveMembers(archivePath):
+	# type: (str) -> Optional[List[ArchiveMember]]
+	"""
+	List the files in an archive, using the central directory for zip files which are extracted in-process, or
+	'7z l -slt' for other archives (so the paths match the names 7z will extract the files as).
+	:return: Each file in the archive (with its path relative to the extraction folder), or None if the archive
+	could not be listed
+	"""
+	try:
+		if zipExtractor.canExtractInProcess(archivePath):
+			with zipfile.ZipFile(archivePath) as archive:
+				return [ArchiveMember(info.filename, info.file_size, "{:08x}".format(info.CRC))
+				        for info in archive.infolist() if not info.filename.endswith('/')]
+
+		arguments = [common.Globals.SEVEN_ZIP_EXECUTABLE, 'l', '-slt', '-sccUTF-8', archivePath]
+		proc = subprocess.Popen(arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		stdout, stderr = proc.communicate()
+		if proc.returncode != 0:
+			print("ExtractionPlanner: Failed to list [{}]: {}".format(archivePath, stderr.decode('utf-8', 'replace')))
+			return None
+
+		return parseSevenZipTechnicalListingMembers(stdout.decode('utf-8', 'replace'))
+	except Exception as e:
+		print("ExtractionPlanner: Failed to list [{}]: {}".format(archivePath, e))
+		return None
+
+
+class ExtractionPlanner:
+	"""
+	Items are extracted in order, and each item overwrites any files extracted by earlier items. So when a file is
+	in several items (eg. a base graphics pack and a graphics update), every copy except the last is written for
+	nothing. This class lists the contents of each item, so that each item can skip the files which a later item
+	will overwrite, and every destination file is only written once.
+
+	If skipUnchangedFiles is True, archive members are also skipped if the file already at their destination has the
+	same size and CRC32 (as recorded in the archive), so re-installing an update only writes the files which changed.
+	The destination is where the item is extracted to, so this never skips anything if the items are extracted to a
+	separate, empty folder before being moved into the game folder (Higurashi on Linux/Mac).
+
+	Items which can't be listed (eg. the archive is damaged, or 7z is missing) never override anything, and are
+	extracted in full, so the result is always the same as extracting every item in full.
+	"""
+	def __init__(self, downloadDir, extractList, remapPaths, skipUnchangedFiles=False):
+		# type: (str, List[common.DownloaderAndExtractor.ExtractableItem], Callable[[str, str], Tuple[str, str]], bool) -> None
+		self.downloadDir = downloadDir
+		self.extractList = extractList
+		self.remapPaths = remapPaths
+		self.skipUnchangedFiles = skipUnchangedFiles
+		# For each listed item, maps each destination path (see _destinationKey()) to the file in the archive.
+		# For items which are copied rather than extracted, the archive member is None.
+		self.listings = {}  # type: Dict[int, Dict[str, Optional[ArchiveMember]]]
+		# The destination paths which have been (or are being) written by this planner's items. These are always
+		# extracted, as files extracted earlier in the same install can't be trusted to match what was there before.
+		self.writtenKeys = set()  # type: Set[str]
+		# For each item whose exclusions have been worked out, the later items which overwrite some of its files.
+		# The item's files are only all installed once these later items have also been extracted.
+		self.overridingItems = {}  # type: Dict[int, Set[int]]
+
+	@staticmethod
+	def _destinationKey(destinationFolder, relativePath):
+		# type: (str, str) -> str
+		return os.path.normcase(os.path.normpath(os.path.join(destinationFolder, relativePath)))
+
+	def _getListing(self, itemIndex):
+		# type: (int) -> Optional[Dict[str, Optional[ArchiveMember]]]
+		if itemIndex in self.listings:
+			return self.listings[itemIndex]
+
+		item = self.extractList[itemIndex]
+		destinationFolder, destinationFilename = self.remapPaths(item.destinationPath, item.filename)
+
+		listing = None
+		if not common.isArchiveFilename(item.filename):
+			listing = {ExtractionPlanner._destinationKey(destinationFolder, destinationFilename): None}
+		elif common.getSplitArchiveNumber(item.filename) in (None, 1):
+			members = listArchiveMembers(os.path.join(self.downloadDir, item.filename))
+			if members is not None:
+				listing = dict((ExtractionPlanner._destinationKey(destinationFolder, member.path), member) for member in members)
+		else:
+			# The other parts of a split archive are extracted as part of the first part
+			listing = {}
+
+		self.listings[itemIndex] = listing
+		return listing
+
+	@staticmethod
+	def _sizeMatchesMember(destinationPath, member):
+		# type: (str, ArchiveMember) -> bool
+		"""True if the file at destinationPath could be the same as the archive member. Its CRC still needs to be checked."""
+		if member.size is None or member.crc is None:
+			return False
+
+		try:
+			return os.path.isfile(destinationPath) and os.path.getsize(destinationPath) == member.size
+		except (IOError, OSError):
+			return False
+
+	def getExclusions(self, itemIndex, laterItemIndices):
+		# type: (int, List[int]) -> Tuple[bool, Set[str]]
+		"""
+		Works out which parts of an item don't need to be extracted, as they will be overwritten by later items
+		(or, if skipUnchangedFiles is set, are already installed).
+		:param itemIndex: The index of the item in extractList which is about to be extracted
+		:param laterItemIndices: The indices of later items which are going to be extracted (and have been downloaded)
+		:return: A tuple of (skipItem, excludedMembers). skipItem is True if a file which would be copied will be
+		overwritten. excludedMembers are the archive members which don't need to be extracted.
+		"""
+		listing = self._getListing(itemIndex)
+		self.overridingItems[itemIndex] = set()
+		if not listing:
+			return False, set()
+
+		overriddenKeys = set()
+		for laterItemIndex in laterItemIndices:
+			laterListing = self._getListing(laterItemIndex)
+			if laterListing:
+				laterOverriddenKeys = set(key for key in laterListing if key in listing)
+				if laterOverriddenKeys:
+					overriddenKeys.update(laterOverriddenKeys)
+					self.overridingItems[itemIndex].add(laterItemIndex)
+
+		if not common.isArchiveFilename(self.extractList[itemIndex].filename):
+			skipItem = bool(overriddenKeys)
+			if not skipItem:
+				self.writtenKeys.update(listing)
+			return skipItem, set()
+
+		unchangedKeys = set()
+		if self.skipUnchangedFiles:
+			# Only the files which are the right size need to be read, and they are all hashed at once
+			candidateKeys = [key for key, member in listing.items()
+			                 if key not in overriddenKeys and key not in self.writtenKeys and ExtractionPlanner._sizeMatchesMember(key, member)]
+			crcs = fileHasher.hashFiles(candidateKeys, 'crc32') if candidateKeys else {}
+			unchangedKeys = set(key for key in candidateKeys if crcs[key] == listing[key].crc)
+
+			if unchangedKeys:
+				print("ExtractionPlanner: {} files in [{}] are already installed and will not be extracted".format(
+					len(unchangedKeys), self.extractList[itemIndex].filename))
+
+		self.writtenKeys.update(key for key in listing if key not in overriddenKeys and key not in unchangedKeys)
+		return False, set(listing[key].path for key in overriddenKeys | unchangedKeys)
+
+	def markWritten(self, itemIndex):
+		# type: (int) -> None
+		"""Treat every file in an item as written by this install, for example if it was extracted by a previous (stopped) install"""
+		listing = self._getListing(itemIndex)
+		if listing:
+			self.writtenKeys.update(listing)
+
+	def getInstalledFiles(self, itemIndex):
+		# type: (int) -> Optional[List[Tuple[str, Optional[int], Optional[str]]]]
+		"""
+		:return: A (destinationPath, size, crc) tuple for each file the item contains, or None if the item couldn't be
+		listed. size and crc are None for copied files, and may be None for archives which don't record them.
+		"""
+		listing = self._getListing(itemIndex)
+		if listing is None:
+			return None
+
+		item = self.extractList[itemIndex]
+		destinationFolder, destinationFilename = self.remapPaths(item.destinationPath, item.filename)
+		if not common.isArchiveFilename(item.filename):
+			return [(os.path.join(destinationFolder, destinationFilename), None, None)]
+
+		return [(os.path.normpath(os.path.join(destinationFolder, member.path)), member.size, member.crc) for member in listing.values()]
@@ -0,0 +1,257 @@
+from __future__ import unicode_literals
+
+import atexit
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import traceback
+import zlib
+
+import common
+
+try:
+	from typing import Optional, List, Dict, Iterable, Tuple, Any
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+# Files are read in blocks of this size into a single reused buffer, so hashing a large file (like resources.assets)
+# doesn't read the whole file into memory. hashlib and zlib release the GIL while hashing blocks this large,
+# so several files can be hashed at the same time on different threads.
+BLOCK_SIZE = 1024 * 1024
+
+
+class _CRC32Hasher:
+	"""Wraps zlib.crc32() with the same interface as a hashlib hasher"""
+	def __init__(self):
+		self.crc = 0
+
+	def update(self, data):
+		self.crc = zlib.crc32(data, self.crc)
+
+	def hexdigest(self):
+		return "{:08x}".format(self.crc & 0xffffffff)
+
+
+def _makeHasher(hashType):
+	# type: (str) -> object
+	if hashType == 'crc32':
+		return _CRC32Hasher()
+
+	return hashlib.new(hashType)
+
+def _readBlocks(f):
+	if sys.version_info < (3,):
+		# Python 2's zlib.crc32() doesn't accept memoryviews
+		for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+			yield block
+		return
+
+	buffer = bytearray(BLOCK_SIZE)
+	view = memoryview(buffer)
+	while True:
+		numRead = f.readinto(buffer)
+		if not numRead:
+			return
+
+		yield view[:numRead]
+
+def hashFile(path, hashTypes=('sha256',)):
+	# type: (str, Iterable[str]) -> Dict[str, str]
+	"""
+	Hash a file with several hash types, reading it only once.
+	:param hashTypes: 'crc32', or any hash type supported by hashlib (like 'sha256')
+	:return: A dict mapping each hash type to the lowercase hex digest of the file
+	"""
+	hashers = dict((hashType, _makeHasher(hashType)) for hashType in hashTypes)
+	updateFromFile(list(hashers.values()), path)
+	return dict((hashType, hasher.hexdigest()) for hashType, hasher in hashers.items())
+
+def updateFromFile(hashers, path):
+	# type: (List[object], str) -> None
+	"""Feed the contents of a file to each of the given hashers (eg. hashlib.sha256() objects)"""
+	with open(path, 'rb') as f:
+		for block in _readBlocks(f):
+			for hasher in hashers:
+				hasher.update(block)
+
+def crc32OfFile(path):
+	# type: (str) -> str
+	"""Returns the CRC32 of a file as 8 lowercase hex digits, e.g. '1a2b3c4d'"""
+	return hashFile(path, ['crc32'])['crc32']
+
+def sha256OfFile(path):
+	# type: (str) -> str
+	"""Returns the SHA256 of a file as lowercase hex digits"""
+	return hashFile(path, ['sha256'])['sha256']
+
+def _statKey(fileStat):
+	# type: (os.stat_result) -> Tuple[int, int]
+	"""The (size, modified time in nanoseconds) of a file, which must be unchanged for a cached hash to be used"""
+	mtimeNs = getattr(fileStat, 'st_mtime_ns', None)
+	if mtimeNs is None:
+		# Python 2 has no st_mtime_ns
+		mtimeNs = int(fileStat.st_mtime * 1e9)
+	return fileStat.st_size, mtimeNs
+
+
+class FileHashCache:
+	"""
+	A persistent (on-disk) cache of file hashes, so that files which haven't changed (like a game's resources.assets)
+	don't need to be read again each time they are checked - for example each time the GUI previews an install.
+
+	Each entry is keyed by the absolute path of the file, and is only used if the file's size and modified time
+	(in nanoseconds) are the same as when it was hashed. Only files of at least minPersistedSize bytes are saved to
+	disk (smaller files are quick to hash again), but all entries are kept in memory until the installer exits.
+	Entries for files which no longer exist are removed when the cache is saved.
+
+	Note that a file which is rewritten with the same size and modified time will still use the old hash, so checks
+	which must read the file (like repair mode verification, see installManifest.py) should not use the cache.
+	"""
+	VERSION = 1
+
+	def __init__(self, cachePath, minPersistedSize):
+		# type: (str, int) -> None
+		self.cachePath = cachePath
+		self.minPersistedSize = minPersistedSize
+		self.lock = threading.Lock()
+		# Held while the cache is written to disk, so that saves from different threads don't write the file at the same time
+		self.saveLock = threading.Lock()
+		# Maps each path to [size, mtimeNs, {hashType: digest}]
+		self.entries = self._load()  # type: Dict[str, List[Any]]
+		self.modified = False
+
+	def _load(self):
+		# type: () -> Dict[str, List[Any]]
+		if not os.path.exists(self.cachePath):
+			return {}
+
+		try:
+			with io.open(self.cachePath, 'r', encoding='utf-8') as f:
+				cacheJSON = json.load(f)
+
+			if cacheJSON.get('version') != FileHashCache.VERSION:
+				print("FileHashCache: Ignoring cache file [{}] with different version".format(self.cachePath))
+				return {}
+
+			return cacheJSON['entries']
+		except Exception:
+			print("FileHashCache: Failed to load cache file [{}] - cache will be reset".format(self.cachePath))
+			traceback.print_exc()
+			return {}
+
+	def lookup(self, path, fileStat, hashType):
+		# type: (str, os.stat_result, str) -> Optional[str]
+		size, mtimeNs = _statKey(fileStat)
+		with self.lock:
+			entry = self.entries.get(os.path.abspath(path))
+			if entry is None or entry[0] != size or entry[1] != mtimeNs:
+				return None
+
+			return entry[2].get(hashType)
+
+	def store(self, path, fileStat, hashType, digest):
+		# type: (str, os.stat_result, str, str) -> None
+		size, mtimeNs = _statKey(fileStat)
+		with self.lock:
+			key = os.path.abspath(path)
+			entry = self.entries.get(key)
+			if entry is None or entry[0] != size or entry[1] != mtimeNs:
+				entry = [size, mtimeNs, {}]
+				self.entries[key] = entry
+
+			entry[2][hashType] = digest
+			if size >= self.minPersistedSize:
+				self.modified = True
+
+	def save(self):
+		# type: () -> None
+		"""Save the cache to disk, if any entries which should be saved have changed"""
+		with self.saveLock:
+			with self.lock:
+				if not self.modified:
+					return
+
+				self.modified = False
+				persistedEntries = dict((path, entry) for path, entry in self.entries.items() if entry[0] >= self.minPersistedSize)
+
+			# Don't keep the hashes of deleted files forever
+			deletedPaths = [path for path in persistedEntries if not os.path.isfile(path)]
+			if deletedPaths:
+				with self.lock:
+					for path in deletedPaths:
+						self.entries.pop(path, None)
+						persistedEntries.pop(path)
+
+			try:
+				common.makeDirsExistOK(os.path.dirname(self.cachePath))
+				common.atomicWriteText(self.cachePath, json.dumps({'version': FileHashCache.VERSION, 'entries': persistedEntries}, separators=(',', ':'), sort_keys=True))
+			except Exception:
+				# The cache is only an optimization, so don't stop the install if it can't be saved
+				print("FileHashCache: Failed to save cache file [{}]".format(self.cachePath))
+				traceback.print_exc()
+
+
+_sharedFileHashCache = None  # type: Optional[FileHashCache]
+_sharedFileHashCacheLock = threading.Lock()
+
+def getSharedFileHashCache():
+	# type: () -> FileHashCache
+	"""The cache used by cachedHashFile(). It is saved when hashFiles() finishes, and when the installer exits."""
+	global _sharedFileHashCache
+	with _sharedFileHashCacheLock:
+		if _sharedFileHashCache is None:
+			_sharedFileHashCache = FileHashCache(common.Globals.FILE_HASH_CACHE_PATH, common.Globals.FILE_HASH_CACHE_MIN_PERSISTED_SIZE)
+			atexit.register(_sharedFileHashCache.save)
+		return _sharedFileHashCache
+
+def cachedHashFile(path, hashType):
+	# type: (str, str) -> str
+	"""
+	Same as hashFile(path, [hashType])[hashType], but uses the persistent hash cache (see FileHashCache),
+	so the file is only read if it has changed since it was last hashed.
+	"""
+	if not common.Globals.USE_FILE_HASH_CACHE:
+		return hashFile(path, [hashType])[hashType]
+
+	cache = getSharedFileHashCache()
+	fileStat = os.stat(path)
+	digest = cache.lookup(path, fileStat, hashType)
+	if digest is None:
+		digest = hashFile(path, [hashType])[hashType]
+		# Don't cache the hash if the file was modified while it was being hashed
+		if _statKey(os.stat(path)) == _statKey(fileStat):
+			cache.store(path, fileStat, hashType, digest)
+
+	return digest
+
+def hashFiles(paths, hashType, maxWorkers=None, useCache=True):
+	# type: (List[str], str, Optional[int], bool) -> Dict[str, Optional[str]]
+	"""
+	Hash several files at once on a thread pool.
+	:param hashType: 'crc32', or any hash type supported by hashlib (like 'sha256')
+	:param maxWorkers: The number of files to hash at the same time. Defaults to Globals.HASH_THREADS
+	:param useCache: If True, files which haven't changed since they were last hashed are not read (see cachedHashFile())
+	:return: A dict mapping each path to its lowercase hex digest, or None if the file couldn't be read (eg. it doesn't exist)
+	"""
+	if maxWorkers is None:
+		maxWorkers = common.Globals.HASH_THREADS
+
+	def hashPath(path):
+		try:
+			if useCache:
+				return cachedHashFile(path, hashType)
+			return hashFile(path, [hashType])[hashType]
+		except (IOError, OSError):
+			return None
+
+	uniquePaths = sorted(set(paths))
+	digests = dict(zip(uniquePaths, common.parallelMap(hashPath, uniquePaths, maxWorkers)))
+
+	if useCache and common.Globals.USE_FILE_HASH_CACHE:
+		getSharedFileHashCache().save()
+
+	return digests
@@ -1,8 +1,11 @@
 from __future__ import unicode_literals
 
+import bisect
+import hashlib
 import io
 import json
 import os
+import threading
 from datetime import datetime
 
 import logger
@@ -22,7 +25,9 @@ except ImportError:
 	from urllib import quote
 
 import common
+import fileHasher
 import installConfiguration
+import installManifest
 
 
 def parseRequirementsList(scanPath, requirementsListString):
@@ -37,6 +42,9 @@ def parseRequirementsList(scanPath, requirementsListString):
 	gotInstallIfCRC32 = False
 	skipIfExistsList = []
 
+	# Hash all the files which need a CRC32 check at once, rather than one by one
+	crc32s = fileHasher.hashFiles([os.path.join(scanPath, requirement[1]) for requirement in requirementsList if requirement[0] == "skip-if-crc32"], 'crc32')
+
 	for requirement in requirementsList:
 		if requirement[0] == "skip-if-exists":
 			gotSkipIfExists = True
@@ -49,10 +57,10 @@ def parseRequirementsList(scanPath, requirementsListString):
 			path = os.path.join(scanPath, requirement[1])
 			targetCRC32 = requirement[2]
 
-			if not os.path.exists(path):
+			crc = crc32s[path]
+			if crc is None:
 				return True, "[{}] is missing".format(os.path.basename(path))
 
-			crc = common.crc32_of_file(path).lower()
 			target = targetCRC32.lower()
 			if crc != target:
 				return True, "Not Installed ([{}] is {} expect {})".format(os.path.basename(path), crc, target)
@@ -69,7 +77,6 @@ def parseRequirementsList(scanPath, requirementsListString):
 
 
 class VersionManager:
-	cachedRemoteVersionInfo = {} #type: Dict[str, SubModVersionInfo]
 	localVersionFileName = "installedVersionData.json"
 	def userDidPartialReinstall(self, gameInstallTimeProbePath):
 		"""
@@ -88,12 +95,20 @@ class VersionManager:
 		# For the version file, the "modified" date is when the game mod was last applied
 		return os.path.getctime(gameInstallTimeProbePath) > os.path.getmtime(self.localVersionFilePath)
 
-	def __init__(self, fullInstallConfiguration, modFileList, localVersionFolder, datadir=None, _testRemoteSubModVersion=None, verbosePrinting=True):
-		#type: (installConfiguration.FullInstallConfiguration, List[installConfiguration.ModFile], str, Optional[str], Optional[SubModVersionInfo], bool) -> None
+	def __init__(self, fullInstallConfiguration, modFileList, localVersionFolder, datadir=None, _testRemoteSubModVersion=None, verbosePrinting=True, verifyInstalledFiles=True):
+		#type: (installConfiguration.FullInstallConfiguration, List[installConfiguration.ModFile], str, Optional[str], Optional[SubModVersionInfo], bool, bool) -> None
+		"""
+		:param verifyInstalledFiles: If False, repair mode doesn't check the installed files against the install manifest
+		(which can take a while). Files with entries in the manifest are marked as needing an update, with a reason saying
+		they will be checked when the install starts, and other files are marked if they are 'installOnRepair'.
+		Use this for previews of an install, as the install itself decides which files are re-installed.
+		"""
 		subMod = fullInstallConfiguration.subModConfig # type: installConfiguration.SubModConfig
 		self.verbosePrinting = verbosePrinting
 		self.targetID = subMod.modName + '/' + subMod.subModName
 		self.unfilteredModFileList = modFileList
+		# The ids of the files which have finished installing so far (see saveVersionCheckpoint())
+		self.checkpointedFileIDs = set()  # type: Set[str]
 		self.localVersionFilePath = os.path.join(localVersionFolder, VersionManager.localVersionFileName)
 
 		modOptionParser = installConfiguration.ModOptionParser(fullInstallConfiguration)
@@ -113,11 +128,8 @@ class VersionManager:
 			self.remoteVersionInfo = _testRemoteSubModVersion
 		else:
 			try:
-				# Cache the remote version info to avoid continuously re-downloading it
-				self.remoteVersionInfo = VersionManager.cachedRemoteVersionInfo.get(self.targetID)
-				if self.remoteVersionInfo is None:
-					self.remoteVersionInfo = getRemoteVersion(self.targetID)
-					VersionManager.cachedRemoteVersionInfo[self.targetID] = self.remoteVersionInfo
+				# The version data is only re-parsed if it has changed (see VersionDataStore)
+				self.remoteVersionInfo = getRemoteVersion(self.targetID)
 			except Exception as error:
 				self.remoteVersionInfo = None
 				print("VersionManager: Error while retrieving remote version information {}".format(error))
@@ -138,8 +150,27 @@ class VersionManager:
 			if subMod.family == "higurashi" and modOptionParser.languagePatchIsEnabled:
 				forceUpdateList.append(ForceUpdate('script', 'Language patch option forces script re-install'))
 
+			verifyWithManifest = modOptionParser.repairMode and common.Globals.REPAIR_VERIFY_WITH_MANIFEST
+			manifest = None
+			if verifyWithManifest or common.Globals.UPDATE_ONLY_DEPENDENT_FILES:
+				manifest = installManifest.loadInstallManifest(localVersionFolder)
+
+			# In repair mode, check which installed files are missing or modified, so only those files are re-installed
+			verificationResult = None
+			verifyLaterSourceIDs = None
+			if verifyWithManifest and manifest is not None:
+				if verifyInstalledFiles:
+					verificationResult = installManifest.verifyInstalledFiles(localVersionFolder, manifest)
+				else:
+					verifyLaterSourceIDs = manifest.sources()
+
+			# Only re-install files which overwrote an updated file during the last install (if this was recorded)
+			installedOverlaps = None
+			if common.Globals.UPDATE_ONLY_DEPENDENT_FILES and manifest is not None:
+				installedOverlaps = manifest.overlaps
+
 			# Mark files which need update
-			self.updatesRequiredDict = getFilesNeedingUpdate(self.unfilteredModFileList, self.localVersionInfo, self.remoteVersionInfo, repairMode=modOptionParser.repairMode, forceUpdateList=forceUpdateList)
+			self.updatesRequiredDict = getFilesNeedingUpdate(self.unfilteredModFileList, self.localVersionInfo, self.remoteVersionInfo, repairMode=modOptionParser.repairMode, forceUpdateList=forceUpdateList, verificationResult=verificationResult, installedOverlaps=installedOverlaps, verifyLaterSourceIDs=verifyLaterSourceIDs)
 
 			if verbosePrinting:
 				print("\nInstaller Update Information:")
@@ -196,11 +227,51 @@ class VersionManager:
 			print("VersionManager: Not saving local version info as this is the 'first' install")
 			return
 
+		if common.Globals.CHECKPOINT_INSTALLED_FILE_VERSIONS and self.remoteVersionInfo is not None:
+			# Remove the files which are about to be installed. They are added back as each one finishes installing
+			# (see saveVersionCheckpoint()), so if the install is stopped, only the unfinished files are installed next time.
+			self.saveVersionCheckpoint()
+			return
+
 		# Update the existing version info with new install id, in case the game/mod variant changed
 		self.localVersionInfo.serialize(self.localVersionFilePath, lastAttemptedInstallID=self.remoteVersionInfo.id)
 
+	def saveVersionCheckpoint(self, installedFileID=None, installedFiles=None):
+		#type: (Optional[str], Optional[installManifest.InstallManifest]) -> None
+		"""
+		Save the version file part way through an install. It contains the files which didn't need an update, plus the
+		files which have finished installing so far. Only call this once a file's archives have all been extracted into
+		the game folder (not into a separate extraction folder).
+		:param installedFileID: The id of a file which has just finished installing, if any. Other ids (eg. the names of
+		mod options) are ignored.
+		:param installedFiles: If given, the files written so far are also saved to the install manifest (see installManifest.py)
+		"""
+		if not common.Globals.CHECKPOINT_INSTALLED_FILE_VERSIONS or self.remoteVersionInfo is None:
+			return
+
+		if installedFileID is not None:
+			self.checkpointedFileIDs.add(installedFileID)
+
+		if installedFiles is not None:
+			installManifest.saveInstallManifest(os.path.dirname(self.localVersionFilePath), installedFiles, replaceExisting=self.fullUpdateRequired())
+
+		idsToSerialize = set(f.id for f in self.unfilteredModFileList if not self.updatesRequiredDict[f.id][0]) | self.checkpointedFileIDs
+		self.remoteVersionInfo.serialize(self.localVersionFilePath,
+		                                 lastAttemptedInstallID=self.remoteVersionInfo.id,
+		                                 idsToSerialize=idsToSerialize)
+
 	# When install finishes, copy the remoteVersionInfo
-	def saveVersionInstallFinished(self, forcedSaveFolder=None):
+	def saveVersionInstallFinished(self, forcedSaveFolder=None, installedFiles=None):
+		#type: (Optional[str], Optional[installManifest.InstallManifest]) -> None
+		"""
+		:param installedFiles: If given, the files written by this install are saved to the install manifest,
+		next to the version file (see installManifest.py)
+		"""
+		if installedFiles is not None:
+			installManifest.saveInstallManifest(os.path.dirname(self.localVersionFilePath) if forcedSaveFolder is None else forcedSaveFolder,
+			                                    installedFiles,
+			                                    replaceExisting=self.fullUpdateRequired())
+
 		if self.remoteVersionInfo is None:
 			print("VersionManager: ERROR: Not saving remote version info as it couldn't be retrieved from server")
 			return
@@ -269,30 +340,84 @@ def getLocalVersion(localVersionFilePath):
 	return None if localVersionObject is None else SubModVersionInfo(localVersionObject)
 
 
-def getRemoteVersion(remoteTargetID):
-	# Get remote version
-	if common.Globals.DEVELOPER_MODE and os.path.exists("versionData.json"):
-		allRemoteVersions, remoteError = common.getJSON("versionData.json", isURL=False)
-	else:
-		allRemoteVersions, remoteError = common.getJSON(common.Globals.META_PATH__VERSION_DATA, isURL=False)
+class VersionDataStore:
+	"""
+	Parses versionData.json once into a SubModVersionInfo for each mod-subMod pair, indexed by id, so that creating a
+	VersionManager (eg. each time the GUI previews an install) doesn't re-read the whole file.
+
+	Each time the version data is requested, the file's size and modified time are checked. If they have changed
+	(eg. the installer metadata was downloaded again), the file is hashed, and only re-parsed if its contents changed.
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.path = None  # type: Optional[str]
+		self.statKey = None  # type: Optional[Tuple[int, float]]
+		self.sha256 = None  # type: Optional[str]
+		self.versionsByID = {}  # type: Dict[str, SubModVersionInfo]
+
+	@staticmethod
+	def _getVersionDataPath():
+		# type: () -> str
+		if common.Globals.DEVELOPER_MODE and os.path.exists("versionData.json"):
+			return "versionData.json"
+
+		return common.Globals.META_PATH__VERSION_DATA
+
+	def _reloadIfChanged(self, path):
+		# type: (str) -> None
+		fileStat = os.stat(path)
+		statKey = (fileStat.st_size, fileStat.st_mtime)
+		if path == self.path and statKey == self.statKey:
+			return
+
+		with io.open(path, 'rb') as f:
+			versionDataBytes = f.read()
+
+		sha256 = hashlib.sha256(versionDataBytes).hexdigest()
+		if path != self.path or sha256 != self.sha256:
+			# The remote JSON stores a version dict for each mod-subMod pair. If an id is duplicated, the first one is used.
+			versionsByID = {}  # type: Dict[str, SubModVersionInfo]
+			for remoteVersion in json.loads(versionDataBytes.decode('utf-8')):
+				if remoteVersion['id'] not in versionsByID:
+					versionsByID[remoteVersion['id']] = SubModVersionInfo(remoteVersion)
 
-	if remoteError is not None:
-		print("Error retrieving remote version".format(remoteError))
+			self.versionsByID = versionsByID
+			self.sha256 = sha256
+			self.path = path
+			print("VersionDataStore: Loaded version information for {} mods from [{}]".format(len(versionsByID), path))
 
-	# The remote JSON stores a version dict for each mod-subMod pair. Extract only the one that we want
-	remoteVersionObject = None
-	if allRemoteVersions is not None:
-		for remoteVersion in allRemoteVersions:
-			if remoteVersion['id'] == remoteTargetID:
-				remoteVersionObject = remoteVersion
-				break
+		self.statKey = statKey
+
+	def get(self, remoteTargetID):
+		# type: (str) -> Optional[SubModVersionInfo]
+		"""
+		:return: The version information for the given mod-subMod pair (like "Onikakushi Ch.1/full"),
+		or None if it is not in the version data
+		"""
+		with self.lock:
+			try:
+				self._reloadIfChanged(VersionDataStore._getVersionDataPath())
+			except Exception as remoteError:
+				# Don't use the old version data, as it may be out of date
+				self.path = None
+				self.versionsByID = {}
+				print("Error retrieving remote version: {}".format(remoteError))
+
+			return self.versionsByID.get(remoteTargetID)
+
+
+_versionDataStore = VersionDataStore()
+
+def getRemoteVersion(remoteTargetID):
+	#type: (str) -> SubModVersionInfo
+	remoteVersionInfo = _versionDataStore.get(remoteTargetID)
 
 	# In theory can always re-install everything if can't get the remote server, but most likely it means
 	# remote version this indicates an error with the server, so halt if this happens.
-	if remoteVersionObject is None:
+	if remoteVersionInfo is None:
 		raise Exception("Can't get version information for {} from server! Installation stopped.".format(remoteTargetID))
 
-	return SubModVersionInfo(remoteVersionObject)
+	return remoteVersionInfo
 
 class ForceUpdate:
 	def __init__(self, name, reason):
@@ -301,13 +426,21 @@ class ForceUpdate:
 		self.reason = reason
 
 # given a mod
-def getFilesNeedingUpdate(modFileList, localVersionInfo, remoteVersionInfo, repairMode, forceUpdateList=None):
-	#type: (List[installConfiguration.ModFile], SubModVersionInfo, SubModVersionInfo, bool, Optional[list[ForceUpdate]]) -> Dict[str, Tuple[bool, str]]
+def getFilesNeedingUpdate(modFileList, localVersionInfo, remoteVersionInfo, repairMode, forceUpdateList=None, verificationResult=None, installedOverlaps=None, verifyLaterSourceIDs=None):
+	#type: (List[installConfiguration.ModFile], SubModVersionInfo, SubModVersionInfo, bool, Optional[list[ForceUpdate]], Optional[installManifest.VerificationResult], Optional[Dict[str, Set[str]]], Optional[Set[str]]) -> Dict[str, Tuple[bool, str]]
 	"""
 
 	:param modFileList:
 	:param localVersionInfo:
 	:param remoteVersionInfo:
+	:param verificationResult: In repair mode, if the installed files were verified against the install manifest,
+	files with entries in the manifest are only re-installed if some of their files are missing or modified
+	:param verifyLaterSourceIDs: In repair mode, if the installed files weren't verified now but will be when the install
+	starts (eg. for the GUI's download preview), the files with entries in the manifest. These are marked as needing
+	an update, with a reason saying the install will only re-install them if their files are missing or modified.
+	:param installedOverlaps: Which files overwrote which other files during the last install
+	(see installManifest.InstallManifest.overlaps). If given, fewer files may be re-installed when a file is updated
+	or repaired (see _addDependentFiles()). Otherwise, every file with a higher priority than an updated file is re-installed.
 	:return: the returned value will contain one entry for each item in the modFileList
 	"""
 
@@ -330,9 +463,14 @@ def getFilesNeedingUpdate(modFileList, localVersionInfo, remoteVersionInfo, repa
 	# - None: The version info is missing on either the local or remote side. Since status is unknown, do an update.
 	# Since we want to be safe, only remove the file if the status is False
 	directUpdateList = []
+	# The files whose new contents may differ from what was installed last time (as opposed to files which are only
+	# re-installed, eg. to repair them)
+	changedFileIDs = set()  # type: Set[str]
 	for file in modFileList:
 		result = updatesRequiredDict.get(file.id)
 		needUpdate, updateReason = (True, "Missing version info") if result is None else result
+		if needUpdate:
+			changedFileIDs.add(file.id)
 
 		# Check for files forced to update via forceUpdateList parameter
 		if not needUpdate and forceUpdateList is not None:
@@ -340,10 +478,20 @@ def getFilesNeedingUpdate(modFileList, localVersionInfo, remoteVersionInfo, repa
 				if file.name == forceUpdate.name:
 					needUpdate = True
 					updateReason = forceUpdate.reason
+					changedFileIDs.add(file.id)
 
-		if not needUpdate and repairMode and file.installOnRepair:
-			needUpdate = True
-			updateReason = "Re-installing as Repair Mode Enabled"
+		if not needUpdate and repairMode:
+			if verificationResult is not None and file.id in verificationResult.verifiedSourceIDs:
+				damagedFiles = verificationResult.damagedFilesBySource.get(file.id)
+				if damagedFiles:
+					needUpdate = True
+					updateReason = "Re-installing as {} files are missing or modified".format(len(damagedFiles))
+			elif verifyLaterSourceIDs is not None and file.id in verifyLaterSourceIDs:
+				needUpdate = True
+				updateReason = "Repair Mode: Only re-installed if its files are missing or modified (checked when the install starts)"
+			elif file.installOnRepair:
+				needUpdate = True
+				updateReason = "Re-installing as Repair Mode Enabled"
 
 		updateDict[file.id] = (needUpdate, updateReason)
 		if needUpdate:
@@ -352,18 +500,96 @@ def getFilesNeedingUpdate(modFileList, localVersionInfo, remoteVersionInfo, repa
 	# Add dependencies of the above files which need updates to the update set
 	# For example, if there is an "graphics-update" pack, it must always overwrite the "graphics" pack,
 	# even if it has not changed.
-	debug_dependency_list = []
-	for file in directUpdateList:
-		for otherFile in modFileList:
-			if otherFile.priority > file.priority:
-				# don't overwrite existing reason if the item is already to be updated
-				if updateDict[otherFile.id][0] is not True:
-					debug_dependency_list.append(otherFile.id)
-					updateDict[otherFile.id] = (True, "{} is a dependency of {}".format(otherFile.id, file.id))
+	if installedOverlaps is None:
+		_addHigherPriorityFiles(modFileList, directUpdateList, updateDict)
+	else:
+		_addDependentFiles(modFileList, installedOverlaps, changedFileIDs, updateDict)
 
 	# At this point, updateDict will contain one entry for each file in modFileList
 	return updateDict
 
+def _addHigherPriorityFiles(modFileList, directUpdateList, updateDict):
+	#type: (List[installConfiguration.ModFile], List[installConfiguration.ModFile], Dict[str, Tuple[bool, str]]) -> None
+	"""
+	Mark every file with a higher priority than any file in directUpdateList as needing an update,
+	giving the first such file in directUpdateList as the reason
+	"""
+	# The lowest priority of directUpdateList[:i+1], negated so the list is ascending and can be binary searched
+	negatedLowestPriorities = []
+	for file in directUpdateList:
+		negatedPriority = -file.priority
+		if negatedLowestPriorities:
+			negatedPriority = max(negatedPriority, negatedLowestPriorities[-1])
+		negatedLowestPriorities.append(negatedPriority)
+
+	for otherFile in modFileList:
+		# don't overwrite existing reason if the item is already to be updated
+		if updateDict[otherFile.id][0] is True:
+			continue
+
+		# Find the first updated file with a lower priority than otherFile
+		i = bisect.bisect_right(negatedLowestPriorities, -otherFile.priority)
+		if i < len(directUpdateList):
+			updateDict[otherFile.id] = (True, "{} is a dependency of {}".format(otherFile.id, directUpdateList[i].id))
+
+def _addDependentFiles(modFileList, installedOverlaps, changedFileIDs, updateDict):
+	#type: (List[installConfiguration.ModFile], Dict[str, Set[str]], Set[str], Dict[str, Tuple[bool, str]]) -> None
+	"""
+	Mark every file which depends on a file needing an update as also needing an update. File B depends on file A if:
+	- B lists A's name in 'dependsOn', or
+	- B overwrote some of A's files during the last install (according to installedOverlaps)
+
+	The overlaps only describe the files which were installed last time. If A has changed (is in changedFileIDs), its
+	new version may contain files which a higher priority file also contains, so the overlaps can't be used to skip any
+	files. In that case, the dependencies are only narrowed if some file lists A in 'dependsOn' (the mod declares which
+	files must be installed after A) - otherwise every higher priority file is treated as depending on A, as before.
+	The same applies if A has no recorded overlaps (eg. it wasn't installed last time).
+
+	Files are installed in priority order, so B must have a higher priority than A. As every dependency goes from a
+	lower to a higher priority file, visiting the files in priority order is a topological sort of the dependency
+	graph, so each file is visited after everything it depends on.
+	"""
+	filesByID = dict((file.id, file) for file in modFileList)
+	filesByName = {}  # type: Dict[str, List[installConfiguration.ModFile]]
+	for file in modFileList:
+		filesByName.setdefault(file.name, []).append(file)
+
+	dependentsByID = dict((file.id, []) for file in modFileList)  # type: Dict[str, List[installConfiguration.ModFile]]
+	declaredDependencyIDs = set()  # type: Set[str]
+	for file in modFileList:
+		for dependencyName in file.dependsOn:
+			for dependency in filesByName.get(dependencyName, []):
+				if dependency.priority < file.priority:
+					dependentsByID[dependency.id].append(file)
+					declaredDependencyIDs.add(dependency.id)
+				else:
+					print("WARNING: Ignoring dependency of {} on {}, as {} doesn't have a lower priority".format(file.id, dependency.id, dependency.id))
+
+		# Overlaps with files which aren't in modFileList (eg. mod options), or with files which are installed
+		# after this one (so have already been overwritten), don't cause updates
+		for dependencyID in installedOverlaps.get(file.id, ()):
+			dependency = filesByID.get(dependencyID)
+			if dependency is not None and dependency.priority < file.priority:
+				dependentsByID[dependencyID].append(file)
+
+	# The lowest priority file which needs an update, but which might overwrite files the overlaps don't know about
+	unknownOverlapsFile = None  # type: Optional[installConfiguration.ModFile]
+	for file in sorted(modFileList, key=lambda x: x.priority):
+		if updateDict[file.id][0] is not True and unknownOverlapsFile is not None and file.priority > unknownOverlapsFile.priority:
+			updateDict[file.id] = (True, "{} is a dependency of {}".format(file.id, unknownOverlapsFile.id))
+
+		if not updateDict[file.id][0]:
+			continue
+
+		if unknownOverlapsFile is None:
+			if file.id not in installedOverlaps or (file.id in changedFileIDs and file.id not in declaredDependencyIDs):
+				unknownOverlapsFile = file
+
+		for dependent in dependentsByID[file.id]:
+			# don't overwrite existing reason if the item is already to be updated
+			if updateDict[dependent.id][0] is not True:
+				updateDict[dependent.id] = (True, "{} is a dependency of {}".format(dependent.id, file.id))
+
 class SubModVersionInfo:
 	def __init__(self, jsonObject):
 		"""
@@ -394,8 +620,8 @@ class SubModVersionInfo:
 
 		json_string = json.dumps(obj, ensure_ascii=False, indent=4, sort_keys=True)
 
-		with io.open(path, 'w', encoding='utf-8') as file:
-			file.write(json_string)
+		# This is saved after each file is installed, so it must not be left half-written if the install is stopped
+		common.atomicWriteText(path, json_string)
 
 	# There are five cases when a file should be installed:
 	# - There is no previous install info
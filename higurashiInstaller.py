@@ -6,17 +6,19 @@ import traceback
 
 import commandLineParser
 import common
+import directoryMover
 import os, os.path as path, shutil, subprocess, glob, stat
 
 ########################################## Installer Functions  and Classes ############################################
 import fileVersionManagement
 import gameScanner
 import installConfiguration
+import installJournal
 import logger
 import steamGridExtractor
 
 try:
-	from typing import Optional
+	from typing import Optional, Callable
 except:
 	pass
 
@@ -171,18 +173,32 @@ class Installer:
 		self.downloaderAndExtractor = common.DownloaderAndExtractor(modFileList=modFileList,
 		                                                            downloadTempDir=self.downloadDir,
 		                                                            extractionDir=self.extractDir,
-		                                                            skipDownload=self.skipDownload)
+		                                                            skipDownload=self.skipDownload,
+		                                                            segmentedDownloads=self.optionParser.segmentedDownloads)
 
 		self.downloaderAndExtractor.buildDownloadAndExtractionList()
 
-		for opt in self.optionParser.downloadAndExtractOptionsByPriority:
-			self.downloaderAndExtractor.addItemManually(
-				url=opt.url,
-				extractionDir=os.path.join(self.extractDir, opt.relativeExtractionPath),
-			)
+		self.downloaderAndExtractor.addItemsManually([
+			(opt.url, os.path.join(self.extractDir, opt.relativeExtractionPath))
+			for opt in self.optionParser.downloadAndExtractOptionsByPriority
+		], sourceIDs=[opt.name for opt in self.optionParser.downloadAndExtractOptionsByPriority])
 
 		self.downloaderAndExtractor.printPreview()
 
+		# If the same install was stopped part way through, continue from the last completed step
+		self.journal = installJournal.openInstallJournal(self.directory, self.fileVersionManager, self.downloaderAndExtractor.extractList)
+		if self.journal is not None and path.normpath(self.extractDir) != path.normpath(self.directory):
+			if not self.journal.isDone(installJournal.STEP_MOVE_FILES) and not path.isdir(self.extractDir):
+				print("Extraction folder [{}] is missing - all files will be extracted again".format(self.extractDir))
+				self.journal.forgetExtractions()
+		self.downloaderAndExtractor.journal = self.journal
+
+		# If files are extracted directly into the game folder, record each mod file as installed as soon as it has been
+		# extracted, so if the install is stopped, it won't be installed again. Otherwise, the files aren't in the game
+		# folder until moveFilesIntoPlace() is called.
+		if path.normpath(self.extractDir) == path.normpath(self.directory):
+			self.downloaderAndExtractor.onSourceExtracted = lambda sourceID: self.fileVersionManager.saveVersionCheckpoint(sourceID, installedFiles=self.downloaderAndExtractor.installedFiles)
+
 	def getBackupPath(self, relativePath):
 			# partialManualInstall is not really supported on MacOS, so just assume output folder is HigurashiEpX_Data
 			if self.forcedExtractDirectory is not None:
@@ -226,6 +242,7 @@ class Installer:
 			try:
 				for mg in glob.glob(compiledScriptsPattern):
 					forceRemove(mg)
+					self.downloaderAndExtractor.installedFiles.recordDeletion(path.relpath(mg, self.directory))
 			except Exception:
 				print('WARNING: Failed to clean up the [{}] compiledScripts'.format(compiledScriptsPattern))
 				traceback.print_exc()
@@ -266,6 +283,9 @@ class Installer:
 	def extractFiles(self):
 		self.downloaderAndExtractor.extract()
 
+	def downloadAndExtractFiles(self, beforeExtraction=None):
+		self.downloaderAndExtractor.downloadAndExtract(beforeExtraction=beforeExtraction)
+
 	def moveFilesIntoPlace(self):
 		"""
 		Moves files from the directory they were extracted to
@@ -360,11 +380,27 @@ class Installer:
 			uiPath = path.join(folderToApply, "sharedassets0.assets")
 			print("Language Patch UI: Will copy UI File {} -> {}".format(bestAltUIPath, uiPath))
 			shutil.copy(bestAltUIPath, uiPath)
+
+			# Otherwise the manifest has the CRC of the UI file from the archive, and repairs would think it was modified
+			installedFiles = self.downloaderAndExtractor.installedFiles
+			uiEntry = installedFiles.get(self._manifestPathInDataFolder(folderToApply, uiPath))
+			if uiEntry is None:
+				uiEntry = installedFiles.get(self._manifestPathInDataFolder(folderToApply, bestAltUIPath))
+			installedFiles.recordFile(self._manifestPathInDataFolder(folderToApply, uiPath), os.path.getsize(uiPath),
+			                          common.crc32_of_file(uiPath), None if uiEntry is None else uiEntry.sourceID)
 			return True
 
 		print("Language Patch UI: No UI/sharedassets0 found for ({},{}) - using default sharedassets0.assets".format(osString, versionString))
 		return True
 
+	def _manifestPathInDataFolder(self, folderToApply, filePath):
+		# type: (str, str) -> str
+		"""
+		The install manifest path of a file in the data folder. Until saveFileVersionInfoFinished(), manifest paths use
+		the data folder name from the archives, even on MacOS where the data folder is renamed when moved into place.
+		"""
+		return path.join(self.info.subModConfig.dataName, path.relpath(filePath, folderToApply))
+
 	def applyLanguagePatchFixesIfNecessary(self):
 		folderToApply = self.dataDirectory
 		if self.forcedExtractDirectory is not None:
@@ -404,6 +440,7 @@ class Installer:
 					if os.path.isfile(altUIPath) and ext.lower() == '.languagespecificassets':
 						print("Removing unused UI file {}".format(altUIPath))
 						os.remove(altUIPath)
+						self.downloaderAndExtractor.installedFiles.recordRemovedFile(self._manifestPathInDataFolder(folderToApply, altUIPath))
 				except Exception as e:
 					print("Failed to remove unused language specific asset [{}] due to {}".format(altUIPath, e))
 
@@ -420,6 +457,10 @@ class Installer:
 		if log:
 			print("_moveDirectoryIntoPlace: '{}' -> '{}'".format(fromDir, toDir))
 
+		if common.Globals.FAST_DIRECTORY_MOVE:
+			directoryMover.moveDirectoryIntoPlace(fromDir, toDir)
+			return
+
 		for file in os.listdir(fromDir):
 			src = path.join(fromDir, file)
 			target = path.join(toDir, file)
@@ -493,7 +534,19 @@ class Installer:
 		self.fileVersionManager.saveVersionInstallStarted()
 
 	def saveFileVersionInfoFinished(self, forcedSaveFolder=None):
-		self.fileVersionManager.saveVersionInstallFinished(forcedSaveFolder)
+		installedFiles = self.downloaderAndExtractor.installedFiles
+		# On MacOS, the data folder is renamed when it is moved into place (see moveFilesIntoPlace())
+		if forcedSaveFolder is None and path.normpath(self.extractDir) != path.normpath(self.directory):
+			installedFiles.moveFolder(self.info.subModConfig.dataName, path.relpath(self.dataDirectory, self.directory))
+
+		self.fileVersionManager.saveVersionInstallFinished(forcedSaveFolder, installedFiles=installedFiles)
+		if self.journal is not None:
+			self.journal.delete()
+
+	def runStepOnce(self, step, function):
+		# type: (str, Callable[[], None]) -> None
+		"""Call function, unless it was already done by a previous (stopped) install (see installJournal.py)"""
+		installJournal.runStepOnce(self.journal, step, function)
 
 def main(fullInstallConfiguration):
 	# type: (installConfiguration.FullInstallConfiguration) -> None
@@ -513,54 +566,63 @@ def main(fullInstallConfiguration):
 	if modOptionParser.partialManualInstall:
 		extractDir = fullInstallConfiguration.subModConfig.modName + " " + fullInstallConfiguration.subModConfig.subModName + " Extracted"
 		installer = Installer(fullInstallConfiguration, extractDirectlyToGameDirectory=False, modOptionParser=modOptionParser, forcedExtractDirectory=extractDir)
-		installer.download()
-		installer.extractFiles()
+		installer.downloadAndExtractFiles()
 		installer.removeResourcesAssetsBackup()
 		if installer.optionParser.installSteamGrid:
 			steamGridExtractor.extractSteamGrid(installer.downloadDir)
-		installer.applyLanguagePatchFixesIfNecessary()
+		installer.runStepOnce(installJournal.STEP_LANGUAGE_PATCH, installer.applyLanguagePatchFixesIfNecessary)
 		installer.saveFileVersionInfoFinished(forcedSaveFolder=extractDir)
 		common.tryShowInFileBrowser(extractDir)
 		common.tryShowInFileBrowser(fullInstallConfiguration.installPath)
 	elif common.Globals.IS_WINDOWS:
 		# On Windows, extract directly to the game directory to avoid path-length issues and speed up install
 		installer = Installer(fullInstallConfiguration, extractDirectlyToGameDirectory=True, modOptionParser=modOptionParser, skipDownload=skipDownload)
+
+		def prepareGameDirectory():
+			installer.saveFileVersionInfoStarted()
+			if not isVoiceOnly:
+				installer.backupFiles()
+				installer.cleanOld()
+			# If any mod options request deletion of a folder, do it before the extraction
+			common.applyDeletions(fullInstallConfiguration.installPath, modOptionParser, installedFiles=installer.downloaderAndExtractor.installedFiles)
+			print("Extracting...")
+
 		print("Downloading...")
-		installer.download()
-		installer.saveFileVersionInfoStarted()
-		if not isVoiceOnly:
-			installer.backupFiles()
-			installer.cleanOld()
-		# If any mod options request deletion of a folder, do it before the extraction
-		common.applyDeletions(fullInstallConfiguration.installPath, modOptionParser)
-		print("Extracting...")
-		installer.extractFiles()
+		# Files extracted by a previous (stopped) install must not be backed up or deleted again
+		installer.downloadAndExtractFiles(beforeExtraction=lambda: installer.runStepOnce(installJournal.STEP_PREPARE_GAME_FOLDER, prepareGameDirectory))
 		commandLineParser.printSeventhModStatusUpdate(97, "Cleaning up...")
 		installer.removeResourcesAssetsBackup()
 		if installer.optionParser.installSteamGrid:
 			steamGridExtractor.extractSteamGrid(installer.downloadDir)
-		installer.applyLanguagePatchFixesIfNecessary()
+		installer.runStepOnce(installJournal.STEP_LANGUAGE_PATCH, installer.applyLanguagePatchFixesIfNecessary)
 		installer.saveFileVersionInfoFinished()
 		installer.cleanup(cleanExtractionDirectory=False, cleanDownloadDirectory=not skipDownload and not keepDownloads)
 	else:
 		installer = Installer(fullInstallConfiguration, extractDirectlyToGameDirectory=False, modOptionParser=modOptionParser, skipDownload=skipDownload)
+
+		def beforeExtraction():
+			installer.saveFileVersionInfoStarted()
+			print("Extracting...")
+
 		print("Downloading...")
-		installer.download()
-		installer.saveFileVersionInfoStarted()
-		print("Extracting...")
-		installer.extractFiles()
+		installer.downloadAndExtractFiles(beforeExtraction=beforeExtraction)
 		commandLineParser.printSeventhModStatusUpdate(85, "Moving files into place...")
-		if not isVoiceOnly:
-			installer.backupFiles()
-			installer.cleanOld()
-		# If any mod options request deletion of a folder, do it before the extraction
-		common.applyDeletions(fullInstallConfiguration.installPath, modOptionParser)
-		installer.moveFilesIntoPlace()
+
+		def prepareGameDirectory():
+			if not isVoiceOnly:
+				installer.backupFiles()
+				installer.cleanOld()
+			# If any mod options request deletion of a folder, do it before the extraction
+			common.applyDeletions(fullInstallConfiguration.installPath, modOptionParser, installedFiles=installer.downloaderAndExtractor.installedFiles)
+
+		# Files moved into place by a previous (stopped) install must not be backed up or deleted again
+		installer.runStepOnce(installJournal.STEP_PREPARE_GAME_FOLDER, prepareGameDirectory)
+		installer.runStepOnce(installJournal.STEP_MOVE_FILES, installer.moveFilesIntoPlace)
 		commandLineParser.printSeventhModStatusUpdate(97, "Cleaning up...")
 		installer.removeResourcesAssetsBackup()
 		if installer.optionParser.installSteamGrid:
 			steamGridExtractor.extractSteamGrid(installer.downloadDir)
-		installer.applyLanguagePatchFixesIfNecessary()
+		installer.runStepOnce(installJournal.STEP_LANGUAGE_PATCH, installer.applyLanguagePatchFixesIfNecessary)
 		installer.saveFileVersionInfoFinished()
 		installer.cleanup(cleanExtractionDirectory=True, cleanDownloadDirectory=not skipDownload and not keepDownloads)
 
@@ -0,0 +1,723 @@
+from __future__ import print_function, unicode_literals
+
+import binascii
+import hashlib
+import io
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+import ariaRPC
+import common
+import fileHasher
+import progressEvents
+
+try:
+	import http.client as httplib
+except ImportError:
+	import httplib
+
+try:
+	from urllib.parse import urlparse, urljoin
+	from urllib.request import getproxies, proxy_bypass
+except ImportError:
+	from urlparse import urlparse, urljoin
+	from urllib import getproxies, proxy_bypass
+
+try:
+	import ssl
+except ImportError:
+	ssl = None
+
+try:
+	from typing import Optional, List, Dict, Callable, Any, Tuple
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+class HTTPDownloaderException(Exception):
+	def __init__(self, errorReason):
+		# type: (str) -> None
+		self.errorReason = errorReason  # type: str
+
+	def __str__(self):
+		return self.errorReason
+
+
+class HTTPStatusException(HTTPDownloaderException):
+	def __init__(self, status, url):
+		# type: (int, str) -> None
+		HTTPDownloaderException.__init__(self, "HTTP error {} downloading [{}]".format(status, url))
+		self.status = status
+
+	def isPermanent(self):
+		# type: () -> bool
+		"""Client errors (like 404 Not Found) won't be fixed by retrying, except for timeouts/rate limiting"""
+		return 400 <= self.status < 500 and self.status not in [408, 429]
+
+
+class PooledResponse:
+	"""
+	Wraps a httplib response. When the response is closed, its connection is returned to the pool if the response
+	was fully read (so the connection can be re-used for the next request), otherwise the connection is closed.
+	"""
+	def __init__(self, pool, connectionKey, connection, response, url):
+		self.pool = pool
+		self.connectionKey = connectionKey
+		self.connection = connection
+		self.response = response
+		self.status = response.status
+		self.url = url
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+	def getheader(self, name, default=None):
+		# type: (str, Optional[str]) -> Optional[str]
+		return self.response.getheader(name, default)
+
+	def read(self, amt=None):
+		if amt is None:
+			return self.response.read()
+		return self.response.read(amt)
+
+	def readAll(self):
+		data = self.response.read()
+		self.close()
+		return data
+
+	def close(self):
+		if self.connection is None:
+			return
+
+		self.pool.release(self.connectionKey, self.connection, self.response)
+		self.connection = None
+
+
+class ConnectionPool:
+	"""
+	A thread-safe pool of persistent (keep-alive) HTTP/HTTPS connections, keyed by (scheme, host, port).
+
+	Re-using connections avoids a new TCP connection and TLS handshake for each request, which is a large part of the
+	time taken to fetch small files. Redirects are followed, and HTTP(S) proxies set in the environment are respected.
+	"""
+	MAX_IDLE_CONNECTIONS_PER_HOST = 8
+	MAX_REDIRECTS = 10
+	REDIRECT_STATUSES = [301, 302, 303, 307, 308]
+
+	def __init__(self, timeout=30):
+		# type: (float) -> None
+		self.timeout = timeout
+		self.lock = threading.Lock()
+		self.idleConnections = {}  # type: Dict[Tuple[str, str, int], List[Any]]
+		self.proxies = getproxies()
+
+	def _newConnection(self, scheme, host, port):
+		proxy = self.proxies.get(scheme)
+		if proxy and proxy_bypass(host):
+			proxy = None
+
+		connectHost, connectPort = host, port
+		if proxy:
+			parsedProxy = urlparse(proxy if '://' in proxy else 'http://' + proxy)
+			connectHost, connectPort = parsedProxy.hostname, parsedProxy.port or 8080
+
+		if scheme == 'https':
+			if ssl is None:
+				raise HTTPDownloaderException("Can't download https url - Python SSL module is not available")
+
+			context = common.Globals.getURLOpenContext() or ssl.create_default_context()
+			connection = httplib.HTTPSConnection(connectHost, connectPort, timeout=self.timeout, context=context)
+			if proxy:
+				connection.set_tunnel(host, port)
+		else:
+			connection = httplib.HTTPConnection(connectHost, connectPort, timeout=self.timeout)
+
+		# Plain http requests sent to a proxy must use the absolute url
+		connection.usesHTTPProxy = bool(proxy) and scheme == 'http'
+		return connection
+
+	def _acquire(self, connectionKey):
+		# type: (Tuple[str, str, int]) -> Tuple[Any, bool]
+		""":return: A tuple of (connection, isReusedConnection)"""
+		with self.lock:
+			idle = self.idleConnections.get(connectionKey)
+			if idle:
+				return idle.pop(), True
+
+		return self._newConnection(*connectionKey), False
+
+	def release(self, connectionKey, connection, response):
+		# A connection can only be re-used once the previous response has been completely read
+		if response.isclosed() and not response.will_close:
+			with self.lock:
+				idle = self.idleConnections.setdefault(connectionKey, [])
+				if len(idle) < ConnectionPool.MAX_IDLE_CONNECTIONS_PER_HOST:
+					idle.append(connection)
+					return
+
+		connection.close()
+
+	def closeAll(self):
+		with self.lock:
+			for idle in self.idleConnections.values():
+				for connection in idle:
+					connection.close()
+			self.idleConnections = {}
+
+	def numIdleConnections(self):
+		# type: () -> int
+		with self.lock:
+			return sum(len(idle) for idle in self.idleConnections.values())
+
+	def request(self, method, url, headers=None):
+		# type: (str, str, Optional[Dict[str, str]]) -> PooledResponse
+		"""
+		Sends a request, following any redirects. The returned response must be closed (or fully read with readAll())
+		so that its connection can be returned to the pool.
+		"""
+		allHeaders = {"User-Agent": ""}
+		if headers:
+			allHeaders.update(headers)
+
+		for _ in range(ConnectionPool.MAX_REDIRECTS + 1):
+			parsed = urlparse(url)
+			if parsed.scheme not in ['http', 'https']:
+				raise HTTPDownloaderException("Unsupported url scheme [{}]".format(url))
+
+			port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+			connectionKey = (parsed.scheme, parsed.hostname, port)
+			path = parsed.path or '/'
+			if parsed.query:
+				path += '?' + parsed.query
+
+			connection, isReused = self._acquire(connectionKey)
+			try:
+				response = self._sendRequest(connection, method, url if connection.usesHTTPProxy else path, allHeaders)
+			except (socket.error, httplib.HTTPException):
+				connection.close()
+				if not isReused:
+					raise
+
+				# The server may have closed an idle connection - try again once with a new connection
+				connection = self._newConnection(*connectionKey)
+				response = self._sendRequest(connection, method, url if connection.usesHTTPProxy else path, allHeaders)
+
+			if response.status in ConnectionPool.REDIRECT_STATUSES:
+				location = response.getheader('Location')
+				response.read()
+				self.release(connectionKey, connection, response)
+				if location is None:
+					raise HTTPDownloaderException("Redirect from [{}] has no Location header".format(url))
+
+				url = urljoin(url, location)
+				if response.status == 303:
+					method = 'GET'
+				continue
+
+			return PooledResponse(self, connectionKey, connection, response, url)
+
+		raise HTTPDownloaderException("Too many redirects for url [{}]".format(url))
+
+	@staticmethod
+	def _sendRequest(connection, method, target, headers):
+		connection.request(method, target, headers=headers)
+		return connection.getresponse()
+
+	def fetch(self, url):
+		# type: (str) -> bytes
+		"""Downloads a (small) file into memory. Raises an exception on error."""
+		response = self.request('GET', url)
+		if response.status != 200:
+			response.close()
+			raise HTTPStatusException(response.status, url)
+
+		return response.readAll()
+
+
+_sharedConnectionPool = None
+_sharedConnectionPoolLock = threading.Lock()
+
+def getSharedConnectionPool():
+	# type: () -> ConnectionPool
+	global _sharedConnectionPool
+	with _sharedConnectionPoolLock:
+		if _sharedConnectionPool is None:
+			_sharedConnectionPool = ConnectionPool()
+		return _sharedConnectionPool
+
+
+def _filenameFromResponse(response):
+	# type: (PooledResponse) -> str
+	contentDisposition = response.getheader("Content-Disposition")
+	if contentDisposition:
+		result = re.search(r"filename=(.*)", contentDisposition)
+		if result:
+			return result.group(1).strip().strip('"')
+
+	return os.path.basename(urlparse(response.url).path)
+
+
+def _totalLengthFromResponse(response, startOffset):
+	# type: (PooledResponse, int) -> Optional[int]
+	""":return: the full size of the file being downloaded, or None if unknown"""
+	contentRange = response.getheader("Content-Range")
+	if contentRange:
+		result = re.search(r"/(\d+)", contentRange)
+		if result:
+			return int(result.group(1))
+
+	contentLength = response.getheader("Content-Length")
+	if contentLength is not None:
+		try:
+			return startOffset + int(contentLength)
+		except ValueError:
+			pass
+
+	return None
+
+
+def _totalLengthFromUnsatisfiableRange(response):
+	# type: (PooledResponse) -> Optional[int]
+	"""
+	:return: the full size of the file from a 416 (Range Not Satisfiable) response's 'Content-Range: bytes */N' header,
+	or None if unknown. The Content-Length of a 416 response is the length of the error page, not of the file.
+	"""
+	result = re.match(r"\s*bytes\s+\*/(\d+)\s*$", response.getheader("Content-Range") or "")
+	return int(result.group(1)) if result else None
+
+
+def parseMetalinkHashes(metalinkText):
+	# type: (str) -> Dict[str, Tuple[str, str]]
+	"""
+	:return: A dict mapping each filename in the metalink to its strongest (hashType, hexDigest) pair.
+	hashType uses hashlib naming (eg 'sha256')
+	"""
+	import xml.etree.ElementTree as ET
+
+	hashPreference = ['md5', 'sha1', 'sha256', 'sha512']
+
+	def getTagNoNamespace(tag):
+		return tag.split('}')[-1]
+
+	hashes = {}
+	for fileNode in ET.fromstring(metalinkText).iter():
+		if getTagNoNamespace(fileNode.tag) != 'file':
+			continue
+
+		best = None
+		for child in fileNode.iter():
+			if getTagNoNamespace(child.tag) == 'hash' and child.text:
+				hashType = child.attrib.get('type', '').replace('-', '').lower()
+				if hashType in hashPreference and (best is None or hashPreference.index(hashType) > hashPreference.index(best[0])):
+					best = (hashType, child.text.strip().lower())
+
+		if best is not None:
+			hashes[fileNode.attrib['name']] = best
+
+	return hashes
+
+
+class HTTPDownloader:
+	"""
+	A pure-Python download engine, used when Globals.DOWNLOAD_ENGINE is 'python'.
+
+	Downloads use pooled persistent connections (see ConnectionPool) and are streamed to disk in large chunks.
+	Partially downloaded files are resumed with a Range request. This relies on
+	DownloaderAndExtractor.ExtractableItem.clearDownloadIfNeededAndWriteControlFile() having already deleted any
+	partial download which is out of date (the '.dateModified' control file), in the same way as for aria2c.
+
+	Metalinks are followed, and each file in the metalink is verified against the metalink's hash (if any). A
+	SHA-256 can also be passed to download() for plain urls. Files are hashed as they are downloaded, so verifying
+	a file doesn't require reading it back from disk (except for segmented downloads, which arrive out of order).
+
+	If numConnections > 1 is passed to download(), files larger than Globals.SEGMENTED_DOWNLOAD_MIN_SIZE are
+	downloaded in segments over several connections at once - see SegmentedDownload.
+
+	download() has the same interface as ariaRPC.AriaRPCDownloader.download(), and is thread safe. cancel() stops
+	every download in progress (keeping the partial files, so they can be resumed), and makes any later download() fail.
+	"""
+	CHUNK_SIZE = 1024 * 1024
+	MAX_ATTEMPTS = 5
+	RETRY_WAIT_SECONDS = 5
+	STATUS_INTERVAL_SECONDS = 0.5
+
+	def __init__(self, downloadDir, connectionPool=None):
+		# type: (str, Optional[ConnectionPool]) -> None
+		self.downloadDir = downloadDir
+		self.connectionPool = getSharedConnectionPool() if connectionPool is None else connectionPool
+		self.cancelledEvent = threading.Event()
+
+	def cancel(self):
+		self.cancelledEvent.set()
+
+	def _raiseIfCancelled(self, outputFile):
+		# type: (str) -> None
+		if self.cancelledEvent.is_set():
+			raise HTTPDownloaderException("Download of [{}] was cancelled".format(outputFile))
+
+	def download(self, url, followMetaLink=False, outputFile=None, statusCallback=None, numConnections=1, sha256=None):
+		# type: (str, bool, Optional[str], Optional[Callable[[str], None]], int, Optional[str]) -> int
+		"""
+		Downloads a url (or all files in a metalink), blocking until the download completes or fails.
+
+		:param statusCallback: Called periodically with an aria2c style status line. Defaults to progressEvents.printProgressLine().
+		:param numConnections: The maximum number of connections to use to download each large file
+		:param sha256: If specified, the downloaded file must have this SHA-256 hex digest (not used for metalinks)
+		:return: 0 on success, or 1 on failure, like common.aria()
+		"""
+		if statusCallback is None:
+			statusCallback = progressEvents.printProgressLine
+
+		common.makeDirsExistOK(self.downloadDir)
+
+		try:
+			if not followMetaLink:
+				expectedHash = None if sha256 is None else ('sha256', sha256.lower())
+				self._downloadWithRetries(url, outputFile, expectedHash, statusCallback, numConnections)
+				return 0
+
+			metalinkText = common.ensureUnicodeOrStr(self.connectionPool.fetch(url))
+			metalinkHashes = parseMetalinkHashes(metalinkText)
+			for filename, length, fileURL in common.parseMetalinkFilenames(metalinkText):
+				if fileURL is None:
+					raise HTTPDownloaderException("Metalink [{}] has no url for file [{}]".format(url, filename))
+				self._downloadWithRetries(fileURL, filename, metalinkHashes.get(filename), statusCallback, numConnections)
+
+			return 0
+		except Exception as e:
+			print("HTTPDownloader: Failed to download [{}]: {}".format(url, e))
+			return 1
+
+	def _downloadWithRetries(self, url, outputFile, expectedHash, statusCallback, numConnections):
+		# type: (str, Optional[str], Optional[Tuple[str, str]], Callable[[str], None], int) -> str
+		for attempt in range(1, HTTPDownloader.MAX_ATTEMPTS + 1):
+			try:
+				return self._downloadOnce(url, outputFile, expectedHash, statusCallback, numConnections)
+			except Exception as e:
+				if attempt >= HTTPDownloader.MAX_ATTEMPTS or (isinstance(e, HTTPStatusException) and e.isPermanent()) or self.cancelledEvent.is_set():
+					raise
+
+				print("HTTPDownloader: Attempt {}/{} to download [{}] failed ({}). Resuming in {} seconds..."
+				      .format(attempt, HTTPDownloader.MAX_ATTEMPTS, url, e, HTTPDownloader.RETRY_WAIT_SECONDS))
+				time.sleep(HTTPDownloader.RETRY_WAIT_SECONDS)
+
+	def _downloadOnce(self, url, outputFile, expectedHash, statusCallback, numConnections):
+		# type: (str, Optional[str], Optional[Tuple[str, str]], Callable[[str], None], int) -> str
+		""":return: The path of the downloaded file"""
+		self._raiseIfCancelled(url)
+		gid = binascii.hexlify(hashlib.sha1(url.encode('utf-8')).digest()[:3]).decode('utf-8')
+
+		response = None
+		if outputFile is None:
+			# The filename is only known once the server responds
+			response = self.connectionPool.request('GET', url)
+			outputFile = _filenameFromResponse(response)
+
+		outputPath = os.path.join(self.downloadDir, outputFile)
+
+		# Resume an unfinished segmented download
+		segmentedDownload = SegmentedDownload.load(self.connectionPool, url, outputPath)
+		if segmentedDownload is not None:
+			if response is not None:
+				response.close()
+			print("HTTPDownloader: Resuming segmented download of [{}]".format(outputFile))
+			return self._finishSegmentedDownload(segmentedDownload, gid, numConnections, expectedHash, statusCallback)
+
+		startOffset = os.path.getsize(outputPath) if os.path.isfile(outputPath) else 0
+
+		if startOffset > 0:
+			# Re-request only the missing part of the file
+			if response is not None:
+				response.close()
+			response = self.connectionPool.request('GET', url, headers={'Range': 'bytes={}-'.format(startOffset)})
+		elif response is None:
+			response = self.connectionPool.request('GET', url)
+
+		with response:
+			if response.status == 416:
+				# Range Not Satisfiable - the file has already been completely downloaded
+				totalLength = _totalLengthFromUnsatisfiableRange(response)
+				response.read()
+				if totalLength is not None and totalLength != startOffset:
+					os.remove(outputPath)
+					raise HTTPDownloaderException("Partial download of [{}] is larger than the remote file - restarting".format(outputFile))
+
+				# If the server didn't send the file's size, the file is kept. The hash (if any) is checked below, and
+				# DownloaderAndExtractor checks the file's size against the size it queried before downloading.
+				if totalLength is None:
+					print("HTTPDownloader: Server didn't send the size of [{}] - assuming the existing file is complete".format(outputFile))
+
+				self._verifyHash(outputPath, expectedHash)
+				print("HTTPDownloader: [{}] has already been downloaded".format(outputFile))
+				return outputPath
+
+			if response.status == 200:
+				# Either a new download, or the server doesn't support Range requests - (re)start from the beginning
+				startOffset = 0
+			elif response.status != 206:
+				response.read()
+				raise HTTPStatusException(response.status, url)
+
+			totalLength = _totalLengthFromResponse(response, startOffset)
+			if startOffset > 0:
+				print("HTTPDownloader: Resuming [{}] from {}".format(outputFile, common.prettyPrintFileSize(startOffset)))
+			elif (numConnections > 1 and totalLength is not None and totalLength >= common.Globals.SEGMENTED_DOWNLOAD_MIN_SIZE
+			      and response.getheader('Accept-Ranges', '').lower() == 'bytes'):
+				# Large new download - abandon this response and download in segments instead
+				print("HTTPDownloader: Downloading [{}] ({}) in segments".format(outputFile, common.prettyPrintFileSize(totalLength)))
+				segmentedDownload = SegmentedDownload.create(self.connectionPool, url, outputPath, totalLength, numConnections)
+				return self._finishSegmentedDownload(segmentedDownload, gid, numConnections, expectedHash, statusCallback)
+
+			completedLength = startOffset
+			lastStatusTime = time.time()
+			lastStatusLength = completedLength
+
+			# Hash the file as it is downloaded. When resuming, the already downloaded part must be hashed first.
+			hasher = None
+			if expectedHash is not None:
+				hasher = hashlib.new(expectedHash[0])
+				if startOffset > 0:
+					HTTPDownloader._hashFile(hasher, outputPath)
+
+			# Never overwrite an existing file in place, as it may be hardlinked to the download store
+			if startOffset == 0 and os.path.exists(outputPath):
+				os.remove(outputPath)
+
+			with open(outputPath, 'ab' if startOffset > 0 else 'wb') as f:
+				while True:
+					self._raiseIfCancelled(outputFile)
+					chunk = response.read(HTTPDownloader.CHUNK_SIZE)
+					if not chunk:
+						break
+
+					f.write(chunk)
+					completedLength += len(chunk)
+					if hasher is not None:
+						hasher.update(chunk)
+
+					now = time.time()
+					if now - lastStatusTime >= HTTPDownloader.STATUS_INTERVAL_SECONDS:
+						downloadSpeed = int((completedLength - lastStatusLength) / (now - lastStatusTime))
+						statusCallback(ariaRPC.formatAriaStatusLine(gid, completedLength, totalLength or 0, 1, downloadSpeed))
+						lastStatusTime = now
+						lastStatusLength = completedLength
+
+		if totalLength is not None and completedLength != totalLength:
+			raise HTTPDownloaderException("Download of [{}] ended early ({}/{} bytes)".format(outputFile, completedLength, totalLength))
+
+		if hasher is not None:
+			HTTPDownloader._checkDigest(outputPath, expectedHash, hasher.hexdigest())
+		print("HTTPDownloader: Finished [{}] ({} bytes)".format(outputFile, completedLength))
+		return outputPath
+
+	def _finishSegmentedDownload(self, segmentedDownload, gid, numConnections, expectedHash, statusCallback):
+		# type: (SegmentedDownload, str, int, Optional[Tuple[str, str]], Callable[[str], None]) -> str
+		segmentedDownload.run(numConnections, gid, statusCallback, self.cancelledEvent)
+		self._verifyHash(segmentedDownload.outputPath, expectedHash)
+		print("HTTPDownloader: Finished [{}] ({} bytes)".format(segmentedDownload.outputPath, segmentedDownload.totalLength))
+		return segmentedDownload.outputPath
+
+	@staticmethod
+	def _verifyHash(outputPath, expectedHash):
+		# type: (str, Optional[Tuple[str, str]]) -> None
+		if expectedHash is None:
+			return
+
+		hasher = hashlib.new(expectedHash[0])
+		HTTPDownloader._hashFile(hasher, outputPath)
+		HTTPDownloader._checkDigest(outputPath, expectedHash, hasher.hexdigest())
+
+	@staticmethod
+	def _hashFile(hasher, path):
+		fileHasher.updateFromFile([hasher], path)
+
+	@staticmethod
+	def _checkDigest(outputPath, expectedHash, actualDigest):
+		# type: (str, Tuple[str, str], str) -> None
+		hashType, expectedDigest = expectedHash
+		if actualDigest.lower() != expectedDigest:
+			os.remove(outputPath)
+			raise HTTPDownloaderException("{} of [{}] does not match the expected checksum - file deleted".format(hashType, outputPath))
+
+
+
+class SegmentedDownload:
+	"""
+	Downloads a single file as several byte ranges ('segments') at the same time, each over its own connection.
+
+	The file is pre-allocated to its full size, and each segment writes to its own part of the file.
+	The progress of each segment is saved to a '<filename>.segments' control file (like aria2c's '.aria2' file),
+	so an interrupted download resumes each segment where it left off. The control file is deleted once the download
+	is complete.
+	"""
+	CONTROL_FILE_SUFFIX = '.segments'
+	CONTROL_FILE_SAVE_INTERVAL_SECONDS = 1
+
+	def __init__(self, connectionPool, url, outputPath, totalLength, segments):
+		# type: (ConnectionPool, str, str, int, List[List[int]]) -> None
+		self.connectionPool = connectionPool
+		self.url = url
+		self.outputPath = outputPath
+		self.controlPath = outputPath + SegmentedDownload.CONTROL_FILE_SUFFIX
+		self.totalLength = totalLength
+		# Each segment is a list of [startOffset, length, numBytesDownloaded]
+		self.segments = segments
+		self.lock = threading.Lock()
+		self.lastSaveTime = 0
+		self.error = None  # type: Optional[Exception]
+
+	@staticmethod
+	def create(connectionPool, url, outputPath, totalLength, numSegments):
+		# type: (ConnectionPool, str, str, int, int) -> SegmentedDownload
+		segmentLength = (totalLength + numSegments - 1) // numSegments
+		segments = []
+		for start in range(0, totalLength, segmentLength):
+			segments.append([start, min(segmentLength, totalLength - start), 0])
+
+		if os.path.exists(outputPath):
+			os.remove(outputPath)
+
+		with open(outputPath, 'wb') as f:
+			f.truncate(totalLength)
+
+		segmentedDownload = SegmentedDownload(connectionPool, url, outputPath, totalLength, segments)
+		with segmentedDownload.lock:
+			segmentedDownload._saveControlFile()
+		return segmentedDownload
+
+	@staticmethod
+	def load(connectionPool, url, outputPath):
+		# type: (ConnectionPool, str, str) -> Optional[SegmentedDownload]
+		"""Returns the unfinished segmented download of outputPath, or None if there is no (valid) unfinished download"""
+		controlPath = outputPath + SegmentedDownload.CONTROL_FILE_SUFFIX
+		if not os.path.exists(controlPath):
+			return None
+
+		try:
+			with io.open(controlPath, 'r', encoding='utf-8') as f:
+				control = json.load(f)
+
+			if control['url'] == url and os.path.isfile(outputPath) and os.path.getsize(outputPath) == control['totalLength']:
+				return SegmentedDownload(connectionPool, url, outputPath, control['totalLength'], control['segments'])
+		except Exception as e:
+			print("SegmentedDownload: Failed to load control file [{}]: {}".format(controlPath, e))
+
+		# The control file doesn't match the partial download - start again from scratch
+		print("SegmentedDownload: Discarding partial download [{}]".format(outputPath))
+		for path in [outputPath, controlPath]:
+			if os.path.exists(path):
+				os.remove(path)
+		return None
+
+	def _saveControlFile(self):
+		# Must be called with the lock held
+		tempPath = self.controlPath + '.tmp'
+		with io.open(tempPath, 'w', encoding='utf-8') as f:
+			f.write(common.ensureUnicodeOrStr(json.dumps({'url': self.url, 'totalLength': self.totalLength, 'segments': self.segments})))
+
+		if os.path.exists(self.controlPath):
+			os.remove(self.controlPath)
+		os.rename(tempPath, self.controlPath)
+		self.lastSaveTime = time.time()
+
+	def completedLength(self):
+		# type: () -> int
+		with self.lock:
+			return sum(segment[2] for segment in self.segments)
+
+	def _downloadSegment(self, segment):
+		startOffset, length, _ = segment
+		# Unbuffered, so that data is handed to the OS before it is recorded as downloaded in the control file
+		with io.open(self.outputPath, 'r+b', buffering=0) as f:
+			while segment[2] < length and self.error is None:
+				rangeStart = startOffset + segment[2]
+				response = self.connectionPool.request('GET', self.url, headers={'Range': 'bytes={}-{}'.format(rangeStart, startOffset + length - 1)})
+				with response:
+					if response.status != 206:
+						response.read()
+						raise HTTPStatusException(response.status, self.url)
+
+					f.seek(rangeStart)
+					while segment[2] < length and self.error is None:
+						chunk = response.read(min(HTTPDownloader.CHUNK_SIZE, length - segment[2]))
+						if not chunk:
+							break
+
+						chunkView = memoryview(chunk)
+						while chunkView:
+							chunkView = chunkView[f.write(chunkView):]
+
+						with self.lock:
+							segment[2] += len(chunk)
+							if time.time() - self.lastSaveTime > SegmentedDownload.CONTROL_FILE_SAVE_INTERVAL_SECONDS:
+								self._saveControlFile()
+
+				# If the connection ended early, the rest of the segment is requested again
+				if startOffset + segment[2] == rangeStart:
+					raise HTTPDownloaderException("Server sent no data for segment of [{}]".format(self.url))
+
+	def run(self, numConnections, gid, statusCallback, cancelledEvent=None):
+		# type: (int, str, Callable[[str], None], Optional[threading.Event]) -> None
+		"""
+		Downloads all unfinished segments, using up to numConnections connections at once.
+		If cancelledEvent is set while downloading, the download stops (and can be resumed later) and an error is raised.
+		"""
+		pendingSegments = [segment for segment in self.segments if segment[2] < segment[1]]
+		pendingSegmentsLock = threading.Lock()
+
+		def worker():
+			while self.error is None:
+				with pendingSegmentsLock:
+					if not pendingSegments:
+						return
+					segment = pendingSegments.pop(0)
+
+				try:
+					self._downloadSegment(segment)
+				except Exception as e:
+					with self.lock:
+						if self.error is None:
+							self.error = e
+
+		threads = [threading.Thread(target=worker) for _ in range(max(1, min(numConnections, len(pendingSegments))))]
+		for thread in threads:
+			thread.daemon = True
+			thread.start()
+
+		lastStatusTime = time.time()
+		lastCompletedLength = self.completedLength()
+		while any(thread.is_alive() for thread in threads):
+			aliveThreads = [thread for thread in threads if thread.is_alive()]
+			if aliveThreads:
+				aliveThreads[0].join(HTTPDownloader.STATUS_INTERVAL_SECONDS)
+
+			if cancelledEvent is not None and cancelledEvent.is_set():
+				with self.lock:
+					if self.error is None:
+						self.error = HTTPDownloaderException("Segmented download of [{}] was cancelled".format(self.url))
+
+			now = time.time()
+			completedLength = self.completedLength()
+			downloadSpeed = int((completedLength - lastCompletedLength) / max(now - lastStatusTime, 0.001))
+			numActiveConnections = sum(1 for thread in threads if thread.is_alive())
+			statusCallback(ariaRPC.formatAriaStatusLine(gid, completedLength, self.totalLength, numActiveConnections, downloadSpeed))
+			lastStatusTime = now
+			lastCompletedLength = completedLength
+
+		with self.lock:
+			self._saveControlFile()
+
+		if self.error is not None:
+			raise self.error
+
+		if self.completedLength() != self.totalLength:
+			raise HTTPDownloaderException("Segmented download of [{}] is incomplete".format(self.url))
+
+		os.remove(self.controlPath)
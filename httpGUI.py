@@ -19,6 +19,9 @@ import gameScanner
 import commandLineParser
 import logger
 import installConfiguration
+import libraryUpdatePlanner
+import progressEvents
+import zipExtractor
 import collections
 
 try:
@@ -62,21 +65,9 @@ class ExtractableItemCache:
 			# Get all the URLS not in the cache
 			urlsToQuery = [url for url in urls if url not in self.cache]
 
-			try:
-				# Query URLs in parallel on Python 3
-				import concurrent.futures
-
-				def query(url):
-					return url, common.DownloaderAndExtractor.getExtractableItem(url, '.')
-
-				with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-					for url, extractableItemList in executor.map(query, urlsToQuery):
-						self.cache[url] = extractableItemList
-
-			except ImportError:
-				# Fallback to querying in serial on Python 2
-				for url in urlsToQuery:
-					self.cache[url] = common.DownloaderAndExtractor.getExtractableItem(url, '.')
+			extractableItemLists = common.DownloaderAndExtractor.getExtractableItems([(url, '.') for url in urlsToQuery])
+			for url, extractableItemList in zip(urlsToQuery, extractableItemLists):
+				self.cache[url] = extractableItemList
 		finally:
 			self.lock.release()
 
@@ -653,12 +644,7 @@ def getDownloadPreview(fullInstallConfig, verbosePrinting=True):
 	####### Preview which files are going to be downloaded #######
 
 	# Higurashi installer needs datadirectory set to determine unity version
-	dataDirectory = ""
-	if fullInstallConfig.subModConfig.family == 'higurashi':
-		if common.Globals.IS_MAC:
-			dataDirectory = os.path.join(fullInstallConfig.installPath, "Contents/Resources/Data")
-		else:
-			dataDirectory = os.path.join(fullInstallConfig.installPath, fullInstallConfig.subModConfig.dataName)
+	dataDirectory = libraryUpdatePlanner.getDataDirectory(fullInstallConfig)
 
 	modFileList = fullInstallConfig.buildFileListSorted(
 		datadir=dataDirectory,
@@ -668,15 +654,11 @@ def getDownloadPreview(fullInstallConfig, verbosePrinting=True):
 		modFileList=modFileList,
 		localVersionFolder=fullInstallConfig.installPath,
 		verbosePrinting=False,
-		datadir=dataDirectory)
+		datadir=dataDirectory,
+		verifyInstalledFiles=False)
 
 	# Check for partial re-install (see https://github.com/07th-mod/python-patcher/issues/93)
-	if fullInstallConfig.subModConfig.family == 'higurashi':
-		installTimeProbePath = os.path.join(dataDirectory, 'Managed', 'UnityEngine.dll')
-	elif fullInstallConfig.subModConfig.family == 'umineko':
-		installTimeProbePath = os.path.join(fullInstallConfig.installPath, 'fonts', 'oldface0.ttf')
-	else:
-		installTimeProbePath = None
+	installTimeProbePath = libraryUpdatePlanner.getInstallTimeProbePath(fullInstallConfig, dataDirectory)
 
 	if installTimeProbePath is None:
 		partialReinstallDetected = False
@@ -946,6 +928,33 @@ class InstallerGUI:
 					'partiallyUninstalledPaths': partiallyUninstalledPaths, # Game installs which have been partially uninstalled via Steam, but where some mod files still exist on disk
 				}
 
+			# requestData: Not necessary - will be ignored
+			# responseData: The update status of every game install detected on the computer, for every submod
+			#               (see libraryUpdatePlanner.UpdatePlan). Each plan has the same id/path as the
+			#               fullInstallConfigHandles returned by getGamePathsHandler()
+			def getLibraryUpdatePlansHandler(requestData):
+				fullInstallConfigs, _ = gameScanner.scanForFullInstallConfigs(self.allSubModConfigs)
+				updatePlans = []
+				for plan in libraryUpdatePlanner.planLibraryUpdates(fullInstallConfigs):
+					updatePlans.append(
+						{
+							'id': plan.fullInstallConfig.subModConfig.id,
+							'modName': plan.fullInstallConfig.subModConfig.modName,
+							'subModName': plan.fullInstallConfig.subModConfig.subModName,
+							'path': plan.fullInstallConfig.installPath,
+							'status': plan.status,
+							'numUpdatesRequired': plan.numUpdatesRequired,
+							'totalDownloadSize': common.prettyPrintFileSize(plan.totalDownload),
+							'updateReasons': [{'id': modFileID, 'updateReason': updateReason} for modFileID, updateReason in plan.updateReasons],
+							'partialReinstallDetected': plan.partialReinstallDetected,
+							'error': plan.error,
+						}
+					)
+
+				return {
+					'updatePlans': updatePlans,
+				}
+
 			#TODO: for security reasons, can't get full path from browser. Either need to copy paste, or open a
 			# tk window . Adding a tk window would then require tk dependencies (no problem except requring tk on linux)
 
@@ -1018,6 +1027,8 @@ class InstallerGUI:
 			# responseData: Returns a list of dictionaries. Each dictionary may have different fields depending on the
 			#               type of status returned.
 			#               Please check the _loggerMessageToStatusDict() function for a full list of fields.
+			#               Frequent progress updates are coalesced, so only the latest progress is returned
+			#               (see progressEvents.ProgressEventBus.takeSnapshot()).
 			def statusUpdate(requestData):
 				# If there was an exception on the installer thread, re-raise it on this main thread to display it.
 				if self.threadException:
@@ -1025,7 +1036,7 @@ class InstallerGUI:
 					self.threadException = None
 					raise e
 
-				return [_loggerMessageToStatusDict(x) for x in logger.getGlobalLogger().threadSafeReadAll()]
+				return progressEvents.getEventBus().takeSnapshot(_loggerMessageToStatusDict)
 
 			# This causes a TKInter window to open allowing the user to choose a game path.
 			# The request data should be the submod ID.
@@ -1151,6 +1162,7 @@ class InstallerGUI:
 				'setModName' : setModName,
 				'subModHandles' : getSubModHandlesRequestHandler,
 				'gamePaths' : getGamePathsHandler,
+				'libraryUpdatePlans' : getLibraryUpdatePlansHandler,
 				'startInstall' : startInstallHandler,
 				'statusUpdate' : statusUpdate,
 				'troubleshoot' : troubleshoot,
@@ -1176,6 +1188,9 @@ class InstallerGUI:
 				if isinstance(exception, common.SevenZipException):
 					errorReason += 'SevenZip Extraction Failed - See Details'
 
+				if isinstance(exception, zipExtractor.ZipExtractionException):
+					errorReason += 'Zip Extraction Failed - See Details'
+
 				if isinstance(exception, common.DownloadAndVerifyError):
 					errorReason += 'Download and Verify stage Failed - See Details'
 
@@ -1,8 +1,8 @@
 from __future__ import unicode_literals
 
 import os
-import hashlib
 import common
+import fileHasher
 from datetime import datetime
 
 try:
@@ -14,10 +14,7 @@ except:
 def getSHA256(path):
 	"""Gets the SHA256 Hex digest of a file at path as a string,
 	e.g. '9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08'"""
-	with open(path, "rb") as file:
-		m = hashlib.sha256()
-		m.update(file.read())
-		return m.hexdigest()
+	return fileHasher.cachedHashFile(path, 'sha256')
 
 def getUnityVersion(datadir, verbosePrinting=True, ignoreBackupAssets=False):
 	# type: (str, bool) -> str
@@ -67,14 +64,16 @@ def higurashiWindowsExecutableExists(dataName, installPath):
 def checkChecksumListMatches(installPath, checksumList):
 	#type: (str, List[(str, str)]) -> bool
 	"""Returns true if any checksum in the checksum list matches"""
+	# Hash all the files at once, rather than one by one
+	checksums = fileHasher.hashFiles([os.path.join(installPath, relativePath) for relativePath, _ in checksumList], 'sha256')
+
 	for relativePath, checksum in checksumList:
 		path = os.path.join(installPath, relativePath)
-		if not os.path.exists(path):
+		actualChecksum = checksums[path]
+		if actualChecksum is None:
 			print("checkChecksumListMatches(): File at {} does not exist, skipping this file".format(path))
 			continue
 
-		actualChecksum = getSHA256(path)
-
 		if actualChecksum.lower() == checksum.lower():
 			print("checkChecksumListMatches(): File at {} has matching checksum {}".format(path, actualChecksum))
 			return True
@@ -145,7 +144,7 @@ class FullInstallConfiguration:
 
 			# for all other overrides, overwrite the value in the filesDict with a new ModFile
 			currentModFile = filesDict[fileOverride.name]
-			filesDict[fileOverride.name] = ModFile(currentModFile.name, fileOverride.url, currentModFile.priority, id=fileOverride.id, relativeExtractionPath=fileOverride.relativeExtractionPath, installOnRepair=currentModFile.installOnRepair, requirementsList=currentModFile.requirementsList)
+			filesDict[fileOverride.name] = ModFile(currentModFile.name, fileOverride.url, currentModFile.priority, id=fileOverride.id, relativeExtractionPath=fileOverride.relativeExtractionPath, installOnRepair=currentModFile.installOnRepair, requirementsList=currentModFile.requirementsList, sha256=fileOverride.sha256, dependsOn=currentModFile.dependsOn)
 
 		# Look for override-required files that weren't overridden
 		for key, value in filesDict.items():
@@ -167,8 +166,8 @@ class FullInstallConfiguration:
 
 class ModFile:
 	modFileCounter = 0
-	def __init__(self, name, url, priority, id=None, relativeExtractionPath=None, skipIfModNewerThan=None, installOnRepair=False, requirementsList=None):
-		# type: (str, Optional[str], int, str, Optional[str], Optional[str], Optional[bool], Optional[List[str]]) -> None
+	def __init__(self, name, url, priority, id=None, relativeExtractionPath=None, skipIfModNewerThan=None, installOnRepair=False, requirementsList=None, sha256=None, dependsOn=None):
+		# type: (str, Optional[str], int, str, Optional[str], Optional[str], Optional[bool], Optional[List[str]], Optional[str], Optional[List[str]]) -> None
 		self.name = name
 		self.url = url
 
@@ -201,9 +200,16 @@ class ModFile:
 		self.requirementsList = requirementsList # type: Optional[List[str]]
 		"""A list of various requirements determining whether the file will be installed"""
 
+		self.sha256 = sha256 # type: Optional[str]
+		"""The SHA-256 of the file at url, if known. Used to verify the download (not used for metalinks)"""
+
+		self.dependsOn = [] if dependsOn is None else dependsOn # type: List[str]
+		"""The names of lower priority files which this file must be re-installed after, as it overwrites some of
+		their files (see fileVersionManagement.getFilesNeedingUpdate())"""
+
 class ModFileOverride:
-	def __init__(self, name, id, os, steam, unity, url, targetChecksums, relativeExtractionPath=None, wine=None):
-		# type: (str, str, List[str], Optional[bool], Optional[str], str, List[Tuple[str, str]], Optional[str], Optional[bool]) -> None
+	def __init__(self, name, id, os, steam, unity, url, targetChecksums, relativeExtractionPath=None, wine=None, sha256=None):
+		# type: (str, str, List[str], Optional[bool], Optional[str], str, List[Tuple[str, str]], Optional[str], Optional[bool], Optional[str]) -> None
 		self.name = name # type: str
 		self.id = id
 		"""A unique identifier among all files and modfiles for this submod. Set manually as 'movie-unix' for example"""
@@ -223,6 +229,8 @@ class ModFileOverride:
 		self.wine = False if wine is None else wine #type: bool
 		"""If set to True, this file override should be installed if the target install is using Wine or Proton
 		even if the OS does not match"""
+		self.sha256 = sha256 #type: Optional[str]
+		"""The SHA-256 of the file at url, if known. Used to verify the download (not used for metalinks)"""
 
 class ModOption:
 	def __init__(self, name, description, group, type, isRadio, data, isGlobal=False, value=False):
@@ -276,6 +284,7 @@ class ModOptionParser:
 		self.downloadManually = False
 		self.forceInstallFromScratch = False
 		self.languagePatchIsEnabled = False
+		self.segmentedDownloads = False
 
 		# Sort according to priority - higher priority items will be extracted later, overwriting lower priority items.
 		for modOption in self.config.subModConfig.modOptions:
@@ -304,6 +313,8 @@ class ModOptionParser:
 					self.downloadManually = True
 				elif modOption.type == 'forceInstallFromScratch':
 					self.forceInstallFromScratch = True
+				elif modOption.type == 'segmentedDownloads':
+					self.segmentedDownloads = True
 
 		# Make sure download and extraction options are sorted
 		self.downloadAndExtractOptionsByPriority.sort(key=lambda opt: opt.priority)
@@ -348,7 +359,9 @@ class SubModConfig:
 				relativeExtractionPath=subModFile.get('relativeExtractionPath'),
 				skipIfModNewerThan=subModFile.get('skipIfModNewerThan'),
 				installOnRepair=subModFile.get('installOnRepair', False),
-				requirementsList=subModFile.get('requirementsList')
+				requirementsList=subModFile.get('requirementsList'),
+				sha256=subModFile.get('sha256'),
+				dependsOn=subModFile.get('dependsOn')
 			))
 
 		self.fileOverrides = [] # type: List[ModFileOverride]
@@ -362,7 +375,8 @@ class SubModConfig:
 				id=subModFileOverride['id'],
 				targetChecksums=subModFileOverride.get('targetChecksums'),
 				relativeExtractionPath=subModFileOverride.get('relativeExtractionPath'),
-				wine=subModFileOverride.get('wine')
+				wine=subModFileOverride.get('wine'),
+				sha256=subModFileOverride.get('sha256')
 			))
 
 		# If no mod options are specified in the JSON, the 'self.modOptions' field defaults to the empty list ([])
@@ -488,6 +502,19 @@ Use this option:
 		                                 data=None,
 		                                 isGlobal=True))
 
+		self.modOptions.append(ModOption(name="Segmented Downloads",
+		                                 description="""Downloads large files (like the voice and graphics archives) over several connections at once, instead of a single connection.
+
+This can make the download much faster if a single connection is limited to less than your full download speed.
+
+Disable this option if you have download problems, or are on a slow or unreliable connection.
+""",
+		                                 group="Experimental Options",
+		                                 type="segmentedDownloads",
+		                                 isRadio=False,
+		                                 data=None,
+		                                 isGlobal=True))
+
 	def __repr__(self):
 		return "Type: [{}] Game Name: [{}]".format(self.modName, self.subModName)
 
@@ -0,0 +1,180 @@
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import io
+import json
+import os
+import threading
+import traceback
+
+import common
+
+try:
+	from typing import Optional, List, Dict, Set, Any, Callable
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+JOURNAL_FILENAME = "installJournal.json"
+
+# Steps of an install which don't depend on a particular download. Each installer only uses the steps it needs.
+STEP_PREPARE_GAME_FOLDER = 'prepareGameFolder'  # Backing up/deleting old files, and applying mod option deletions
+STEP_MOVE_FILES = 'moveFiles'                   # Moving the extracted files into the game folder
+STEP_LANGUAGE_PATCH = 'languagePatch'           # Applying the language patch fixes
+
+
+def downloadStep(url):
+	# type: (str) -> str
+	"""The step recorded once a url has been downloaded and verified"""
+	return 'download:' + url
+
+def extractStep(extractableItem):
+	# type: (common.DownloaderAndExtractor.ExtractableItem) -> str
+	"""The step recorded once a downloaded file has been extracted (or copied) to its destination"""
+	return 'extract:{}:{}'.format(extractableItem.filename, extractableItem.destinationPath)
+
+def makePlanID(targetID, remoteVersionInfo, extractList, modFileIDs):
+	# type: (str, Any, List[common.DownloaderAndExtractor.ExtractableItem], Set[str]) -> str
+	"""
+	Identifies what an install is going to do - the mod being installed, the version of each file, and the mod options
+	which will be downloaded and extracted. A journal is only resumed by an install with the same plan.
+
+	Which mod files are installed is deliberately not part of the plan. It shrinks as each file is checkpointed in the
+	version file (see fileVersionManagement.VersionManager.saveVersionCheckpoint()), and the journal must still be resumed
+	by the next install. Downloads and extractions are recorded per item, so those of files which are no longer
+	installed are just not used.
+	:param modFileIDs: The ids of every mod file, used to tell the mod option items in extractList apart
+	"""
+	plan = {
+		'targetID': targetID,
+		'versions': sorted([fileVersion.id, fileVersion.version] for fileVersion in remoteVersionInfo.fileVersionsDict.values()),
+		'options': [[item.sourceID, item.filename, item.destinationPath] for item in extractList if item.sourceID not in modFileIDs],
+	}
+	return hashlib.sha256(json.dumps(plan, sort_keys=True).encode('utf-8')).hexdigest()
+
+class InstallJournal:
+	"""
+	Records each step of an install as soon as it completes, so that if the install is stopped part way through
+	(eg. the computer is turned off while extracting), running the same install again continues from the last completed
+	step, instead of downloading and extracting everything again.
+
+	The journal is saved in the game folder, and each installer deletes it once the install has finished and the
+	version file has been saved. It is rewritten (atomically) after every step, so it always contains either all or
+	none of each step.
+
+	Steps are recorded with optional data, for example the filename and size of each file which was downloaded, like:
+	{"version": 1, "planID": "<hash>", "steps": {"download:https://07th-mod.com/voices.7z": [["voices.7z", 1234]], "moveFiles": null}}
+	"""
+	VERSION = 1
+
+	def __init__(self, journalPath, planID):
+		# type: (str, str) -> None
+		self.journalPath = journalPath
+		self.planID = planID
+		self.lock = threading.Lock()
+		self.steps = self._load()  # type: Dict[str, Any]
+
+		if self.steps:
+			print("InstallJournal: Resuming the previous install - {} steps were already completed".format(len(self.steps)))
+
+	def _load(self):
+		# type: () -> Dict[str, Any]
+		if not os.path.exists(self.journalPath):
+			return {}
+
+		try:
+			with io.open(self.journalPath, 'r', encoding='utf-8') as f:
+				journalJSON = json.load(f)
+
+			if journalJSON.get('version') != InstallJournal.VERSION:
+				print("InstallJournal: Ignoring journal [{}] with different version".format(self.journalPath))
+				return {}
+
+			if journalJSON.get('planID') != self.planID:
+				print("InstallJournal: Ignoring journal [{}] as it is for a different install (eg. the mod was updated, or different options were chosen)".format(self.journalPath))
+				return {}
+
+			return journalJSON['steps']
+		except Exception:
+			print("InstallJournal: Failed to load journal [{}] - the install will start from the beginning".format(self.journalPath))
+			traceback.print_exc()
+			return {}
+
+	def _save(self):
+		# type: () -> None
+		try:
+			common.atomicWriteText(self.journalPath, json.dumps({'version': InstallJournal.VERSION, 'planID': self.planID, 'steps': self.steps}, ensure_ascii=False, sort_keys=True))
+		except Exception:
+			# The journal is only used to resume installs, so don't stop the install if it can't be saved
+			print("InstallJournal: Failed to save journal [{}]".format(self.journalPath))
+			traceback.print_exc()
+
+	def isDone(self, step):
+		# type: (str) -> bool
+		with self.lock:
+			return step in self.steps
+
+	def getData(self, step):
+		# type: (str) -> Any
+		"""The data recorded with the step, or None if the step hasn't been done"""
+		with self.lock:
+			return self.steps.get(step)
+
+	def markDone(self, step, data=None):
+		# type: (str, Any) -> None
+		"""Record that a step has completed, and save the journal. data must be JSON serializable."""
+		with self.lock:
+			self.steps[step] = data
+			self._save()
+
+	def forget(self, steps):
+		# type: (List[str]) -> None
+		"""Mark steps as not done, for example if the files they produced are missing"""
+		with self.lock:
+			forgottenSteps = [step for step in steps if step in self.steps]
+			for step in forgottenSteps:
+				del self.steps[step]
+
+			if forgottenSteps:
+				self._save()
+
+	def forgetExtractions(self):
+		# type: () -> None
+		"""Mark every extraction as not done, for example if the extraction folder was deleted"""
+		with self.lock:
+			steps = [step for step in self.steps if step.startswith('extract:')]
+		self.forget(steps)
+
+	def delete(self):
+		# type: () -> None
+		with self.lock:
+			self.steps = {}
+			if os.path.exists(self.journalPath):
+				os.remove(self.journalPath)
+
+
+def openInstallJournal(folder, fileVersionManager, extractList):
+	# type: (str, Any, List[common.DownloaderAndExtractor.ExtractableItem]) -> Optional[InstallJournal]
+	"""
+	Open the journal for an install into the given folder, which is resumed if it was saved by an install with the same plan.
+	:param fileVersionManager: The install's fileVersionManagement.VersionManager
+	:return: None if Globals.RESUME_INSTALLS_WITH_JOURNAL is False, or the version of the mod files couldn't be retrieved
+	"""
+	if not common.Globals.RESUME_INSTALLS_WITH_JOURNAL or fileVersionManager.remoteVersionInfo is None:
+		return None
+
+	modFileIDs = set(modFile.id for modFile in fileVersionManager.unfilteredModFileList)
+	planID = makePlanID(fileVersionManager.targetID, fileVersionManager.remoteVersionInfo, extractList, modFileIDs)
+	return InstallJournal(os.path.join(folder, JOURNAL_FILENAME), planID)
+
+def runStepOnce(journal, step, function):
+	# type: (Optional[InstallJournal], str, Callable[[], None]) -> None
+	"""Call function, unless the journal shows it was already done by a previous (stopped) install, then record it as done"""
+	if journal is not None and journal.isDone(step):
+		print("InstallJournal: Skipping [{}] as it was done by the previous install".format(step))
+		return
+
+	function()
+
+	if journal is not None:
+		journal.markDone(step)
@@ -0,0 +1,293 @@
+from __future__ import print_function, unicode_literals
+
+import collections
+import io
+import json
+import os
+import time
+import traceback
+
+import common
+import fileHasher
+
+try:
+	from typing import Optional, List, Dict, Tuple, Set
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+MANIFEST_FILENAME = "installedFileManifest.json"
+
+# A file written by the installer. crc32 is a lowercase hex string (like common.crc32_of_file()).
+# sourceID is the id of the ModFile (or the name of the mod option) which the file came from.
+ManifestEntry = collections.namedtuple('ManifestEntry', ['size', 'crc32', 'sourceID'])
+
+
+class InstallManifest:
+	"""
+	Records every file the installer wrote, so that later installs can check, repair, or remove the mod's files
+	without rescanning the whole game folder. It is saved next to the installedVersionData.json version file
+	(see fileVersionManagement.VersionManager.saveVersionInstallFinished()).
+
+	Paths are relative to the game folder, and always use '/' as the separator.
+
+	On disk, the source ids are stored once in a list, and each file refers to its source by index, like:
+	{"version": 1, "sources": ["voices", "graphics"], "files": {"HigurashiEp01_Data/StreamingAssets/CG/a.png": [1234, "1a2b3c4d", 1]}}
+
+	The manifest also records which sources overwrote files from other sources, like {"graphics-update": ["graphics"]}.
+	This is used to work out which mod files must be re-installed when another mod file is updated
+	(see fileVersionManagement.getFilesNeedingUpdate()).
+	"""
+	VERSION = 1
+
+	def __init__(self):
+		self.files = {}  # type: Dict[str, ManifestEntry]
+		# Maps each source which has been recorded to the set of other sources whose files it overwrote,
+		# or None if this isn't known (eg. the manifest was saved by an older version of the installer)
+		self.overlaps = {}  # type: Optional[Dict[str, Set[str]]]
+		# Files and folders (relative to the game folder) which the latest install deleted. This isn't saved - it is only
+		# used to remove their entries from the existing manifest (see saveInstallManifest())
+		self.deletedPaths = set()  # type: Set[str]
+
+	@staticmethod
+	def normalizePath(relativePath):
+		# type: (str) -> str
+		return os.path.normpath(relativePath).replace('\\', '/')
+
+	def recordFile(self, relativePath, size, crc32, sourceID):
+		# type: (str, int, str, Optional[str]) -> None
+		"""Record a file which was written (or which was already up to date), replacing any existing entry for the path"""
+		path = InstallManifest.normalizePath(relativePath)
+		self._recordOverlap(self.files.get(path), sourceID)
+		self.files[path] = ManifestEntry(size, crc32.lower(), sourceID)
+
+	def recordDeletion(self, relativePath):
+		# type: (str) -> None
+		"""Record a file or folder which was deleted by the installer (eg. by a mod option's 'deletePath')"""
+		self.deletedPaths.add(InstallManifest.normalizePath(relativePath))
+
+	def recordRemovedFile(self, relativePath):
+		# type: (str) -> None
+		"""Record a file which this install wrote, then deleted again (eg. the language patch's unused UI files)"""
+		path = InstallManifest.normalizePath(relativePath)
+		self.files.pop(path, None)
+		self.deletedPaths.add(path)
+
+	def removeDeletedPaths(self, deletedPaths):
+		# type: (Set[str]) -> None
+		"""Remove the entries for each deleted file, and for every file in each deleted folder"""
+		if not deletedPaths:
+			return
+
+		self.files = dict(
+			(path, entry) for path, entry in self.files.items()
+			if not any(path == deletedPath or path.startswith(deletedPath + '/') for deletedPath in deletedPaths)
+		)
+
+	def removeSources(self, sourceIDs):
+		# type: (Set[Optional[str]]) -> None
+		"""Remove every file from the given sources, and what they overwrote, eg. before recording a re-install of those sources"""
+		self.files = dict((path, entry) for path, entry in self.files.items() if entry.sourceID not in sourceIDs)
+		if self.overlaps is not None:
+			for sourceID in sourceIDs:
+				self.overlaps.pop(sourceID, None)
+
+	def sources(self):
+		# type: () -> Set[Optional[str]]
+		return set(entry.sourceID for entry in self.files.values())
+
+	def _recordOverlap(self, replacedEntry, sourceID):
+		# type: (Optional[ManifestEntry], Optional[str]) -> None
+		if self.overlaps is None or sourceID is None:
+			return
+
+		overwrittenSources = self.overlaps.setdefault(sourceID, set())
+		if replacedEntry is not None and replacedEntry.sourceID is not None and replacedEntry.sourceID != sourceID:
+			overwrittenSources.add(replacedEntry.sourceID)
+
+	def get(self, relativePath):
+		# type: (str) -> Optional[ManifestEntry]
+		return self.files.get(InstallManifest.normalizePath(relativePath))
+
+	def filesFromSource(self, sourceID):
+		# type: (str) -> List[str]
+		return sorted(path for path, entry in self.files.items() if entry.sourceID == sourceID)
+
+	def update(self, other):
+		# type: (InstallManifest) -> None
+		"""Add all the files from another manifest, replacing any entries for the same path"""
+		if self.overlaps is None or other.overlaps is None:
+			self.overlaps = None
+		else:
+			for sourceID, overwrittenSources in other.overlaps.items():
+				self.overlaps.setdefault(sourceID, set()).update(overwrittenSources)
+
+			for path, entry in other.files.items():
+				self._recordOverlap(self.files.get(path), entry.sourceID)
+
+		self.files.update(other.files)
+
+	def moveFolder(self, oldRelativeFolder, newRelativeFolder):
+		# type: (str, str) -> None
+		"""
+		Change the path of every file in oldRelativeFolder to be in newRelativeFolder instead - for example if the
+		files were recorded in an extraction folder, but the data folder has a different name in the game folder (Mac)
+		"""
+		oldPrefix = InstallManifest.normalizePath(oldRelativeFolder) + '/'
+		newPrefix = InstallManifest.normalizePath(newRelativeFolder) + '/'
+		if oldPrefix == newPrefix:
+			return
+
+		self.files = dict(
+			(newPrefix + path[len(oldPrefix):] if path.startswith(oldPrefix) else path, entry)
+			for path, entry in self.files.items()
+		)
+
+	def toJSON(self):
+		sources = sorted(set(entry.sourceID for entry in self.files.values()), key=lambda x: '' if x is None else x)
+		sourceIndices = dict((sourceID, i) for i, sourceID in enumerate(sources))
+		manifestJSON = {
+			'version': InstallManifest.VERSION,
+			'sources': sources,
+			'files': dict((path, [entry.size, entry.crc32, sourceIndices[entry.sourceID]]) for path, entry in self.files.items()),
+		}
+
+		if self.overlaps is not None:
+			manifestJSON['overlaps'] = dict((sourceID, sorted(overwrittenSources)) for sourceID, overwrittenSources in self.overlaps.items())
+
+		return manifestJSON
+
+	@staticmethod
+	def fromJSON(manifestJSON):
+		manifest = InstallManifest()
+		sources = manifestJSON['sources']
+		for path, (size, crc32, sourceIndex) in manifestJSON['files'].items():
+			manifest.files[path] = ManifestEntry(size, crc32, sources[sourceIndex])
+
+		overlapsJSON = manifestJSON.get('overlaps')
+		manifest.overlaps = None if overlapsJSON is None else dict((sourceID, set(overwrittenSources)) for sourceID, overwrittenSources in overlapsJSON.items())
+		return manifest
+
+	def save(self, manifestPath):
+		# type: (str) -> None
+		common.atomicWriteText(manifestPath, json.dumps(self.toJSON(), ensure_ascii=False, separators=(',', ':'), sort_keys=True))
+
+	@staticmethod
+	def load(manifestPath):
+		# type: (str) -> Optional[InstallManifest]
+		"""Returns None if the manifest doesn't exist or couldn't be read"""
+		if not os.path.exists(manifestPath):
+			return None
+
+		try:
+			with io.open(manifestPath, 'r', encoding='utf-8') as f:
+				manifestJSON = json.load(f)
+
+			if manifestJSON.get('version') != InstallManifest.VERSION:
+				print("InstallManifest: Ignoring manifest [{}] with different version".format(manifestPath))
+				return None
+
+			return InstallManifest.fromJSON(manifestJSON)
+		except Exception:
+			print("InstallManifest: Failed to load manifest [{}]".format(manifestPath))
+			traceback.print_exc()
+			return None
+
+
+class VerificationResult:
+	def __init__(self, verifiedSourceIDs, damagedFilesBySource):
+		# type: (Set[Optional[str]], Dict[Optional[str], List[Tuple[str, str]]]) -> None
+		# The sources which have files in the manifest (and so were checked)
+		self.verifiedSourceIDs = verifiedSourceIDs
+		# For each source with missing or modified files, a list of (relativePath, problem) for each of those files
+		self.damagedFilesBySource = damagedFilesBySource
+
+
+def _checkFile(filePath, entry):
+	# type: (str, ManifestEntry) -> Optional[str]
+	"""Returns None if the file matches the manifest entry, otherwise a description of the problem"""
+	try:
+		if not os.path.isfile(filePath):
+			return "missing"
+
+		size = os.path.getsize(filePath)
+		if size != entry.size:
+			return "size is {} but should be {}".format(size, entry.size)
+
+		crc32 = fileHasher.crc32OfFile(filePath)
+		if crc32 != entry.crc32:
+			return "CRC32 is {} but should be {}".format(crc32, entry.crc32)
+	except (IOError, OSError) as e:
+		return "couldn't be read ({})".format(e)
+
+	return None
+
+def verifyInstalledFiles(folder, manifest, maxWorkers=None):
+	# type: (str, InstallManifest, Optional[int]) -> VerificationResult
+	"""
+	Check each file in the manifest against the files in the game folder. Files are compared by size first,
+	and only hashed if the size matches. Files are hashed in parallel on a thread pool.
+	:param maxWorkers: The number of files to hash at the same time. Defaults to Globals.VERIFY_THREADS
+	"""
+	if maxWorkers is None:
+		maxWorkers = common.Globals.VERIFY_THREADS
+
+	startTime = time.time()
+	paths = sorted(manifest.files)
+
+	def checkPath(relativePath):
+		return _checkFile(os.path.join(folder, relativePath), manifest.files[relativePath])
+
+	problems = common.parallelMap(checkPath, paths, maxWorkers)
+
+	damagedFilesBySource = {}  # type: Dict[Optional[str], List[Tuple[str, str]]]
+	for relativePath, problem in zip(paths, problems):
+		if problem is not None:
+			damagedFilesBySource.setdefault(manifest.files[relativePath].sourceID, []).append((relativePath, problem))
+
+	numDamaged = sum(len(x) for x in damagedFilesBySource.values())
+	print("InstallManifest: Verified {} files in {:.1f}s - {} are missing or modified".format(len(paths), time.time() - startTime, numDamaged))
+	for sourceID, damagedFiles in sorted(damagedFilesBySource.items(), key=lambda x: '' if x[0] is None else x[0]):
+		for relativePath, problem in damagedFiles:
+			print(" - [{}] from [{}]: {}".format(relativePath, sourceID, problem))
+
+	return VerificationResult(set(entry.sourceID for entry in manifest.files.values()), damagedFilesBySource)
+
+def loadInstallManifest(folder):
+	# type: (str) -> Optional[InstallManifest]
+	"""Load the manifest saved in the given folder. Returns None if there is no manifest."""
+	manifest = InstallManifest.load(os.path.join(folder, MANIFEST_FILENAME))
+	if manifest is None:
+		print("InstallManifest: No manifest in [{}]".format(folder))
+
+	return manifest
+
+def saveInstallManifest(folder, installedFiles, replaceExisting):
+	# type: (str, InstallManifest, bool) -> None
+	"""
+	Save the files written by the latest install to the manifest in the given folder.
+	:param installedFiles: The files written by the latest install
+	:param replaceExisting: If True (eg. for a full install), the existing manifest is discarded. Otherwise,
+	the latest install's files are merged into the existing manifest, as files from earlier installs are still there.
+	The existing entries of each source which was re-installed are replaced (as the new version of the source may not
+	contain the same files), and any entries for files the latest install deleted are removed.
+	"""
+	manifestPath = os.path.join(folder, MANIFEST_FILENAME)
+	manifest = None if replaceExisting else InstallManifest.load(manifestPath)
+	if manifest is None:
+		manifest = InstallManifest()
+		if not replaceExisting:
+			# Files from earlier installs weren't recorded, so it's not known which files they overwrote
+			manifest.overlaps = None
+
+	manifest.removeSources(installedFiles.sources() - set([None]))
+	manifest.removeDeletedPaths(installedFiles.deletedPaths)
+	manifest.update(installedFiles)
+
+	try:
+		manifest.save(manifestPath)
+		print("InstallManifest: Saved {} files ({} from this install) to [{}]".format(len(manifest.files), len(installedFiles.files), manifestPath))
+	except Exception:
+		# The manifest is only needed for repairs/updates, so don't fail the install if it can't be saved
+		print("InstallManifest: Failed to save manifest [{}]".format(manifestPath))
+		traceback.print_exc()
@@ -0,0 +1,81 @@
+"""
+Benchmark comparing the previous nested loop in fileVersionManagement.getFilesNeedingUpdate() (which re-installs
+every file with a higher priority than an updated file) with the current implementation, on thousands of synthetic
+mod files where one file in every 20 has changed.
+
+The current implementation is timed both without overlap information (which must give the same result as the nested
+loop), and with overlaps where each file only depends on (and overwrote) the file before it, so far fewer files are
+re-installed.
+
+Run from the repository root with: python installerTests/benchmarkDependencyGraph.py [numFiles]
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fileVersionManagement
+import installConfiguration
+
+
+def makeModFiles(numFiles):
+	# Several files share each priority, like the real installData.json. Each file declares that it depends on a file
+	# with the previous priority, as updated files are only narrowed to their declared dependents.
+	return [installConfiguration.ModFile('file{:05d}'.format(i), None, i // 4, dependsOn=['file{:05d}'.format(i - 4)] if i >= 4 else None)
+	        for i in range(numFiles)]
+
+
+def makeVersionInfo(modFileList, changedEvery=None):
+	return fileVersionManagement.SubModVersionInfo({
+		'id': 'Onikakushi Ch.1/full',
+		'files': [{'id': x.id, 'version': '1.0.1' if changedEvery and i % changedEvery == 0 else '1.0.0'} for i, x in enumerate(modFileList)],
+		'lastAttemptedInstallID': 'Onikakushi Ch.1/full',
+	})
+
+
+def legacyAddDependencies(modFileList, updateDict):
+	# The nested loop previously used by getFilesNeedingUpdate()
+	directUpdateList = [file for file in modFileList if updateDict[file.id][0]]
+	for file in directUpdateList:
+		for otherFile in modFileList:
+			if otherFile.priority > file.priority:
+				if updateDict[otherFile.id][0] is not True:
+					updateDict[otherFile.id] = (True, "{} is a dependency of {}".format(otherFile.id, file.id))
+
+
+def timeCall(function):
+	startTime = time.time()
+	result = function()
+	return result, time.time() - startTime
+
+
+def countUpdates(updateDict):
+	return sum(1 for needUpdate, _ in updateDict.values() if needUpdate)
+
+
+if __name__ == '__main__':
+	numFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+	modFileList = makeModFiles(numFiles)
+	localVersionInfo = makeVersionInfo(modFileList)
+	remoteVersionInfo = makeVersionInfo(modFileList, changedEvery=20)
+
+	def legacy():
+		updatesRequired = fileVersionManagement.SubModVersionInfo.getFilesNeedingInstall(localVersionInfo, remoteVersionInfo)
+		updateDict = dict((file.id, updatesRequired[file.id]) for file in modFileList)
+		legacyAddDependencies(modFileList, updateDict)
+		return updateDict
+
+	legacyResult, legacyTime = timeCall(legacy)
+	priorityResult, priorityTime = timeCall(lambda: fileVersionManagement.getFilesNeedingUpdate(modFileList, localVersionInfo, remoteVersionInfo, repairMode=False))
+	assert priorityResult == legacyResult
+
+	installedOverlaps = dict((file.id, set([modFileList[i - 4].id]) if i >= 4 else set()) for i, file in enumerate(modFileList))
+	graphResult, graphTime = timeCall(lambda: fileVersionManagement.getFilesNeedingUpdate(modFileList, localVersionInfo, remoteVersionInfo, repairMode=False, installedOverlaps=installedOverlaps))
+
+	print("{} mod files, {} changed".format(numFiles, countUpdates(fileVersionManagement.SubModVersionInfo.getFilesNeedingInstall(localVersionInfo, remoteVersionInfo))))
+	print("  legacy (nested loop):      {:.3f}s - {} files re-installed".format(legacyTime, countUpdates(legacyResult)))
+	print("  by priority (no overlaps): {:.3f}s - {} files re-installed - {:.1f}x faster".format(priorityTime, countUpdates(priorityResult), legacyTime / max(priorityTime, 1e-6)))
+	print("  dependency graph:          {:.3f}s - {} files re-installed - {:.1f}x faster".format(graphTime, countUpdates(graphResult), legacyTime / max(graphTime, 1e-6)))
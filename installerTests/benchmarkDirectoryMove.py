@@ -0,0 +1,88 @@
+"""
+Benchmark comparing the previous per-file higurashiInstaller.Installer._moveDirectoryIntoPlace() with
+directoryMover.moveDirectoryIntoPlace(), on a synthetic tree of 50,000 files laid out like a Higurashi install.
+
+The tree is moved twice: once into an empty game folder (which the new mover handles with a few renames), and once
+into a game folder which already contains every folder (so every folder has to be merged).
+
+Run from the repository root with: python installerTests/benchmarkDirectoryMove.py [numFiles]
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import common
+import directoryMover
+import higurashiInstaller
+
+FOLDERS = ['CG', 'CGAlt', 'SE', 'BGM', 'voice', 'Scripts', 'Update', 'spectrum']
+
+
+def makeTree(root, numFiles):
+	filesPerSubfolder = 500
+	createdFolders = set()
+	for i in range(numFiles):
+		folder = os.path.join(root, 'HigurashiEp01_Data', 'StreamingAssets', FOLDERS[i % len(FOLDERS)],
+		                      'part{:03d}'.format(i // (len(FOLDERS) * filesPerSubfolder)))
+		if folder not in createdFolders:
+			common.makeDirsExistOK(folder)
+			createdFolders.add(folder)
+		with open(os.path.join(folder, '{:08d}.ogg'.format(i)), 'wb') as f:
+			f.write(b'x')
+
+
+def makeFolders(root, numFiles):
+	# Same folders as makeTree(), but without any files
+	makeTree(root, numFiles)
+	for folder, _, filenames in os.walk(root):
+		for filename in filenames:
+			os.remove(os.path.join(folder, filename))
+
+
+def legacyMove(fromDir, toDir):
+	installer = higurashiInstaller.Installer.__new__(higurashiInstaller.Installer)
+	common.Globals.FAST_DIRECTORY_MOVE = False
+	try:
+		installer._moveDirectoryIntoPlace(fromDir, toDir)
+	finally:
+		common.Globals.FAST_DIRECTORY_MOVE = True
+
+
+def benchmark(name, numFiles, targetHasFolders):
+	tempDir = tempfile.mkdtemp()
+	try:
+		times = []
+		for mover in [legacyMove, directoryMover.moveDirectoryIntoPlace]:
+			fromDir = os.path.join(tempDir, mover.__name__, 'extraction')
+			toDir = os.path.join(tempDir, mover.__name__, 'game')
+			makeTree(fromDir, numFiles)
+			if targetHasFolders:
+				makeFolders(toDir, numFiles)
+			else:
+				os.makedirs(toDir)
+
+			startTime = time.time()
+			mover(fromDir, toDir)
+			times.append(time.time() - startTime)
+
+			assert not os.path.exists(fromDir)
+			assert sum(len(filenames) for _, _, filenames in os.walk(toDir)) == numFiles
+
+		legacyTime, fastTime = times
+		print("{}: {} files".format(name, numFiles))
+		print("  legacy (per-file move): {:.3f}s".format(legacyTime))
+		print("  directoryMover:         {:.3f}s - {:.1f}x faster".format(fastTime, legacyTime / max(fastTime, 1e-6)))
+	finally:
+		shutil.rmtree(tempDir)
+
+
+if __name__ == '__main__':
+	numFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+	benchmark('Move into empty game folder', numFiles, targetHasFolders=False)
+	benchmark('Merge into existing folders', numFiles, targetHasFolders=True)
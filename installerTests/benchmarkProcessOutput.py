@@ -0,0 +1,102 @@
+"""
+Micro-benchmark comparing the previous one-byte-at-a-time output reader of common.runProcessOutputToTempFile() with
+common.ProcessOutputSplitter, on output in the format produced by 7z (extracting many files) and aria2c.
+
+Run from the repository root with: python installerTests/benchmarkProcessOutput.py
+"""
+from __future__ import print_function, unicode_literals
+
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import common
+
+
+def makeSevenZipOutput(numFiles):
+	lines = ['', '7-Zip [64] 16.02 : Copyright (c) 1999-2016 Igor Pavlov : 2016-05-21', '', 'Extracting archive: HigurashiEp01-Voices.7z']
+	for i in range(numFiles):
+		# 7z overwrites its progress line using backspaces, then logs each extracted file
+		lines.append('{:3d}% {} - StreamingAssets/voice/ps3/s01/01/{:08d}.ogg\b\b\b\b\b\b\b\b\b\b\b\b'.format(i * 100 // numFiles, i, i))
+		lines.append('- StreamingAssets/voice/ps3/s01/01/{:08d}.ogg'.format(i))
+	lines.extend(['', 'Everything is Ok', '', 'Files: {}'.format(numFiles), ''])
+	return '\n'.join(lines).encode('utf-8')
+
+
+def makeAriaOutput(numUpdates):
+	updates = []
+	for i in range(numUpdates):
+		updates.append('[#2089b0 {}MiB/1.2GiB({}%) CN:8 DL:25MiB ETA:{}s]\r'.format(i, i * 100 // numUpdates, numUpdates - i))
+		if i % 60 == 0:
+			updates.append('\n*** Download Progress Summary as of {} ***\n{}\n'.format(i, '=' * 80))
+	return ''.join(updates).encode('utf-8')
+
+
+def legacyReader(fileLikeObject, ariaMode, sevenZipMode, lineMonitor):
+	# The reader used before ProcessOutputSplitter, minus the print() calls (which are the same for both readers)
+	stringBuffer = []
+	while True:
+		character = fileLikeObject.read(1).decode(encoding='utf-8', errors='replace')
+		if not character:
+			break
+
+		if character == '\r':
+			character = ' '
+
+		stringBuffer.append(character)
+
+		writeOutBuffer = False
+		if character == '\n':
+			writeOutBuffer = True
+
+		if ariaMode and character == ']':
+			stringBuffer.append('\n')
+			writeOutBuffer = True
+
+		if sevenZipMode and character == '%':
+			stringBuffer.append('\n')
+			writeOutBuffer = True
+
+		if writeOutBuffer:
+			lineMonitor(''.join(stringBuffer))
+			stringBuffer = []
+
+
+def chunkedReader(fileLikeObject, ariaMode, sevenZipMode, lineMonitor):
+	splitter = common.ProcessOutputSplitter(ariaMode=ariaMode, sevenZipMode=sevenZipMode)
+	while True:
+		data = fileLikeObject.read(65536)
+		if not data:
+			break
+
+		for line, _ in splitter.feed(data):
+			lineMonitor(line)
+
+	for line, _ in splitter.finish():
+		lineMonitor(line)
+
+
+def benchmark(name, data, ariaMode=False, sevenZipMode=False):
+	results = []
+	for reader in [legacyReader, chunkedReader]:
+		lines = []
+		startTime = time.time()
+		reader(io.BytesIO(data), ariaMode, sevenZipMode, lines.append)
+		results.append((time.time() - startTime, lines))
+
+	(legacyTime, legacyLines), (chunkedTime, chunkedLines) = results
+	# The chunked reader also outputs a final line which doesn't end in a delimiter, which the legacy reader dropped
+	assert chunkedLines[:len(legacyLines)] == legacyLines
+
+	megabytes = len(data) / 1024.0 / 1024.0
+	print("{}: {:.1f} MiB, {} lines".format(name, megabytes, len(legacyLines)))
+	print("  legacy (read(1)):  {:.3f}s ({:.1f} MiB/s)".format(legacyTime, megabytes / legacyTime))
+	print("  chunked (splitter): {:.3f}s ({:.1f} MiB/s) - {:.0f}x faster".format(chunkedTime, megabytes / chunkedTime, legacyTime / chunkedTime))
+
+
+if __name__ == '__main__':
+	benchmark('7z extraction output', makeSevenZipOutput(50000), sevenZipMode=True)
+	benchmark('aria2c download output', makeAriaOutput(50000), ariaMode=True)
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import directoryMover
+
+
+class TestDirectoryMover(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+		self.fromDir = os.path.join(self.tempDir, 'extraction')
+		self.toDir = os.path.join(self.tempDir, 'game')
+
+	def tearDown(self):
+		shutil.rmtree(self.tempDir)
+
+	def writeFiles(self, folder, files):
+		for relativePath, data in files.items():
+			filePath = os.path.join(folder, relativePath)
+			if not os.path.isdir(os.path.dirname(filePath)):
+				os.makedirs(os.path.dirname(filePath))
+			with open(filePath, 'wb') as f:
+				f.write(data)
+
+	def readFiles(self, folder):
+		files = {}
+		for root, _, filenames in os.walk(folder):
+			for filename in filenames:
+				with open(os.path.join(root, filename), 'rb') as f:
+					files[os.path.relpath(os.path.join(root, filename), folder).replace(os.sep, '/')] = f.read()
+		return files
+
+	def test_moveDirectoryIntoPlace(self):
+		self.writeFiles(self.toDir, {
+			'game.exe': b'old exe',
+			'data/CG/a.png': b'old a',
+			'data/CG/b.png': b'old b',
+			'data/SE/keep.ogg': b'keep',
+		})
+		self.writeFiles(self.fromDir, {
+			'game.exe': b'new exe',
+			'data/CG/a.png': b'new a',
+			'data/CG/sub/c.png': b'new c',
+			'data/voice/s01/1.ogg': b'voice',
+			'data/SE/new.ogg': b'new se',
+			'new/readme.txt': b'readme',
+		})
+		os.makedirs(os.path.join(self.fromDir, 'data', 'empty'))
+
+		directoryMover.moveDirectoryIntoPlace(self.fromDir, self.toDir, maxWorkers=2)
+
+		self.assertFalse(os.path.exists(self.fromDir))
+		self.assertTrue(os.path.isdir(os.path.join(self.toDir, 'data', 'empty')))
+		self.assertEqual(self.readFiles(self.toDir), {
+			'game.exe': b'new exe',
+			'data/CG/a.png': b'new a',
+			'data/CG/b.png': b'old b',
+			'data/CG/sub/c.png': b'new c',
+			'data/voice/s01/1.ogg': b'voice',
+			'data/SE/keep.ogg': b'keep',
+			'data/SE/new.ogg': b'new se',
+			'new/readme.txt': b'readme',
+		})
+
+	def test_missingTargetIsRenamed(self):
+		self.writeFiles(self.fromDir, {'data/CG/a.png': b'a'})
+		directoryMover.moveDirectoryIntoPlace(self.fromDir, os.path.join(self.toDir, 'Contents', 'Data'))
+
+		self.assertFalse(os.path.exists(self.fromDir))
+		self.assertEqual(self.readFiles(self.toDir), {'Contents/Data/data/CG/a.png': b'a'})
+
+
+if __name__ == '__main__':
+	unittest.main()
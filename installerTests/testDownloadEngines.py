@@ -0,0 +1,285 @@
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+	import http.server as server
+	from http.server import HTTPServer
+	from socketserver import ThreadingMixIn
+except ImportError:
+	import SimpleHTTPServer as server
+	from BaseHTTPServer import HTTPServer
+	from SocketServer import ThreadingMixIn
+
+import ariaRPC
+import commandLineParser
+import common
+import httpDownloader
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+class LocalHTTPServer:
+	"""
+	Serves the files in a temporary folder over HTTP on the loopback interface, as a stand-in for the real download servers.
+	Responses for the files in self.delays are sent after the given number of seconds, like a slow server.
+	If rangeErrorsHaveContentRange is False, 416 responses have an error page instead of a Content-Range header.
+	"""
+	def __init__(self):
+		self.directory = tempfile.mkdtemp()
+
+		directory = self.directory
+
+		localServer = self
+		self.numConnections = 0
+		self.requestedRanges = []
+		self.delays = {}
+		self.rangeErrorsHaveContentRange = True
+		self.numRequests = 0
+
+		class QuietHandler(server.SimpleHTTPRequestHandler):
+			# Use keep-alive connections
+			protocol_version = 'HTTP/1.1'
+
+			def setup(self):
+				localServer.numConnections += 1
+				server.SimpleHTTPRequestHandler.setup(self)
+
+			def translate_path(self, path):
+				return os.path.join(directory, path.lstrip('/').split('?')[0])
+
+			def log_message(self, format, *args):
+				pass
+
+			def end_headers(self):
+				self.send_header('Accept-Ranges', 'bytes')
+				server.SimpleHTTPRequestHandler.end_headers(self)
+
+			def send_head(self):
+				# Add support for single 'bytes=start-' / 'bytes=start-end' Range requests
+				rangeMatch = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range') or '')
+				path = self.translate_path(self.path)
+				localServer.numRequests += 1
+				time.sleep(localServer.delays.get(os.path.basename(path), 0))
+				if rangeMatch is None or not os.path.isfile(path):
+					return server.SimpleHTTPRequestHandler.send_head(self)
+
+				size = os.path.getsize(path)
+				start = int(rangeMatch.group(1))
+				end = int(rangeMatch.group(2)) if rangeMatch.group(2) else size - 1
+				localServer.requestedRanges.append((start, end))
+				if start >= size:
+					errorPage = b'' if localServer.rangeErrorsHaveContentRange else b'<html>416 Range Not Satisfiable</html>'
+					self.send_response(416)
+					if localServer.rangeErrorsHaveContentRange:
+						self.send_header('Content-Range', 'bytes */{}'.format(size))
+					self.send_header('Content-Length', str(len(errorPage)))
+					self.end_headers()
+					return io.BytesIO(errorPage)
+
+				f = open(path, 'rb')
+				f.seek(start)
+				self.send_response(206)
+				self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, size))
+				self.send_header('Content-Length', str(end - start + 1))
+				self.end_headers()
+				return RangeFile(f, end - start + 1)
+
+		class RangeFile:
+			def __init__(self, f, length):
+				self.f = f
+				self.remaining = length
+
+			def read(self, n=-1):
+				n = self.remaining if n < 0 else min(n, self.remaining)
+				data = self.f.read(n)
+				self.remaining -= len(data)
+				return data
+
+			def close(self):
+				self.f.close()
+
+		self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), QuietHandler)
+		self.thread = threading.Thread(target=self.httpd.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def addFile(self, name, data):
+		with open(os.path.join(self.directory, name), 'wb') as f:
+			f.write(data)
+
+		return self.url(name)
+
+	def url(self, name):
+		return 'http://127.0.0.1:{}/{}'.format(self.httpd.server_address[1], name)
+
+	def close(self):
+		self.httpd.shutdown()
+		self.httpd.server_close()
+		shutil.rmtree(self.directory)
+
+
+class TestAriaRPC(unittest.TestCase):
+	def setUp(self):
+		self.server = LocalHTTPServer()
+		self.downloadDir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		self.server.close()
+		shutil.rmtree(self.downloadDir)
+
+	def test_statusLineIsParsed(self):
+		line = ariaRPC.formatAriaStatusLine('7f0d78aabbcc', 27 * 1048576, 910 * 1048576, 8, 4 * 1048576)
+		status = commandLineParser.tryGetAriaStatusUpdate(line)
+		self.assertIsNotNone(status)
+		self.assertEqual(status.percentCompleted, 2)
+		self.assertEqual(status.numConnections.strip(), '8')
+
+	def test_download(self):
+		ariaExecutable = shutil.which('aria2c') if hasattr(shutil, 'which') else None
+		if ariaExecutable is None:
+			self.skipTest('aria2c is not installed')
+
+		data = os.urandom(1024 * 1024)
+		url = self.server.addFile('test.bin', data)
+
+		with ariaRPC.AriaRPCDownloader(self.downloadDir, ariaExecutable=ariaExecutable) as downloader:
+			self.assertEqual(downloader.download(url, statusCallback=lambda line: None), 0)
+			self.assertNotEqual(downloader.download(url + '.missing', statusCallback=lambda line: None), 0)
+
+		with open(os.path.join(self.downloadDir, 'test.bin'), 'rb') as f:
+			self.assertEqual(f.read(), data)
+
+
+class TestHTTPDownloader(unittest.TestCase):
+	def setUp(self):
+		self.server = LocalHTTPServer()
+		self.downloadDir = tempfile.mkdtemp()
+		self.pool = httpDownloader.ConnectionPool()
+		self.downloader = httpDownloader.HTTPDownloader(self.downloadDir, connectionPool=self.pool)
+
+	def tearDown(self):
+		self.pool.closeAll()
+		self.server.close()
+		shutil.rmtree(self.downloadDir)
+
+	def readDownloadedFile(self, name):
+		with open(os.path.join(self.downloadDir, name), 'rb') as f:
+			return f.read()
+
+	def test_downloadReusesConnections(self):
+		data = os.urandom(3 * httpDownloader.HTTPDownloader.CHUNK_SIZE + 123)
+		urls = [self.server.addFile('file{}.bin'.format(i), data) for i in range(3)]
+
+		for i, url in enumerate(urls):
+			self.assertEqual(self.downloader.download(url, statusCallback=lambda line: None), 0)
+			self.assertEqual(self.readDownloadedFile('file{}.bin'.format(i)), data)
+
+		self.assertEqual(self.server.numConnections, 1)
+		self.assertEqual(self.downloader.download(self.server.url('missing.bin'), statusCallback=lambda line: None), 1)
+
+	def test_resumePartialDownload(self):
+		data = os.urandom(1000000)
+		url = self.server.addFile('test.7z', data)
+		with open(os.path.join(self.downloadDir, 'test.7z'), 'wb') as f:
+			f.write(data[:400000])
+
+		self.assertEqual(self.downloader.download(url, statusCallback=lambda line: None), 0)
+		self.assertEqual(self.readDownloadedFile('test.7z'), data)
+		self.assertEqual(self.server.requestedRanges, [(400000, 999999)])
+
+		# An already completed download is not downloaded again
+		self.assertEqual(self.downloader.download(url, outputFile='test.7z', statusCallback=lambda line: None), 0)
+		self.assertEqual(self.server.requestedRanges[-1], (1000000, 999999))
+
+		# Even if the server doesn't say how large the file is
+		self.server.rangeErrorsHaveContentRange = False
+		numRequests = self.server.numRequests
+		self.assertEqual(self.downloader.download(url, outputFile='test.7z', statusCallback=lambda line: None), 0)
+		self.assertEqual(self.readDownloadedFile('test.7z'), data)
+		self.assertEqual(self.server.numRequests, numRequests + 1)
+
+	def test_sha256IsVerifiedWhileDownloading(self):
+		data = os.urandom(1000000)
+		url = self.server.addFile('test.7z', data)
+		with open(os.path.join(self.downloadDir, 'test.7z'), 'wb') as f:
+			f.write(data[:400000])
+
+		# The already downloaded part of a resumed download is included in the hash
+		self.assertEqual(self.downloader.download(url, statusCallback=lambda line: None, sha256=hashlib.sha256(data).hexdigest().upper()), 0)
+		self.assertEqual(self.readDownloadedFile('test.7z'), data)
+
+		oldRetryWait, httpDownloader.HTTPDownloader.RETRY_WAIT_SECONDS = httpDownloader.HTTPDownloader.RETRY_WAIT_SECONDS, 0
+		try:
+			self.assertEqual(self.downloader.download(url, outputFile='test.7z', statusCallback=lambda line: None, sha256='0' * 64), 1)
+		finally:
+			httpDownloader.HTTPDownloader.RETRY_WAIT_SECONDS = oldRetryWait
+		self.assertFalse(os.path.exists(os.path.join(self.downloadDir, 'test.7z')))
+
+	def test_segmentedDownload(self):
+		data = os.urandom(3 * 1024 * 1024 + 5)
+		url = self.server.addFile('large.7z', data)
+		outputPath = os.path.join(self.downloadDir, 'large.7z')
+		oldMinSize, common.Globals.SEGMENTED_DOWNLOAD_MIN_SIZE = common.Globals.SEGMENTED_DOWNLOAD_MIN_SIZE, 1024 * 1024
+		try:
+			# Small files are not segmented
+			smallURL = self.server.addFile('small.7z', data[:1000])
+			self.assertEqual(self.downloader.download(smallURL, statusCallback=lambda line: None, numConnections=4), 0)
+			self.assertEqual(self.server.requestedRanges, [])
+
+			self.assertEqual(self.downloader.download(url, statusCallback=lambda line: None, numConnections=4), 0)
+			self.assertEqual(self.readDownloadedFile('large.7z'), data)
+			self.assertEqual(len(self.server.requestedRanges), 4)
+			self.assertFalse(os.path.exists(outputPath + httpDownloader.SegmentedDownload.CONTROL_FILE_SUFFIX))
+
+			# Simulate an interrupted download, where only the first 1000 bytes of the first segment were downloaded
+			os.remove(outputPath)
+			segmentedDownload = httpDownloader.SegmentedDownload.create(self.pool, url, outputPath, len(data), 2)
+			with open(outputPath, 'r+b') as f:
+				f.write(data[:1000])
+			segmentedDownload.segments[0][2] = 1000
+			segmentedDownload._saveControlFile()
+
+			self.server.requestedRanges = []
+			self.assertEqual(self.downloader.download(url, outputFile='large.7z', statusCallback=lambda line: None, numConnections=4), 0)
+			self.assertEqual(self.readDownloadedFile('large.7z'), data)
+			self.assertEqual(sorted(self.server.requestedRanges), [(1000, segmentedDownload.segments[0][1] - 1), (segmentedDownload.segments[1][0], len(data) - 1)])
+		finally:
+			common.Globals.SEGMENTED_DOWNLOAD_MIN_SIZE = oldMinSize
+
+	def test_metalink(self):
+		data = os.urandom(50000)
+		fileURL = self.server.addFile('data.bin', data)
+		metalinkTemplate = '''<?xml version="1.0" encoding="UTF-8"?>
+<metalink xmlns="urn:ietf:params:xml:ns:metalink">
+	<file name="renamed.bin">
+		<size>{}</size>
+		<hash type="sha-256">{}</hash>
+		<url>{}</url>
+	</file>
+</metalink>'''
+
+		metalinkURL = self.server.addFile('good.meta4', metalinkTemplate.format(len(data), hashlib.sha256(data).hexdigest(), fileURL).encode('utf-8'))
+		self.assertEqual(self.downloader.download(metalinkURL, followMetaLink=True, statusCallback=lambda line: None), 0)
+		self.assertEqual(self.readDownloadedFile('renamed.bin'), data)
+
+		os.remove(os.path.join(self.downloadDir, 'renamed.bin'))
+		httpDownloader.HTTPDownloader.MAX_ATTEMPTS, oldMaxAttempts = 1, httpDownloader.HTTPDownloader.MAX_ATTEMPTS
+		try:
+			metalinkURL = self.server.addFile('bad.meta4', metalinkTemplate.format(len(data), '0' * 64, fileURL).encode('utf-8'))
+			self.assertEqual(self.downloader.download(metalinkURL, followMetaLink=True, statusCallback=lambda line: None), 1)
+			self.assertFalse(os.path.exists(os.path.join(self.downloadDir, 'renamed.bin')))
+		finally:
+			httpDownloader.HTTPDownloader.MAX_ATTEMPTS = oldMaxAttempts
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import common
+import downloadStore
+
+
+def makeItem(filename, length, lastModified='Mon, 01 Jan 2024 00:00:00 GMT', fromMetaLink=False):
+	return common.DownloaderAndExtractor.ExtractableItem(
+		filename=filename,
+		length=length,
+		destinationPath='.',
+		fromMetaLink=fromMetaLink,
+		remoteLastModified=lastModified,
+		fileURL='https://example.com/' + filename,
+	)
+
+
+class TestDownloadStore(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+		self.storeDir = os.path.join(self.tempDir, 'store')
+		self.downloadDir = os.path.join(self.tempDir, 'downloads')
+		os.makedirs(self.downloadDir)
+
+	def tearDown(self):
+		shutil.rmtree(self.tempDir)
+
+	def writeDownload(self, filename, data):
+		with open(os.path.join(self.downloadDir, filename), 'wb') as f:
+			f.write(data)
+
+	def test_addAndFetch(self):
+		store = downloadStore.DownloadStore(self.storeDir, 1000)
+		item = makeItem('a.7z', 100)
+		self.assertFalse(store.fetch(item, self.downloadDir))
+
+		self.writeDownload('a.7z', b'a' * 100)
+		store.add(item, self.downloadDir)
+		os.remove(os.path.join(self.downloadDir, 'a.7z'))
+
+		# A new store object loads the index from disk
+		store = downloadStore.DownloadStore(self.storeDir, 1000)
+		otherDownloadDir = os.path.join(self.tempDir, 'otherDownloads')
+		self.assertTrue(store.fetch(item, otherDownloadDir))
+		with open(os.path.join(otherDownloadDir, 'a.7z'), 'rb') as f:
+			self.assertEqual(f.read(), b'a' * 100)
+
+		# A file which has changed on the server is not re-used
+		self.assertFalse(store.fetch(makeItem('a.7z', 100, lastModified='Tue, 02 Jan 2024 00:00:00 GMT'), otherDownloadDir))
+
+		# Files without a Last-Modified date can't be validated, so are never stored
+		self.writeDownload('b.7z', b'b' * 10)
+		store.add(makeItem('b.7z', 10, lastModified=None), self.downloadDir)
+		self.assertEqual(store.totalSize(), 100)
+
+	def test_leastRecentlyUsedIsEvicted(self):
+		store = downloadStore.DownloadStore(self.storeDir, 250)
+		items = [makeItem('{}.7z'.format(i), 100) for i in range(3)]
+		for item in items[:2]:
+			self.writeDownload(item.filename, b'x' * 100)
+			store.add(item, self.downloadDir)
+
+		# Use the first item, so the second item becomes the least recently used
+		store.index[downloadStore.DownloadStore.getKey(items[0])]['lastUsed'] += 10
+		self.writeDownload(items[2].filename, b'x' * 100)
+		store.add(items[2], self.downloadDir)
+
+		self.assertEqual(store.totalSize(), 200)
+		self.assertTrue(store.fetch(items[0], self.downloadDir))
+		self.assertFalse(store.fetch(items[1], self.downloadDir))
+		self.assertTrue(store.fetch(items[2], self.downloadDir))
+
+	def test_fileBeingFetchedIsNotEvicted(self):
+		store = downloadStore.DownloadStore(self.storeDir, 250)
+		items = [makeItem('{}.7z'.format(i), 100) for i in range(3)]
+		for item in items:
+			self.writeDownload(item.filename, b'x' * 100)
+		for item in items[:2]:
+			store.add(item, self.downloadDir)
+
+		# While the first item is being copied out of the store, another install adds a file which fills the store
+		lockHeldDuringCopy = []
+		originalLinkOrCopyFile = downloadStore.linkOrCopyFile
+
+		def slowLinkOrCopyFile(sourcePath, destinationPath):
+			lockHeldDuringCopy.append(store.lock.locked())
+			if len(lockHeldDuringCopy) == 1:
+				store.maxSizeBytes = 100
+				store.add(items[2], self.downloadDir)
+			originalLinkOrCopyFile(sourcePath, destinationPath)
+
+		downloadStore.linkOrCopyFile = slowLinkOrCopyFile
+		try:
+			otherDownloadDir = os.path.join(self.tempDir, 'otherDownloads')
+			self.assertTrue(store.fetch(items[0], otherDownloadDir))
+		finally:
+			downloadStore.linkOrCopyFile = originalLinkOrCopyFile
+
+		self.assertEqual(lockHeldDuringCopy, [False, False])
+		with open(os.path.join(otherDownloadDir, '0.7z'), 'rb') as f:
+			self.assertEqual(f.read(), b'x' * 100)
+		self.assertEqual(store.keysInUse, {})
+		self.assertFalse(store.fetch(items[1], self.downloadDir))
+		self.assertTrue(store.fetch(items[0], self.downloadDir))
+		self.assertTrue(store.fetch(items[2], self.downloadDir))
+
+
+if __name__ == '__main__':
+	unittest.main()
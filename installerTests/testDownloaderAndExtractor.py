@@ -0,0 +1,215 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+import common
+from testDownloadEngines import LocalHTTPServer
+
+
+class LocalDownloaderAndExtractor(common.DownloaderAndExtractor):
+	"""
+	Downloads by copying files from a local folder instead of using a download engine. downloadDelays sets how many
+	seconds each file takes to download (None means the download never finishes unless it is cancelled), and
+	failingFilenames are files which always fail to download. Halfway through each download, an aria2c status line
+	saying the download is 50% complete is passed to the download's lineMonitor.
+	"""
+	def __init__(self, sourceDir, downloadDir, gameDir, filenames, downloadDelays=None, failingFilenames=(), maxConcurrentDownloads=None):
+		common.DownloaderAndExtractor.__init__(self, [], downloadDir, gameDir, maxConcurrentDownloads=maxConcurrentDownloads or len(filenames))
+		self.sourceDir = sourceDir
+		self.downloadDelays = downloadDelays or {}
+		self.failingFilenames = failingFilenames
+		self.lock = threading.Lock()
+		self.startedDownloads = []
+		self.numActiveDownloads = 0
+		self.maxActiveDownloads = 0
+		self.fractionsAtHalfway = {}
+		self.finishedDownloads = []
+		self.extractedFilenames = []
+
+		for filename in filenames:
+			# A checksum means the downloaded archive isn't tested with 7z
+			item = common.DownloaderAndExtractor.ExtractableItem(filename, os.path.getsize(os.path.join(sourceDir, filename)), gameDir, False, None,
+			                                                     fileURL=filename, sha256='0' * 64)
+			self.downloadList.append(filename)
+			self.extractablesForEachDownload.append([item])
+			self.extractList.append(item)
+		self.downloadAndExtractionListsBuilt = True
+
+	def _downloadURL(self, url, followMetaLink, numConnections=1, sha256=None, lineMonitor=None):
+		delay = self.downloadDelays.get(url, 0)
+		if delay is None:
+			# Stand-in for a large download, which only ends if the process is stopped
+			return common.runProcessOutputToTempFile([sys.executable, '-c', 'import time; time.sleep(60)'],
+			                                         runningProcesses=self.runningDownloadProcesses)
+
+		with self.lock:
+			self.startedDownloads.append(url)
+			self.numActiveDownloads += 1
+			self.maxActiveDownloads = max(self.maxActiveDownloads, self.numActiveDownloads)
+
+		try:
+			time.sleep(delay / 2.0)
+			lineMonitor.process('[#1a2b3c 5.0MiB/10.0MiB(50%) CN:1 DL:1.0MiB ETA:5s]')
+			self.fractionsAtHalfway[url] = self.downloadProgress.fractionCompleted()
+			time.sleep(delay / 2.0)
+		finally:
+			with self.lock:
+				self.numActiveDownloads -= 1
+
+		if url in self.failingFilenames:
+			return 1
+
+		shutil.copy(os.path.join(self.sourceDir, url), os.path.join(self.downloadTempDir, url))
+		self.finishedDownloads.append(url)
+		return 0
+
+
+class TestDownloadAndExtract(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+		self.sourceDir = os.path.join(self.tempDir, 'server')
+		self.downloadDir = os.path.join(self.tempDir, 'download')
+		self.gameDir = os.path.join(self.tempDir, 'game')
+		os.makedirs(self.sourceDir)
+
+		for filename in ['base.zip', 'update.zip', 'patch.zip']:
+			with zipfile.ZipFile(os.path.join(self.sourceDir, filename), 'w') as archive:
+				archive.writestr('shared.txt', filename)
+				archive.writestr(filename + '.txt', filename)
+
+		with open(os.path.join(self.sourceDir, 'damaged.zip'), 'wb') as f:
+			f.write(b'not a zip file')
+
+		for filename, size in [('small.bin', 100), ('large.bin', 300)]:
+			with open(os.path.join(self.sourceDir, filename), 'wb') as f:
+				f.write(b'\0' * size)
+
+		self.originalExtractOrCopyFile = common.extractOrCopyFile
+		self.originalMaxDownloadAttempts = common.DownloaderAndExtractor.MAX_DOWNLOAD_ATTEMPTS
+		common.DownloaderAndExtractor.MAX_DOWNLOAD_ATTEMPTS = 1
+
+	def tearDown(self):
+		common.extractOrCopyFile = self.originalExtractOrCopyFile
+		common.DownloaderAndExtractor.MAX_DOWNLOAD_ATTEMPTS = self.originalMaxDownloadAttempts
+		shutil.rmtree(self.tempDir)
+
+	def makeDownloaderAndExtractor(self, filenames, **kwargs):
+		downloaderAndExtractor = LocalDownloaderAndExtractor(self.sourceDir, self.downloadDir, self.gameDir, filenames, **kwargs)
+
+		def recordExtractOrCopyFile(filename, *args, **kwargs):
+			downloaderAndExtractor.extractedFilenames.append(filename)
+			self.originalExtractOrCopyFile(filename, *args, **kwargs)
+
+		common.extractOrCopyFile = recordExtractOrCopyFile
+		return downloaderAndExtractor
+
+	def readGameFile(self, relativePath):
+		with open(os.path.join(self.gameDir, relativePath), 'r') as f:
+			return f.read()
+
+	def test_extractsInOrderWhenDownloadsFinishOutOfOrder(self):
+		downloaderAndExtractor = self.makeDownloaderAndExtractor(['base.zip', 'update.zip', 'patch.zip'],
+		                                                         downloadDelays={'base.zip': 0.6, 'update.zip': 0.3})
+		downloaderAndExtractor.downloadAndExtract()
+
+		self.assertEqual(downloaderAndExtractor.finishedDownloads, ['patch.zip', 'update.zip', 'base.zip'])
+		self.assertEqual(downloaderAndExtractor.extractedFilenames, ['base.zip', 'update.zip', 'patch.zip'])
+		self.assertEqual(self.readGameFile('shared.txt'), 'patch.zip')
+		for filename in ['base.zip', 'update.zip', 'patch.zip']:
+			self.assertEqual(self.readGameFile(filename + '.txt'), filename)
+
+	def test_downloadFailureAfterExtraction(self):
+		downloaderAndExtractor = self.makeDownloaderAndExtractor(['base.zip', 'update.zip', 'patch.zip'],
+		                                                         downloadDelays={'update.zip': 0.5}, failingFilenames=['update.zip'])
+		self.assertRaises(common.DownloadAndVerifyError, downloaderAndExtractor.downloadAndExtract)
+
+		# Items before the failed download are extracted, but nothing after it is
+		self.assertEqual(downloaderAndExtractor.extractedFilenames, ['base.zip'])
+		self.assertEqual(self.readGameFile('base.zip.txt'), 'base.zip')
+		self.assertFalse(os.path.exists(os.path.join(self.gameDir, 'patch.zip.txt')))
+
+	def test_extractionFailureCancelsDownloads(self):
+		downloaderAndExtractor = self.makeDownloaderAndExtractor(['damaged.zip', 'base.zip'], downloadDelays={'base.zip': None})
+
+		startTime = time.time()
+		with self.assertRaises(Exception) as context:
+			downloaderAndExtractor.downloadAndExtract()
+
+		# The extraction error is raised as soon as the running download is stopped
+		self.assertNotIsInstance(context.exception, common.DownloadAndVerifyError)
+		self.assertLess(time.time() - startTime, 30)
+		self.assertEqual(downloaderAndExtractor.extractedFilenames, ['damaged.zip'])
+
+	def test_downloadsRunConcurrently(self):
+		downloaderAndExtractor = self.makeDownloaderAndExtractor(['base.zip', 'update.zip', 'patch.zip', 'small.bin'],
+		                                                         downloadDelays=dict((x, 0.5) for x in ['base.zip', 'update.zip', 'patch.zip', 'small.bin']))
+		downloaderAndExtractor.download()
+
+		self.assertEqual(downloaderAndExtractor.maxActiveDownloads, 4)
+		self.assertEqual(sorted(downloaderAndExtractor.finishedDownloads), ['base.zip', 'patch.zip', 'small.bin', 'update.zip'])
+
+	def test_failureStopsNewDownloads(self):
+		downloaderAndExtractor = self.makeDownloaderAndExtractor(['base.zip', 'update.zip', 'patch.zip', 'small.bin'], maxConcurrentDownloads=2,
+		                                                         downloadDelays={'update.zip': 0.5}, failingFilenames=['base.zip'])
+		self.assertRaises(common.DownloadAndVerifyError, downloaderAndExtractor.download)
+
+		# The download which was already running finishes, but no more downloads are started
+		self.assertEqual(sorted(downloaderAndExtractor.startedDownloads), ['base.zip', 'update.zip'])
+		self.assertEqual(downloaderAndExtractor.finishedDownloads, ['update.zip'])
+
+	def test_firstErrorIsRaised(self):
+		downloaderAndExtractor = self.makeDownloaderAndExtractor(['base.zip', 'update.zip'], downloadDelays={'base.zip': 0.5},
+		                                                         failingFilenames=['base.zip', 'update.zip'])
+		with self.assertRaises(common.DownloadAndVerifyError) as context:
+			downloaderAndExtractor.download()
+
+		self.assertIn('[update.zip]', str(context.exception))
+
+	def test_progressCountsBytesOfEachDownload(self):
+		downloaderAndExtractor = self.makeDownloaderAndExtractor(['small.bin', 'large.bin'], maxConcurrentDownloads=1)
+		downloaderAndExtractor.download()
+
+		# Half of large.bin (150 bytes) and all of small.bin (100 bytes) out of 400 bytes
+		self.assertEqual(downloaderAndExtractor.fractionsAtHalfway, {'small.bin': 0.125, 'large.bin': 0.625})
+		self.assertEqual(downloaderAndExtractor.downloadProgress.bytesCompleted(), (400, 400))
+
+
+class TestQueryURLs(unittest.TestCase):
+	def setUp(self):
+		self.server = LocalHTTPServer()
+		self.tempDir = tempfile.mkdtemp()
+		self.oldCachePath = common.Globals.URL_METADATA_CACHE_PATH
+		common.Globals.URL_METADATA_CACHE_PATH = os.path.join(self.tempDir, 'urlMetadataCache.json')
+		common.DownloaderAndExtractor.sharedURLMetadataCache = None
+
+	def tearDown(self):
+		common.Globals.URL_METADATA_CACHE_PATH = self.oldCachePath
+		common.DownloaderAndExtractor.sharedURLMetadataCache = None
+		self.server.close()
+		shutil.rmtree(self.tempDir)
+
+	def test_queriedURLsKeepTheirOrder(self):
+		# The earlier urls respond more slowly, so they finish being queried last
+		filenames = ['file{}.7z'.format(i) for i in range(8)]
+		urls = [self.server.addFile(filename, filename.encode('utf-8')) for filename in filenames]
+		for i, filename in enumerate(filenames):
+			self.server.delays[filename] = 0.1 * (len(filenames) - i)
+
+		downloaderAndExtractor = common.DownloaderAndExtractor([], os.path.join(self.tempDir, 'download'), os.path.join(self.tempDir, 'game'))
+		startTime = time.time()
+		downloaderAndExtractor.addItemsManually([(url, os.path.join(self.tempDir, 'game')) for url in urls], sourceIDs=filenames)
+
+		self.assertLess(time.time() - startTime, sum(self.server.delays.values()))
+		self.assertEqual(downloaderAndExtractor.downloadList, urls)
+		self.assertEqual([item.filename for item in downloaderAndExtractor.extractList], filenames)
+		self.assertEqual([item.sourceID for item in downloaderAndExtractor.extractList], filenames)
+		self.assertEqual([[item.filename for item in items] for items in downloaderAndExtractor.extractablesForEachDownload], [[x] for x in filenames])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import common
+import extractionPlanner
+
+
+SEVEN_ZIP_LISTING = """
+7-Zip [64] 16.02 : Copyright (c) 1999-2016 Igor Pavlov : 2016-05-21
+
+Listing archive: graphics.7z
+
+--
+Path = graphics.7z
+Type = 7z
+Physical Size = 1234
+
+----------
+Path = CG
+Size = 0
+Attributes = D_ drwxr-xr-x
+
+Path = CG/background.png
+Folder = -
+Size = 1000
+Attributes = A_ -rw-r--r--
+CRC = 1A2B3C4D
+
+Path = CG/sprite.png
+Folder = -
+Size = 2000
+Attributes = A_ -rw-r--r--
+
+"""
+
+
+class TestExtractionPlanner(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+		self.downloadDir = os.path.join(self.tempDir, 'download')
+		self.gameDir = os.path.join(self.tempDir, 'game')
+		os.makedirs(self.downloadDir)
+
+		self.makeZip('base.zip', {'CG/a.png': b'base a', 'CG/b.png': b'base b', 'CG/c.png': b'base c'})
+		self.makeZip('update.zip', {'CG/b.png': b'update b', 'CG/d.png': b'update d'})
+		with open(os.path.join(self.downloadDir, 'a.png'), 'wb') as f:
+			f.write(b'copied a')
+
+		self.extractList = [
+			common.DownloaderAndExtractor.ExtractableItem('base.zip', 0, self.gameDir, False, None),
+			common.DownloaderAndExtractor.ExtractableItem('update.zip', 0, self.gameDir, False, None),
+			common.DownloaderAndExtractor.ExtractableItem('a.png', 0, os.path.join(self.gameDir, 'CG'), False, None),
+		]
+
+	def tearDown(self):
+		shutil.rmtree(self.tempDir)
+
+	def makeZip(self, filename, files):
+		with zipfile.ZipFile(os.path.join(self.downloadDir, filename), 'w') as archive:
+			for name, data in files.items():
+				archive.writestr(name, data)
+
+	def readGameFile(self, relativePath):
+		with open(os.path.join(self.gameDir, relativePath), 'rb') as f:
+			return f.read()
+
+	def test_parseSevenZipTechnicalListing(self):
+		self.assertEqual(extractionPlanner.parseSevenZipTechnicalListing(SEVEN_ZIP_LISTING.replace('\n', '\r\n')),
+		                 ['CG/background.png', 'CG/sprite.png'])
+		self.assertEqual(extractionPlanner.parseSevenZipTechnicalListingMembers(SEVEN_ZIP_LISTING), [
+			extractionPlanner.ArchiveMember('CG/background.png', 1000, '1a2b3c4d'),
+			extractionPlanner.ArchiveMember('CG/sprite.png', 2000, None),
+		])
+
+	def test_getExclusions(self):
+		planner = extractionPlanner.ExtractionPlanner(self.downloadDir, self.extractList, lambda x, y: (x, y))
+		self.assertEqual(planner.getExclusions(0, [1, 2]), (False, {'CG/a.png', 'CG/b.png'}))
+		self.assertEqual(planner.getExclusions(0, [1]), (False, {'CG/b.png'}))
+		self.assertEqual(planner.getExclusions(1, [2]), (False, set()))
+		self.assertEqual(planner.getExclusions(2, []), (False, set()))
+
+		# A copied file which will be overwritten is skipped entirely
+		self.extractList.append(common.DownloaderAndExtractor.ExtractableItem('base.zip', 0, self.gameDir, False, None))
+		self.assertEqual(planner.getExclusions(2, [3]), (True, set()))
+
+	def test_unchangedFilesAreSkipped(self):
+		os.makedirs(os.path.join(self.gameDir, 'CG'))
+		for filename, data in [('b.png', b'old b'), ('c.png', b'base c'), ('d.png', b'update d')]:
+			with open(os.path.join(self.gameDir, 'CG', filename), 'wb') as f:
+				f.write(data)
+
+		planner = extractionPlanner.ExtractionPlanner(self.downloadDir, self.extractList, lambda x, y: (x, y), skipUnchangedFiles=True)
+		self.assertEqual(planner.getExclusions(0, [1, 2]), (False, {'CG/a.png', 'CG/b.png', 'CG/c.png'}))
+		self.assertEqual(planner.getExclusions(1, [2]), (False, {'CG/d.png'}))
+
+		# Files written earlier in the same install are always extracted again (b.png), but skipped files are not (d.png)
+		self.extractList.append(common.DownloaderAndExtractor.ExtractableItem('update.zip', 0, self.gameDir, False, None))
+		with open(os.path.join(self.gameDir, 'CG', 'b.png'), 'wb') as f:
+			f.write(b'update b')
+		self.assertEqual(planner.getExclusions(3, []), (False, {'CG/d.png'}))
+
+	def test_extractWritesEachFileOnce(self):
+		downloaderAndExtractor = common.DownloaderAndExtractor([], self.downloadDir, self.gameDir, skipDownload=True)
+		downloaderAndExtractor.extractList = self.extractList
+		downloaderAndExtractor.downloadAndExtractionListsBuilt = True
+
+		extractedFiles = []
+		originalExtractOrCopyFile = common.extractOrCopyFile
+		def recordExtractOrCopyFile(filename, sourceFolder, destinationFolder, copiedOutputFileName=None, excludedMembers=None):
+			extractedFiles.append((filename, excludedMembers))
+			originalExtractOrCopyFile(filename, sourceFolder, destinationFolder, copiedOutputFileName, excludedMembers)
+
+		common.extractOrCopyFile = recordExtractOrCopyFile
+		try:
+			downloaderAndExtractor.extract()
+		finally:
+			common.extractOrCopyFile = originalExtractOrCopyFile
+
+		self.assertEqual(extractedFiles, [('base.zip', {'CG/a.png', 'CG/b.png'}), ('update.zip', set()), ('a.png', set())])
+		self.assertEqual(self.readGameFile('CG/a.png'), b'copied a')
+		self.assertEqual(self.readGameFile('CG/b.png'), b'update b')
+		self.assertEqual(self.readGameFile('CG/c.png'), b'base c')
+		self.assertEqual(self.readGameFile('CG/d.png'), b'update d')
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+import fileHasher
+
+
+class TestFileHasher(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tempDir)
+
+	def writeFile(self, filename, data):
+		path = os.path.join(self.tempDir, filename)
+		with open(path, 'wb') as f:
+			f.write(data)
+		return path
+
+	def test_hashFile(self):
+		# Larger than one block, and not a multiple of the block size
+		data = os.urandom(fileHasher.BLOCK_SIZE * 2 + 12345)
+		path = self.writeFile('resources.assets', data)
+
+		self.assertEqual(fileHasher.hashFile(path, ['crc32', 'sha256', 'md5']), {
+			'crc32': '{:08x}'.format(zlib.crc32(data) & 0xffffffff),
+			'sha256': hashlib.sha256(data).hexdigest(),
+			'md5': hashlib.md5(data).hexdigest(),
+		})
+		self.assertEqual(fileHasher.sha256OfFile(self.writeFile('empty', b'')), hashlib.sha256(b'').hexdigest())
+		self.assertEqual(fileHasher.crc32OfFile(self.writeFile('empty', b'')), '00000000')
+
+	def test_hashFiles(self):
+		paths = [self.writeFile('file{}'.format(i), 'file {}'.format(i).encode('utf-8')) for i in range(20)]
+		missingPath = os.path.join(self.tempDir, 'missing')
+
+		checksums = fileHasher.hashFiles(paths + [missingPath, paths[0]], 'sha256', maxWorkers=4)
+		self.assertEqual(len(checksums), 21)
+		self.assertIsNone(checksums[missingPath])
+		for i, path in enumerate(paths):
+			self.assertEqual(checksums[path], hashlib.sha256('file {}'.format(i).encode('utf-8')).hexdigest())
+
+	def test_fileHashCache(self):
+		cachePath = os.path.join(self.tempDir, 'cache', 'fileHashCache.json')
+		path = self.writeFile('sharedassets0.assets', b'a' * 100)
+		# A whole number of seconds, so that the modified time can be restored exactly on Python 2 (no utime ns argument)
+		modifiedTime = 1500000000.0
+		os.utime(path, (modifiedTime, modifiedTime))
+		originalCache = fileHasher._sharedFileHashCache
+		fileHasher._sharedFileHashCache = fileHasher.FileHashCache(cachePath, minPersistedSize=0)
+		try:
+			self.assertEqual(fileHasher.hashFiles([path], 'sha256'), {path: hashlib.sha256(b'a' * 100).hexdigest()})
+
+			# The file isn't read again if its size and modified time are the same
+			self.writeFile('sharedassets0.assets', b'b' * 100)
+			os.utime(path, (modifiedTime, modifiedTime))
+			self.assertEqual(fileHasher.cachedHashFile(path, 'sha256'), hashlib.sha256(b'a' * 100).hexdigest())
+
+			# The cache is saved and loaded again
+			cache = fileHasher.FileHashCache(cachePath, minPersistedSize=0)
+			self.assertEqual(cache.lookup(path, os.stat(path), 'sha256'), hashlib.sha256(b'a' * 100).hexdigest())
+			self.assertIsNone(cache.lookup(path, os.stat(path), 'crc32'))
+
+			self.writeFile('sharedassets0.assets', b'c' * 101)
+			self.assertEqual(fileHasher.cachedHashFile(path, 'sha256'), hashlib.sha256(b'c' * 101).hexdigest())
+
+			# Entries for deleted files are removed when the cache is saved
+			otherPath = self.writeFile('resources.assets', b'd')
+			os.remove(path)
+			fileHasher.hashFiles([otherPath], 'sha256')
+			self.assertEqual(list(fileHasher.FileHashCache(cachePath, minPersistedSize=0).entries), [os.path.abspath(otherPath)])
+		finally:
+			fileHasher._sharedFileHashCache = originalCache
+
+
+if __name__ == '__main__':
+	unittest.main()
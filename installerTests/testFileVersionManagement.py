@@ -344,3 +344,111 @@ class TestSubModVersion(unittest.TestCase):
 				print(message)
 
 		logger.setGlobalLogger(DummyLogger())
+
+
+class TestVersionDataStore(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+		self.versionDataPath = os.path.join(self.tempDir, 'versionData.json')
+		self.originalVersionDataPath = common.Globals.META_PATH__VERSION_DATA
+		common.Globals.META_PATH__VERSION_DATA = self.versionDataPath
+
+	def tearDown(self):
+		common.Globals.META_PATH__VERSION_DATA = self.originalVersionDataPath
+		shutil.rmtree(self.tempDir)
+
+	def writeVersionData(self, scriptVersion, mtime):
+		with open(self.versionDataPath, 'w') as f:
+			json.dump([
+				{"id": "Onikakushi Ch.1/full", "files": [{"id": "script", "version": scriptVersion}]},
+				{"id": "Onikakushi Ch.1/voice-only", "files": [{"id": "voices", "version": "1.0.0"}]},
+			], f)
+		os.utime(self.versionDataPath, (mtime, mtime))
+
+	def test_reloadsOnlyWhenChanged(self):
+		store = fileVersionManagement.VersionDataStore()
+		self.writeVersionData("6.1.0", 1000)
+		versionInfo = store.get("Onikakushi Ch.1/full")
+		self.assertEqual(versionInfo.fileVersionsDict['script'].version, "6.1.0")
+		self.assertIsNone(store.get("Onikakushi Ch.2/full"))
+
+		# Re-downloading the same metadata changes the modified time, but the file isn't parsed again
+		self.writeVersionData("6.1.0", 2000)
+		self.assertIs(store.get("Onikakushi Ch.1/full"), versionInfo)
+
+		self.writeVersionData("6.2.0", 3000)
+		self.assertEqual(store.get("Onikakushi Ch.1/full").fileVersionsDict['script'].version, "6.2.0")
+
+		os.remove(self.versionDataPath)
+		self.assertIsNone(store.get("Onikakushi Ch.1/full"))
+
+
+# An Umineko submod with three files, shared with testLibraryUpdatePlanner.py
+UMINEKO_MOD = {
+	"family": "umineko",
+	"name": "Umineko Question (Ch. 1-4)",
+	"target": "Umineko1to4",
+	"dataname": "",
+	"identifiers": ["Umineko1to4.exe"],
+	"submods": [
+		{
+			"name": "voice-only",
+			"descriptionID": "uminekoVoiceOnly",
+			"files": [
+				{"name": "voices", "url": "https://07th-mod.com/voices.7z", "priority": 0},
+				{"name": "script", "url": "https://07th-mod.com/script.zip", "priority": 1},
+				{"name": "movie", "url": "https://07th-mod.com/movie.7z", "priority": 2},
+			],
+			"fileOverrides": [],
+		}
+	],
+}
+UMINEKO_SUBMOD_ID = "Umineko Question (Ch. 1-4)/voice-only"
+
+def makeUminekoVersionJSON(versions):
+	return {
+		"id": UMINEKO_SUBMOD_ID,
+		"lastAttemptedInstallID": UMINEKO_SUBMOD_ID,
+		"files": [{"id": fileID, "version": version} for fileID, version in versions.items()],
+	}
+
+def makeUminekoVersionInfo(versions):
+	return fileVersionManagement.SubModVersionInfo(makeUminekoVersionJSON(versions))
+
+def makeUminekoInstallConfig(installPath, isSteam=True):
+	subModConfig = installConfiguration.SubModConfig(UMINEKO_MOD, UMINEKO_MOD['submods'][0])
+	return installConfiguration.FullInstallConfiguration(subModConfig, installPath, isSteam)
+
+
+class TestVersionCheckpoints(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tempDir)
+
+	def makeVersionManager(self, remoteVersionInfo):
+		fullConfig = makeUminekoInstallConfig(self.tempDir)
+		return fileVersionManagement.VersionManager(
+			fullInstallConfiguration=fullConfig,
+			modFileList=fullConfig.buildFileListSorted(),
+			localVersionFolder=self.tempDir,
+			_testRemoteSubModVersion=remoteVersionInfo,
+			verbosePrinting=False)
+
+	def test_stoppedInstallOnlyReinstallsUnfinishedFiles(self):
+		makeUminekoVersionInfo({"voices": "1.0.0", "script": "1.0.0", "movie": "1.0.0"}).serialize(
+			os.path.join(self.tempDir, fileVersionManagement.VersionManager.localVersionFileName), UMINEKO_SUBMOD_ID)
+		remoteVersionInfo = makeUminekoVersionInfo({"voices": "1.0.0", "script": "2.0.0", "movie": "2.0.0"})
+
+		fileVersionManager = self.makeVersionManager(remoteVersionInfo)
+		self.assertEqual([x.id for x in fileVersionManager.getFilesRequiringUpdate()], ['script', 'movie'])
+
+		# The files being installed are removed from the version file until each one finishes installing
+		fileVersionManager.saveVersionInstallStarted()
+		self.assertEqual([x.id for x in self.makeVersionManager(remoteVersionInfo).getFilesRequiringUpdate()], ['script', 'movie'])
+		fileVersionManager.saveVersionCheckpoint('script')
+		fileVersionManager.saveVersionCheckpoint('OST Remake')
+
+		# The install was stopped before the movie was installed
+		self.assertEqual([x.id for x in self.makeVersionManager(remoteVersionInfo).getFilesRequiringUpdate()], ['movie'])
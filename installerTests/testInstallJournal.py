@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import common
+import fileVersionManagement
+import installJournal
+
+
+class TestInstallJournal(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+		self.journalPath = os.path.join(self.tempDir, installJournal.JOURNAL_FILENAME)
+
+	def tearDown(self):
+		shutil.rmtree(self.tempDir)
+
+	def test_resumeOnlySamePlan(self):
+		journal = installJournal.InstallJournal(self.journalPath, 'plan1')
+		journal.markDone(installJournal.downloadStep('https://07th-mod.com/voices.7z'), [['voices.7z', 1234]])
+		installJournal.runStepOnce(journal, installJournal.STEP_PREPARE_GAME_FOLDER, lambda: None)
+
+		stepsRun = []
+		resumedJournal = installJournal.InstallJournal(self.journalPath, 'plan1')
+		installJournal.runStepOnce(resumedJournal, installJournal.STEP_PREPARE_GAME_FOLDER, lambda: stepsRun.append('prepare'))
+		installJournal.runStepOnce(resumedJournal, installJournal.STEP_MOVE_FILES, lambda: stepsRun.append('move'))
+		self.assertEqual(stepsRun, ['move'])
+		self.assertEqual(resumedJournal.getData(installJournal.downloadStep('https://07th-mod.com/voices.7z')), [['voices.7z', 1234]])
+
+		# A journal from an install with a different plan is ignored
+		self.assertEqual(installJournal.InstallJournal(self.journalPath, 'plan2').steps, {})
+
+		resumedJournal.delete()
+		self.assertFalse(os.path.exists(self.journalPath))
+
+	def test_planIgnoresCheckpointedFiles(self):
+		remoteVersionInfo = fileVersionManagement.SubModVersionInfo({
+			'id': 'Umineko1to4/full',
+			'files': [{'id': 'graphics', 'version': '1.0.0'}, {'id': 'voices', 'version': '1.0.0'}],
+			'lastAttemptedInstallID': 'Umineko1to4/full',
+		})
+
+		def makeItem(filename, sourceID):
+			item = common.DownloaderAndExtractor.ExtractableItem(filename, 0, self.tempDir, False, None)
+			item.sourceID = sourceID
+			return item
+
+		def planID(items):
+			return installJournal.makePlanID('Umineko1to4', remoteVersionInfo, items, set(['graphics', 'voices']))
+
+		option = makeItem('option.zip', 'Some Option')
+		fullPlan = planID([makeItem('graphics.zip', 'graphics'), makeItem('voices.zip', 'voices'), option])
+
+		# Once the graphics are checkpointed in the version file, the next install only installs the voices
+		self.assertEqual(planID([makeItem('voices.zip', 'voices'), option]), fullPlan)
+		# Choosing different mod options is a different plan
+		self.assertNotEqual(planID([makeItem('voices.zip', 'voices')]), fullPlan)
+
+	def test_extractionResumes(self):
+		downloadDir = os.path.join(self.tempDir, 'download')
+		gameDir = os.path.join(self.tempDir, 'game')
+		os.makedirs(downloadDir)
+		for filename, name in [('graphics.zip', 'CG/a.png'), ('voices.zip', 'voice/1.ogg')]:
+			with zipfile.ZipFile(os.path.join(downloadDir, filename), 'w') as archive:
+				archive.writestr(name, filename.encode('utf-8'))
+
+		downloaderAndExtractor = common.DownloaderAndExtractor([], downloadDir, gameDir, skipDownload=True)
+		downloaderAndExtractor.extractList = [
+			common.DownloaderAndExtractor.ExtractableItem('graphics.zip', 0, gameDir, False, None),
+			common.DownloaderAndExtractor.ExtractableItem('voices.zip', 0, gameDir, False, None),
+		]
+		downloaderAndExtractor.extractList[0].sourceID = 'graphics'
+		downloaderAndExtractor.extractList[1].sourceID = 'voices'
+		downloaderAndExtractor.downloadAndExtractionListsBuilt = True
+		extractedSourceIDs = []
+		downloaderAndExtractor.onSourceExtracted = extractedSourceIDs.append
+
+		# The previous install extracted the graphics, then was stopped
+		journal = installJournal.InstallJournal(self.journalPath, 'plan1')
+		journal.markDone(installJournal.extractStep(downloaderAndExtractor.extractList[0]))
+		downloaderAndExtractor.journal = journal
+
+		extractedFiles = []
+		originalExtractOrCopyFile = common.extractOrCopyFile
+		def recordExtractOrCopyFile(filename, sourceFolder, destinationFolder, copiedOutputFileName=None, excludedMembers=None):
+			extractedFiles.append(filename)
+			originalExtractOrCopyFile(filename, sourceFolder, destinationFolder, copiedOutputFileName, excludedMembers)
+
+		common.extractOrCopyFile = recordExtractOrCopyFile
+		try:
+			downloaderAndExtractor.extract()
+		finally:
+			common.extractOrCopyFile = originalExtractOrCopyFile
+
+		self.assertEqual(extractedFiles, ['voices.zip'])
+		self.assertEqual(extractedSourceIDs, ['graphics', 'voices'])
+		self.assertTrue(journal.isDone(installJournal.extractStep(downloaderAndExtractor.extractList[1])))
+		# Files extracted by the previous install are still recorded in the install manifest
+		self.assertEqual(sorted(downloaderAndExtractor.installedFiles.files), ['CG/a.png', 'voice/1.ogg'])
+
+	def test_sourceWaitsForOverridingItems(self):
+		downloadDir = os.path.join(self.tempDir, 'download')
+		gameDir = os.path.join(self.tempDir, 'game')
+		os.makedirs(downloadDir)
+		for filename, names in [('graphics.zip', ['CG/a.png', 'CG/b.png']), ('voices.zip', ['voice/1.ogg']), ('option.zip', ['CG/b.png'])]:
+			with zipfile.ZipFile(os.path.join(downloadDir, filename), 'w') as archive:
+				for name in names:
+					archive.writestr(name, filename.encode('utf-8'))
+
+		def makeDownloaderAndExtractor(filenamesAndSourceIDs, extractedSourceIDs):
+			downloaderAndExtractor = common.DownloaderAndExtractor([], downloadDir, gameDir, skipDownload=True)
+			for filename, sourceID in filenamesAndSourceIDs:
+				item = common.DownloaderAndExtractor.ExtractableItem(filename, 0, gameDir, False, None)
+				item.sourceID = sourceID
+				downloaderAndExtractor.extractList.append(item)
+			downloaderAndExtractor.downloadAndExtractionListsBuilt = True
+			downloaderAndExtractor.onSourceExtracted = extractedSourceIDs.append
+			return downloaderAndExtractor
+
+		# The option overrides one of the graphics files, so the graphics are extracted without it. The install is
+		# stopped before the option is extracted, so the graphics must not be checkpointed.
+		extractedSourceIDs = []
+		downloaderAndExtractor = makeDownloaderAndExtractor([('graphics.zip', 'graphics'), ('voices.zip', 'voices'), ('option.zip', 'Some Option')], extractedSourceIDs)
+		originalExtractOrCopyFile = common.extractOrCopyFile
+		def stopAtOption(filename, sourceFolder, destinationFolder, copiedOutputFileName=None, excludedMembers=None):
+			if filename == 'option.zip':
+				raise KeyboardInterrupt()
+			originalExtractOrCopyFile(filename, sourceFolder, destinationFolder, copiedOutputFileName, excludedMembers)
+
+		common.extractOrCopyFile = stopAtOption
+		try:
+			self.assertRaises(KeyboardInterrupt, downloaderAndExtractor.extract)
+		finally:
+			common.extractOrCopyFile = originalExtractOrCopyFile
+
+		self.assertFalse(os.path.exists(os.path.join(gameDir, 'CG', 'b.png')))
+		self.assertEqual(extractedSourceIDs, ['voices'])
+
+		# Re-running without the option installs the graphics again, including the file which was left out
+		extractedSourceIDs = []
+		makeDownloaderAndExtractor([('graphics.zip', 'graphics')], extractedSourceIDs).extract()
+		with open(os.path.join(gameDir, 'CG', 'b.png'), 'rb') as f:
+			self.assertEqual(f.read(), b'graphics.zip')
+		self.assertEqual(extractedSourceIDs, ['graphics'])
+
+		# Once the option is extracted, both sources are checkpointed
+		extractedSourceIDs = []
+		makeDownloaderAndExtractor([('graphics.zip', 'graphics'), ('option.zip', 'Some Option')], extractedSourceIDs).extract()
+		self.assertEqual(extractedSourceIDs, ['graphics', 'Some Option'])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,187 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import common
+import fileVersionManagement
+import installConfiguration
+import installManifest
+
+
+class TestInstallManifest(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tempDir)
+
+	def test_saveAndMerge(self):
+		firstInstall = installManifest.InstallManifest()
+		firstInstall.recordFile('HigurashiEp01_Data/StreamingAssets/CG/a.png', 10, '0000000A', 'graphics')
+		firstInstall.recordFile('HigurashiEp01_Data\\StreamingAssets\\voice\\1.ogg', 20, '00000014', 'voices')
+		installManifest.saveInstallManifest(self.tempDir, firstInstall, replaceExisting=True)
+
+		# A partial install only replaces the files it wrote
+		secondInstall = installManifest.InstallManifest()
+		secondInstall.recordFile('HigurashiEp01_Data/StreamingAssets/CG/a.png', 11, '0000000b', 'graphics-update')
+		installManifest.saveInstallManifest(self.tempDir, secondInstall, replaceExisting=False)
+
+		manifest = installManifest.InstallManifest.load(os.path.join(self.tempDir, installManifest.MANIFEST_FILENAME))
+		self.assertEqual(manifest.files, {
+			'HigurashiEp01_Data/StreamingAssets/CG/a.png': installManifest.ManifestEntry(11, '0000000b', 'graphics-update'),
+			'HigurashiEp01_Data/StreamingAssets/voice/1.ogg': installManifest.ManifestEntry(20, '00000014', 'voices'),
+		})
+		self.assertEqual(manifest.filesFromSource('voices'), ['HigurashiEp01_Data/StreamingAssets/voice/1.ogg'])
+		self.assertEqual(manifest.overlaps, {'graphics': set(), 'voices': set(), 'graphics-update': {'graphics'}})
+
+		manifest.moveFolder('HigurashiEp01_Data', 'Contents/Resources/Data')
+		self.assertEqual(manifest.get('Contents/Resources/Data/StreamingAssets/CG/a.png').sourceID, 'graphics-update')
+
+		# A full install discards the existing manifest
+		installManifest.saveInstallManifest(self.tempDir, secondInstall, replaceExisting=True)
+		manifest = installManifest.InstallManifest.load(os.path.join(self.tempDir, installManifest.MANIFEST_FILENAME))
+		self.assertEqual(list(manifest.files), ['HigurashiEp01_Data/StreamingAssets/CG/a.png'])
+
+		# Manifests from older installers don't record overlaps, so they stay unknown after merging
+		manifestJSON = manifest.toJSON()
+		del manifestJSON['overlaps']
+		manifest = installManifest.InstallManifest.fromJSON(manifestJSON)
+		manifest.update(secondInstall)
+		self.assertIsNone(manifest.overlaps)
+
+	def test_reinstalledAndDeletedFilesAreRemoved(self):
+		firstInstall = installManifest.InstallManifest()
+		firstInstall.recordFile('HigurashiEp01_Data/StreamingAssets/Update/old.txt', 10, '0000000a', 'script')
+		firstInstall.recordFile('HigurashiEp01_Data/StreamingAssets/Update/new.txt', 10, '0000000a', 'script')
+		firstInstall.recordFile('HigurashiEp01_Data/StreamingAssets/OGBackgrounds/a.png', 20, '00000014', 'Some Option')
+		firstInstall.recordFile('HigurashiEp01_Data/StreamingAssets/voice/1.ogg', 30, '0000001e', 'voices')
+		firstInstall.recordFile('HigurashiEp01_Data/ui.languagespecificassets', 40, '00000028', 'Language Patch')
+		installManifest.saveInstallManifest(self.tempDir, firstInstall, replaceExisting=True)
+
+		# The new version of the script no longer has old.txt, and a mod option deleted the OGBackgrounds folder
+		secondInstall = installManifest.InstallManifest()
+		secondInstall.recordDeletion('HigurashiEp01_Data\\StreamingAssets\\OGBackgrounds')
+		secondInstall.recordFile('HigurashiEp01_Data/StreamingAssets/Update/new.txt', 11, '0000000b', 'script')
+		# The language patch deletes its unused UI files after they are extracted
+		secondInstall.recordFile('HigurashiEp01_Data/ui.languagespecificassets', 40, '00000028', 'Language Patch')
+		secondInstall.recordRemovedFile('HigurashiEp01_Data/ui.languagespecificassets')
+		installManifest.saveInstallManifest(self.tempDir, secondInstall, replaceExisting=False)
+
+		manifest = installManifest.InstallManifest.load(os.path.join(self.tempDir, installManifest.MANIFEST_FILENAME))
+		self.assertEqual(sorted(manifest.files), [
+			'HigurashiEp01_Data/StreamingAssets/Update/new.txt',
+			'HigurashiEp01_Data/StreamingAssets/voice/1.ogg',
+		])
+
+	def test_extractRecordsInstalledFiles(self):
+		downloadDir = os.path.join(self.tempDir, 'download')
+		gameDir = os.path.join(self.tempDir, 'game')
+		os.makedirs(downloadDir)
+		with zipfile.ZipFile(os.path.join(downloadDir, 'base.zip'), 'w') as archive:
+			archive.writestr('CG/a.png', b'base a')
+			archive.writestr('CG/b.png', b'base b')
+		with open(os.path.join(downloadDir, 'a.png'), 'wb') as f:
+			f.write(b'copied a')
+
+		downloaderAndExtractor = common.DownloaderAndExtractor([], downloadDir, gameDir, skipDownload=True)
+		downloaderAndExtractor.extractList = [
+			common.DownloaderAndExtractor.ExtractableItem('base.zip', 0, gameDir, False, None),
+			common.DownloaderAndExtractor.ExtractableItem('a.png', 0, os.path.join(gameDir, 'CG'), False, None),
+		]
+		downloaderAndExtractor.extractList[0].sourceID = 'graphics'
+		downloaderAndExtractor.extractList[1].sourceID = 'fix'
+		downloaderAndExtractor.downloadAndExtractionListsBuilt = True
+		downloaderAndExtractor.extract()
+
+		self.assertEqual(downloaderAndExtractor.installedFiles.files, {
+			'CG/a.png': installManifest.ManifestEntry(8, common.crc32_of_file(os.path.join(gameDir, 'CG', 'a.png')), 'fix'),
+			'CG/b.png': installManifest.ManifestEntry(6, common.crc32_of_file(os.path.join(gameDir, 'CG', 'b.png')), 'graphics'),
+		})
+
+	def test_repairOnlyReinstallsDamagedFiles(self):
+		manifest = installManifest.InstallManifest()
+		for relativePath, data, sourceID in [('script.txt', b'script', 'scripts'), ('voice/1.ogg', b'voice', 'voices'),
+		                                     ('CG/a.png', b'cg a', 'graphics'), ('CG/b.png', b'cg b', 'graphics')]:
+			filePath = os.path.join(self.tempDir, relativePath)
+			common.makeDirsExistOK(os.path.dirname(filePath))
+			with open(filePath, 'wb') as f:
+				f.write(data)
+			manifest.recordFile(relativePath, len(data), common.crc32_of_file(filePath), sourceID)
+
+		# Same size, different contents
+		with open(os.path.join(self.tempDir, 'CG', 'a.png'), 'wb') as f:
+			f.write(b'cg x')
+		os.remove(os.path.join(self.tempDir, 'CG', 'b.png'))
+
+		result = installManifest.verifyInstalledFiles(self.tempDir, manifest, maxWorkers=2)
+		self.assertEqual(result.verifiedSourceIDs, {'scripts', 'voices', 'graphics'})
+		self.assertEqual([x[0] for x in result.damagedFilesBySource['graphics']], ['CG/a.png', 'CG/b.png'])
+		self.assertEqual(list(result.damagedFilesBySource), ['graphics'])
+
+		modFileList = [
+			installConfiguration.ModFile('scripts', None, 0, installOnRepair=True),
+			installConfiguration.ModFile('voices', None, 1),
+			installConfiguration.ModFile('graphics', None, 2),
+			# Nothing from 'exe' is in the manifest, so it is always re-installed
+			installConfiguration.ModFile('exe', None, 3, installOnRepair=True),
+		]
+		versionInfo = fileVersionManagement.SubModVersionInfo({
+			'id': 'Onikakushi Ch.1/full',
+			'files': [{'id': x.id, 'version': '1.0.0'} for x in modFileList],
+			'lastAttemptedInstallID': 'Onikakushi Ch.1/full',
+		})
+		updatesRequired = fileVersionManagement.getFilesNeedingUpdate(modFileList, versionInfo, versionInfo, repairMode=True, verificationResult=result)
+		self.assertEqual(dict((fileID, needUpdate) for fileID, (needUpdate, _) in updatesRequired.items()),
+		                 {'scripts': False, 'voices': False, 'graphics': True, 'exe': True})
+
+		# A preview which doesn't verify the files shows every file in the manifest as one which might be re-installed
+		updatesRequired = fileVersionManagement.getFilesNeedingUpdate(modFileList, versionInfo, versionInfo, repairMode=True, verifyLaterSourceIDs=manifest.sources())
+		self.assertEqual(dict((fileID, needUpdate) for fileID, (needUpdate, _) in updatesRequired.items()),
+		                 {'scripts': True, 'voices': True, 'graphics': True, 'exe': True})
+		self.assertIn('checked when the install starts', updatesRequired['voices'][1])
+
+	def test_updatesOnlyDependentFiles(self):
+		modFileList = [
+			installConfiguration.ModFile('graphics', None, 1),
+			installConfiguration.ModFile('graphics-update', None, 2),
+			installConfiguration.ModFile('voices', None, 3),
+			installConfiguration.ModFile('script', None, 4, dependsOn=['graphics-update']),
+			installConfiguration.ModFile('ui', None, 5),
+		]
+		installedOverlaps = {'graphics': set(), 'graphics-update': {'graphics'}, 'voices': set(), 'script': set(), 'ui': set()}
+
+		def getUpdatedFiles(updatedFileIDs, installedOverlaps, damagedFileIDs=()):
+			def makeVersionInfo(changedFileIDs):
+				return fileVersionManagement.SubModVersionInfo({
+					'id': 'Onikakushi Ch.1/full',
+					'files': [{'id': x.id, 'version': '1.0.1' if x.id in changedFileIDs else '1.0.0'} for x in modFileList],
+					'lastAttemptedInstallID': 'Onikakushi Ch.1/full',
+				})
+
+			verificationResult = installManifest.VerificationResult(set(x.id for x in modFileList), dict((x, [('a.png', 'missing')]) for x in damagedFileIDs))
+			updatesRequired = fileVersionManagement.getFilesNeedingUpdate(modFileList, makeVersionInfo([]), makeVersionInfo(updatedFileIDs),
+			                                                              repairMode=bool(damagedFileIDs), verificationResult=verificationResult,
+			                                                              installedOverlaps=installedOverlaps)
+			return set(fileID for fileID, (needUpdate, _) in updatesRequired.items() if needUpdate)
+
+		# script declares it must be installed after graphics-update, so only script depends on graphics-update
+		self.assertEqual(getUpdatedFiles(['graphics-update'], installedOverlaps), {'graphics-update', 'script'})
+
+		# The new version of a file which no file declares in 'dependsOn' might overwrite any higher priority file,
+		# so the overlaps from the last install aren't used
+		self.assertEqual(getUpdatedFiles(['graphics'], installedOverlaps), {'graphics', 'graphics-update', 'voices', 'script', 'ui'})
+		self.assertEqual(getUpdatedFiles(['voices'], installedOverlaps), {'voices', 'script', 'ui'})
+
+		# A repaired file has the same contents as last time, so only the files which overwrote it are re-installed
+		self.assertEqual(getUpdatedFiles([], installedOverlaps, damagedFileIDs=['graphics']), {'graphics', 'graphics-update', 'script'})
+		self.assertEqual(getUpdatedFiles([], installedOverlaps, damagedFileIDs=['voices']), {'voices'})
+
+		# If it's not known what a file overwrote, every higher priority file is re-installed
+		del installedOverlaps['voices']
+		self.assertEqual(getUpdatedFiles([], installedOverlaps, damagedFileIDs=['voices']), {'voices', 'script', 'ui'})
+		self.assertEqual(getUpdatedFiles(['graphics'], None), {'graphics', 'graphics-update', 'voices', 'script', 'ui'})
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import common
+import fileVersionManagement
+import libraryUpdatePlanner
+from testFileVersionManagement import UMINEKO_SUBMOD_ID, makeUminekoInstallConfig, makeUminekoVersionInfo, makeUminekoVersionJSON
+
+
+class TestLibraryUpdatePlanner(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+		self.originalVersionDataPath = common.Globals.META_PATH__VERSION_DATA
+		self.originalFileSizes = dict(common.Globals.URL_FILE_SIZE_LOOKUP_TABLE)
+		common.Globals.META_PATH__VERSION_DATA = os.path.join(self.tempDir, 'versionData.json')
+		common.Globals.URL_FILE_SIZE_LOOKUP_TABLE['https://07th-mod.com/voices.7z'] = 1000
+		common.Globals.URL_FILE_SIZE_LOOKUP_TABLE['https://07th-mod.com/script.zip'] = 10
+		common.Globals.URL_FILE_SIZE_LOOKUP_TABLE['https://07th-mod.com/movie.7z'] = 100
+
+		with open(common.Globals.META_PATH__VERSION_DATA, 'w') as f:
+			json.dump([makeUminekoVersionJSON(self.versions('2.0.0'))], f)
+
+	def tearDown(self):
+		common.Globals.META_PATH__VERSION_DATA = self.originalVersionDataPath
+		common.Globals.URL_FILE_SIZE_LOOKUP_TABLE.clear()
+		common.Globals.URL_FILE_SIZE_LOOKUP_TABLE.update(self.originalFileSizes)
+		shutil.rmtree(self.tempDir)
+
+	def versions(self, scriptVersion):
+		return {"voices": "1.0.0", "script": scriptVersion, "movie": "1.0.0"}
+
+	def makeInstall(self, folderName, installedScriptVersion):
+		installPath = os.path.join(self.tempDir, folderName)
+		os.makedirs(installPath)
+		if installedScriptVersion is not None:
+			makeUminekoVersionInfo(self.versions(installedScriptVersion)).serialize(
+				os.path.join(installPath, fileVersionManagement.VersionManager.localVersionFileName), UMINEKO_SUBMOD_ID)
+
+		return makeUminekoInstallConfig(installPath, isSteam=False)
+
+	def test_planLibraryUpdates(self):
+		fullInstallConfigs = [
+			self.makeInstall('notInstalled', None),
+			self.makeInstall('outOfDate', '1.0.0'),
+			self.makeInstall('upToDate', '2.0.0'),
+		]
+
+		plans = libraryUpdatePlanner.planLibraryUpdates(fullInstallConfigs, maxWorkers=2)
+		self.assertEqual([plan.fullInstallConfig for plan in plans], fullInstallConfigs)
+		self.assertEqual([plan.status for plan in plans], [
+			libraryUpdatePlanner.UpdatePlan.STATUS_NOT_INSTALLED,
+			libraryUpdatePlanner.UpdatePlan.STATUS_UPDATE_AVAILABLE,
+			libraryUpdatePlanner.UpdatePlan.STATUS_UP_TO_DATE,
+		])
+		# The movie is installed after the script, so it is re-installed when the script is updated
+		self.assertEqual([plan.totalDownload for plan in plans], [1110, 110, 0])
+		self.assertEqual([modFileID for modFileID, _ in plans[1].updateReasons], ['script', 'movie'])
+		self.assertEqual(plans[1].downloadURLs, ['https://07th-mod.com/script.zip', 'https://07th-mod.com/movie.7z'])
+
+
+if __name__ == '__main__':
+	unittest.main()
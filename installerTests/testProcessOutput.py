@@ -0,0 +1,59 @@
+import sys
+import unittest
+
+import common
+
+
+class LineCollector:
+	def __init__(self):
+		self.lines = []
+
+	def process(self, line):
+		self.lines.append(line)
+
+
+class TestProcessOutputSplitter(unittest.TestCase):
+	def test_splitsOnModeSpecificDelimiters(self):
+		splitter = common.ProcessOutputSplitter(ariaMode=True)
+		self.assertEqual(splitter.feed(b'[#1 5MiB/10MiB(50%)]\r\n[#1 10MiB'), [
+			('[#1 5MiB/10MiB(50%)]\n', False),
+			(' \n', True),
+		])
+		self.assertEqual(splitter.finish(), [('[#1 10MiB\n', True)])
+
+		splitter = common.ProcessOutputSplitter(sevenZipMode=True)
+		self.assertEqual(splitter.feed(b' 12% 3 - a.txt\n'), [(' 12%\n', False), (' 3 - a.txt\n', True)])
+
+	def test_multiByteCharacterSplitBetweenChunks(self):
+		text = u'\u65e5\u672c\u8a9e.txt\n'
+		data = text.encode('utf-8')
+		splitter = common.ProcessOutputSplitter()
+		lines = []
+		for i in range(len(data)):
+			lines.extend(splitter.feed(data[i:i + 1]))
+
+		# On Python 2 the output isn't decoded, so the bytes are passed through unchanged
+		self.assertEqual(lines, [(data if common.Globals.IS_PYTHON_2 else text, True)])
+
+	def test_runProcessOutputToTempFile(self):
+		script = "import sys; sys.stdout.write('a%b\\n' * 50000 + 'end'); sys.stderr.write('error\\n'); sys.exit(3)"
+
+		# Check both the threaded reader and the processSupervisor (asyncio) reader
+		oldUseProcessSupervisor = common.Globals.USE_PROCESS_SUPERVISOR
+		try:
+			for useProcessSupervisor in [False, True]:
+				common.Globals.USE_PROCESS_SUPERVISOR = useProcessSupervisor
+				collector = LineCollector()
+				returnCode = common.runProcessOutputToTempFile([sys.executable, '-c', script], sevenZipMode=True, lineMonitor=collector)
+
+				self.assertEqual(returnCode, 3)
+				self.assertEqual(len(collector.lines), 100002)
+				self.assertEqual(collector.lines[:2], ['a%\n', 'b\n'])
+				self.assertIn('end\n', collector.lines)
+				self.assertIn('error\n', collector.lines)
+		finally:
+			common.Globals.USE_PROCESS_SUPERVISOR = oldUseProcessSupervisor
+
+
+if __name__ == '__main__':
+	unittest.main()
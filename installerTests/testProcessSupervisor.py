@@ -0,0 +1,53 @@
+import sys
+import time
+import unittest
+
+if sys.version_info >= (3, 8):
+	import processSupervisor
+
+
+class LineCollector:
+	def __init__(self):
+		self.lines = []
+
+	def process(self, line):
+		self.lines.append(line)
+
+
+@unittest.skipIf(sys.version_info < (3, 8), "processSupervisor requires Python 3.8+")
+class TestProcessSupervisor(unittest.TestCase):
+	def setUp(self):
+		self.supervisor = processSupervisor.ProcessSupervisor()
+
+	def tearDown(self):
+		self.supervisor.stop()
+
+	def test_concurrentProcessesAndOutput(self):
+		script = "import sys, time; time.sleep(0.5); sys.stdout.write('10%done\\n'); sys.stderr.write('err'); sys.exit({})"
+		collectors = [LineCollector() for _ in range(4)]
+
+		startTime = time.time()
+		futures = [self.supervisor.submit([sys.executable, '-c', script.format(i)], sevenZipMode=True, lineMonitor=collector)
+		           for i, collector in enumerate(collectors)]
+		self.assertEqual([future.result() for future in futures], [0, 1, 2, 3])
+		self.assertLess(time.time() - startTime, 2)
+
+		for collector in collectors:
+			self.assertEqual(sorted(collector.lines), sorted(['10%\n', 'done\n', 'err\n']))
+		self.assertEqual(self.supervisor.numRunningProcesses(), 0)
+
+	def test_timeoutAndCancel(self):
+		sleepForever = [sys.executable, '-c', 'import time; time.sleep(60)']
+		with self.assertRaises(processSupervisor.ProcessTimeoutException):
+			self.supervisor.run(sleepForever, timeout=0.5)
+
+		future = self.supervisor.submit(sleepForever)
+		while self.supervisor.numRunningProcesses() == 0:
+			time.sleep(0.05)
+		self.supervisor.cancelAll()
+		self.assertNotEqual(future.result(timeout=10), 0)
+		self.assertEqual(self.supervisor.numRunningProcesses(), 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+import httpGUI
+import progressEvents
+
+
+class TestProgressEventBus(unittest.TestCase):
+	def setUp(self):
+		self.bus = progressEvents.ProgressEventBus(maxLogMessages=3)
+
+	def takeSnapshot(self):
+		return self.bus.takeSnapshot(httpGUI._loggerMessageToStatusDict)
+
+	def test_progressIsCoalesced(self):
+		self.bus.publishLog('first\n')
+		self.bus.publishProgressLine('[#1a2b3c 1MiB/10MiB(10%) CN:1 DL:1MiB ETA:9s]\n')
+		self.bus.publishOverallStatus(40, 'Downloading')
+		for i in range(2, 100):
+			self.bus.publishProgressLine(' {} - big/file{}.png\b\b\b{}%\n'.format(i, i, i))
+		self.bus.publishProgressLine('99%\n')
+
+		self.assertEqual(self.takeSnapshot(), [
+			{'msg': 'first\n'},
+			{'overallPercentage': 40, 'overallTaskDescription': 'Downloading'},
+			{'subTaskPercentage': 99, 'subTaskDescription': 'Extracting - 99 - big/file99.png 99% '},
+		])
+		self.assertEqual(self.takeSnapshot(), [])
+
+		# Progress from before the latest overall status is out of date, so is not sent
+		self.bus.publishProgressLine('50%\n')
+		self.bus.publishOverallStatus(100, 'Finished')
+		self.assertEqual(self.takeSnapshot(), [{'overallPercentage': 100, 'overallTaskDescription': 'Finished'}])
+
+	def test_logMessagesAreBoundedAndSuppressible(self):
+		for i in range(5):
+			self.bus.publishLog('line {}\n'.format(i))
+
+		self.bus.threadLocal.suppressLog = True
+		self.bus.publishLog('not sent to the GUI\n')
+		self.bus.threadLocal.suppressLog = False
+
+		messages = self.bus.takeLogMessages()
+		self.assertIn('2 log messages were skipped', messages[0])
+		self.assertEqual(messages[1:], ['line 2\n', 'line 3\n', 'line 4\n'])
+		self.assertEqual(self.bus.takeLogMessages(), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import common
+import urlMetadataCache
+from testDownloadEngines import LocalHTTPServer
+
+
+class TestURLMetadataCache(unittest.TestCase):
+	def setUp(self):
+		self.server = LocalHTTPServer()
+		self.cacheDir = tempfile.mkdtemp()
+		self.oldCachePath = common.Globals.URL_METADATA_CACHE_PATH
+		self.oldTTL = common.Globals.URL_METADATA_CACHE_TTL_SECONDS
+		common.Globals.URL_METADATA_CACHE_PATH = os.path.join(self.cacheDir, 'urlMetadataCache.json')
+		common.DownloaderAndExtractor.sharedURLMetadataCache = None
+
+	def tearDown(self):
+		common.Globals.URL_METADATA_CACHE_PATH = self.oldCachePath
+		common.Globals.URL_METADATA_CACHE_TTL_SECONDS = self.oldTTL
+		common.DownloaderAndExtractor.sharedURLMetadataCache = None
+		self.server.close()
+		shutil.rmtree(self.cacheDir)
+
+	def test_cacheIsPersistedAndRevalidated(self):
+		url = self.server.addFile('test.7z', b'1234')
+		filePath = os.path.join(self.server.directory, 'test.7z')
+		os.utime(filePath, (time.time() - 100, time.time() - 100))
+
+		item, = common.DownloaderAndExtractor.getExtractableItem(url, '.')
+		self.assertEqual((item.filename, item.length), ('test.7z', 4))
+
+		# A new cache object loads the previous result from disk, so the server is not contacted
+		common.DownloaderAndExtractor.sharedURLMetadataCache = None
+		os.remove(filePath)
+		item, = common.DownloaderAndExtractor.getExtractableItem(url, '.')
+		self.assertEqual((item.filename, item.length), ('test.7z', 4))
+
+		# Once the entry expires, an unchanged file is revalidated using If-Modified-Since
+		common.Globals.URL_METADATA_CACHE_TTL_SECONDS = 0
+		common.DownloaderAndExtractor.sharedURLMetadataCache = None
+		self.server.addFile('test.7z', b'5678')
+		os.utime(filePath, (time.time() - 100, time.time() - 100))
+		cache = common.DownloaderAndExtractor.getURLMetadataCache()
+		fetchTimeBefore = cache.lookup(url)[0]['fetchTime']
+		item, = common.DownloaderAndExtractor.getExtractableItem(url, '.')
+		self.assertGreater(cache.lookup(url)[0]['fetchTime'], fetchTimeBefore)
+
+		# If the file has changed, the new metadata is retrieved
+		self.server.addFile('test.7z', b'123456')
+		item, = common.DownloaderAndExtractor.getExtractableItem(url, '.')
+		self.assertEqual(item.length, 6)
+
+	def test_sizeMismatchRequeriesURL(self):
+		url = self.server.addFile('test.7z', b'1234')
+		item, = common.DownloaderAndExtractor.getExtractableItem(url, '.')
+
+		# The file changes on the server while the old metadata is still cached, so the download is the wrong size
+		self.server.addFile('test.7z', b'123456')
+		downloaderAndExtractor = common.DownloaderAndExtractor([], self.cacheDir, self.cacheDir)
+		with open(os.path.join(self.cacheDir, 'test.7z'), 'wb') as f:
+			f.write(b'123456')
+
+		self.assertTrue(downloaderAndExtractor.extractablesHasInvalidArchives([item]))
+		self.assertEqual(item.length, 6)
+		self.assertEqual(common.DownloaderAndExtractor.getURLMetadataCache().lookup(url)[0]['length'], 6)
+		self.assertFalse(os.path.exists(os.path.join(self.cacheDir, 'test.7z')))
+
+	def test_corruptCacheFileIsIgnored(self):
+		cachePath = common.Globals.URL_METADATA_CACHE_PATH
+		with open(cachePath, 'w') as f:
+			f.write('{not json')
+
+		cache = urlMetadataCache.URLMetadataCache(cachePath, 60)
+		self.assertEqual(cache.lookup('http://example.com/a.7z'), (None, False))
+		cache.store('http://example.com/a.7z', filename='a.7z', length=1)
+		self.assertEqual(urlMetadataCache.URLMetadataCache(cachePath, 60).lookup('http://example.com/a.7z')[0]['length'], 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+import zipfile
+
+import common
+import zipExtractor
+
+
+class TestZipExtractor(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+		self.outputDir = os.path.join(self.tempDir, 'output')
+		self.archivePath = os.path.join(self.tempDir, 'test.zip')
+
+		self.files = {'data/file{}.txt'.format(i): os.urandom(i * 1000) for i in range(50)}
+		self.files['data/sub/big.bin'] = b'x' * (3 * 1024 * 1024)
+		with zipfile.ZipFile(self.archivePath, 'w', zipfile.ZIP_DEFLATED) as archive:
+			archive.writestr('data/empty/', b'')
+			for name, data in self.files.items():
+				archive.writestr(name, data)
+
+			executable = zipfile.ZipInfo('data/run.sh')
+			executable.external_attr = (stat.S_IFREG | 0o755) << 16
+			archive.writestr(executable, b'#!/bin/sh\n')
+
+			# Members can't be extracted outside the output folder
+			archive.writestr('../escaped.txt', b'escaped')
+
+	def tearDown(self):
+		shutil.rmtree(self.tempDir)
+
+	def test_extractZip(self):
+		self.assertTrue(zipExtractor.canExtractInProcess(self.archivePath))
+
+		# Existing files are overwritten
+		os.makedirs(os.path.join(self.outputDir, 'data'))
+		with open(os.path.join(self.outputDir, 'data', 'file1.txt'), 'wb') as f:
+			f.write(b'old' * 10000)
+
+		zipExtractor.extractZip(self.archivePath, self.outputDir, maxWorkers=4)
+
+		for name, data in self.files.items():
+			with open(os.path.join(self.outputDir, name), 'rb') as f:
+				self.assertEqual(f.read(), data)
+
+		self.assertTrue(os.path.isdir(os.path.join(self.outputDir, 'data', 'empty')))
+		self.assertTrue(os.path.isfile(os.path.join(self.outputDir, 'escaped.txt')))
+		self.assertFalse(os.path.exists(os.path.join(self.tempDir, 'escaped.txt')))
+		if not common.Globals.IS_WINDOWS:
+			self.assertTrue(os.stat(os.path.join(self.outputDir, 'data', 'run.sh')).st_mode & stat.S_IXUSR)
+
+	def test_unsupportedArchivesUse7z(self):
+		splitArchivePath = self.archivePath + '.001'
+		shutil.copy(self.archivePath, splitArchivePath)
+		self.assertFalse(zipExtractor.canExtractInProcess(splitArchivePath))
+
+		notAZipPath = os.path.join(self.tempDir, 'notAZip.zip')
+		with open(notAZipPath, 'wb') as f:
+			f.write(b'7z archive')
+		self.assertFalse(zipExtractor.canExtractInProcess(notAZipPath))
+
+		symlinkArchivePath = os.path.join(self.tempDir, 'symlink.zip')
+		with zipfile.ZipFile(symlinkArchivePath, 'w') as archive:
+			link = zipfile.ZipInfo('link')
+			link.external_attr = (stat.S_IFLNK | 0o777) << 16
+			archive.writestr(link, 'target')
+		self.assertFalse(zipExtractor.canExtractInProcess(symlinkArchivePath))
+
+	def test_namesNotFlaggedAsUTF8Use7z(self):
+		utf8ArchivePath = os.path.join(self.tempDir, 'utf8.zip')
+		with zipfile.ZipFile(utf8ArchivePath, 'w') as archive:
+			archive.writestr(u'\u30c6\u30b9\u30c8.txt', b'test')
+		self.assertTrue(zipExtractor.canExtractInProcess(utf8ArchivePath))
+
+		# zipfile always flags non-ASCII names as UTF-8, so write an ASCII name of the same length, then replace it
+		# with the Shift-JIS encoded name (as written by Japanese versions of Windows)
+		shiftJISName = u'\u30c6\u30b9\u30c8.txt'.encode('shift_jis')
+		placeholderName = b'x' * len(shiftJISName)
+		shiftJISArchivePath = os.path.join(self.tempDir, 'shiftJIS.zip')
+		with zipfile.ZipFile(shiftJISArchivePath, 'w') as archive:
+			archive.writestr(placeholderName.decode('ascii'), b'test')
+		with open(shiftJISArchivePath, 'rb') as f:
+			archiveData = f.read()
+		with open(shiftJISArchivePath, 'wb') as f:
+			f.write(archiveData.replace(placeholderName, shiftJISName))
+
+		self.assertFalse(zipExtractor.canExtractInProcess(shiftJISArchivePath))
+
+
+if __name__ == '__main__':
+	unittest.main()
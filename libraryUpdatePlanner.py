@@ -0,0 +1,134 @@
+from __future__ import print_function, unicode_literals
+
+import os
+import time
+import traceback
+
+import common
+import fileVersionManagement
+import installConfiguration
+
+try:
+	from typing import Optional, List, Dict, Tuple
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+def getDataDirectory(fullInstallConfig):
+	# type: (installConfiguration.FullInstallConfiguration) -> str
+	"""The game's data folder, which the Higurashi installer needs to determine the unity version. Empty for other games."""
+	if fullInstallConfig.subModConfig.family != 'higurashi':
+		return ""
+
+	if common.Globals.IS_MAC:
+		return os.path.join(fullInstallConfig.installPath, "Contents/Resources/Data")
+
+	return os.path.join(fullInstallConfig.installPath, fullInstallConfig.subModConfig.dataName)
+
+def getInstallTimeProbePath(fullInstallConfig, dataDirectory):
+	# type: (installConfiguration.FullInstallConfiguration, str) -> Optional[str]
+	"""A game file used to check for a partial re-install (see fileVersionManagement.VersionManager.userDidPartialReinstall())"""
+	if fullInstallConfig.subModConfig.family == 'higurashi':
+		return os.path.join(dataDirectory, 'Managed', 'UnityEngine.dll')
+	elif fullInstallConfig.subModConfig.family == 'umineko':
+		return os.path.join(fullInstallConfig.installPath, 'fonts', 'oldface0.ttf')
+
+	return None
+
+
+class UpdatePlan:
+	"""The update status of one detected game install, as shown by the GUI's download preview"""
+	STATUS_NOT_INSTALLED = 'notInstalled'
+	STATUS_UP_TO_DATE = 'upToDate'
+	STATUS_UPDATE_AVAILABLE = 'updateAvailable'
+	STATUS_ERROR = 'error'
+
+	def __init__(self, fullInstallConfig):
+		# type: (installConfiguration.FullInstallConfiguration) -> None
+		self.fullInstallConfig = fullInstallConfig
+		self.status = UpdatePlan.STATUS_ERROR  # type: str
+		self.numUpdatesRequired = 0  # type: int
+		# The total size of the files which need to be downloaded, including mod options (which are always downloaded).
+		# Files whose size isn't known (see Globals.URL_FILE_SIZE_LOOKUP_TABLE) are not counted.
+		self.totalDownload = 0  # type: int
+		# For each mod file which needs an update, its id and the reason it needs an update
+		self.updateReasons = []  # type: List[Tuple[str, str]]
+		# The URLs which would be downloaded by an update, so they can be fetched in advance
+		self.downloadURLs = []  # type: List[str]
+		self.partialReinstallDetected = False  # type: bool
+		self.error = None  # type: Optional[str]
+
+
+def planUpdate(fullInstallConfig):
+	# type: (installConfiguration.FullInstallConfiguration) -> UpdatePlan
+	"""
+	Work out which files an install to the given game would download, in the same way as the GUI's download preview
+	(see httpGUI.getDownloadPreview()). Installed files are not verified, even if repair mode is enabled - files which
+	repair mode would check are counted as needing an update.
+	"""
+	plan = UpdatePlan(fullInstallConfig)
+	dataDirectory = getDataDirectory(fullInstallConfig)
+	modFileList = fullInstallConfig.buildFileListSorted(datadir=dataDirectory, verbosePrinting=False)
+	fileVersionManager = fileVersionManagement.VersionManager(
+		fullInstallConfiguration=fullInstallConfig,
+		modFileList=modFileList,
+		localVersionFolder=fullInstallConfig.installPath,
+		verbosePrinting=False,
+		datadir=dataDirectory,
+		verifyInstalledFiles=False)
+
+	installTimeProbePath = getInstallTimeProbePath(fullInstallConfig, dataDirectory)
+	if installTimeProbePath is not None:
+		plan.partialReinstallDetected = fileVersionManager.userDidPartialReinstall(installTimeProbePath)
+
+	for modFile in fileVersionManager.getFilesRequiringUpdate():
+		plan.updateReasons.append((modFile.id, fileVersionManager.updatesRequiredDict[modFile.id][1]))
+		if modFile.url is not None:
+			plan.downloadURLs.append(modFile.url)
+
+	# Like the download preview, mod options are only counted if some mod files need an update
+	if plan.updateReasons:
+		parser = installConfiguration.ModOptionParser(fullInstallConfig)
+		plan.downloadURLs.extend(option.url for option in parser.downloadAndExtractOptionsByPriority if option.url is not None)
+
+	plan.totalDownload = sum(common.Globals.URL_FILE_SIZE_LOOKUP_TABLE.get(url) or 0 for url in plan.downloadURLs)
+	plan.numUpdatesRequired = fileVersionManager.numUpdatesRequired
+
+	if fileVersionManager.fullUpdateRequired():
+		plan.status = UpdatePlan.STATUS_NOT_INSTALLED
+	elif plan.updateReasons:
+		plan.status = UpdatePlan.STATUS_UPDATE_AVAILABLE
+	else:
+		plan.status = UpdatePlan.STATUS_UP_TO_DATE
+
+	return plan
+
+def planLibraryUpdates(fullInstallConfigs, maxWorkers=None):
+	# type: (List[installConfiguration.FullInstallConfiguration], Optional[int]) -> List[UpdatePlan]
+	"""
+	Compute an UpdatePlan for every detected game install (eg. the output of gameScanner.scanForFullInstallConfigs()),
+	checking several installs at the same time. If an install can't be checked, its plan has STATUS_ERROR.
+	:param maxWorkers: The number of installs to check at the same time. Defaults to Globals.LIBRARY_UPDATE_PLANNER_THREADS
+	:return: One plan for each install, in the same order as fullInstallConfigs
+	"""
+	if maxWorkers is None:
+		maxWorkers = common.Globals.LIBRARY_UPDATE_PLANNER_THREADS
+
+	startTime = time.time()
+
+	def planUpdateOrError(fullInstallConfig):
+		try:
+			return planUpdate(fullInstallConfig)
+		except Exception as e:
+			print("libraryUpdatePlanner: Failed to check [{}] at [{}]".format(fullInstallConfig.subModConfig.subModName, fullInstallConfig.installPath))
+			traceback.print_exc()
+			plan = UpdatePlan(fullInstallConfig)
+			plan.error = str(e)
+			return plan
+
+	plans = common.parallelMap(planUpdateOrError, fullInstallConfigs, maxWorkers)
+
+	print("libraryUpdatePlanner: Checked {} installs in {:.1f}s - {} have updates available".format(
+		len(plans), time.time() - startTime, sum(1 for plan in plans if plan.status == UpdatePlan.STATUS_UPDATE_AVAILABLE)))
+
+	return plans
@@ -5,11 +5,7 @@ import os
 import shutil
 import sys
 import common
-
-try:
-	import queue
-except:
-	import Queue as queue
+import progressEvents
 
 class StdErrRedirector():
 	"""
@@ -38,7 +34,8 @@ class Logger(object):
 		self.secondaryLogFile = None
 		self.secondaryLogFilePath = None
 		self.callbacks = {}
-		self.queue = queue.Queue(maxsize=100000)
+		# Everything written to the log is also sent to the GUI, via the progress event bus
+		self.eventBus = progressEvents.getEventBus()
 
 	def write(self, message, runCallbacks=True, noTerminal=False):
 		if common.Globals.IS_PYTHON_2 and isinstance(message, str):
@@ -56,7 +53,7 @@ class Logger(object):
 			except:
 				pass
 
-		self._tryPutInQueue(message)
+		self.eventBus.publishLog(message)
 
 		#execute all bound callbacks
 		if runCallbacks:
@@ -79,31 +76,13 @@ class Logger(object):
 		#you might want to specify some extra behavior here.
 		pass
 
-	def threadSafeRead(self):
-		# type: () -> str
-		"""
-		:return: the latest message, or None if no more data to read
-		"""
-		try:
-			return self.queue.get_nowait()
-		except queue.Empty:
-			return None
-
 	def threadSafeReadAll(self):
 		# type: () -> [str]
 		"""
-		:return: An array of strings. If nothing to read, returns the empt ylist
+		:return: All messages written since the last call (or since the last status snapshot was taken from the
+		progress event bus). If nothing to read, returns the empty list
 		"""
-		return list(iter(self.threadSafeRead, None))
-
-	def _tryPutInQueue(self, item):
-		# type: (str) -> None
-		try:
-			self.queue.put_nowait(item)
-		except queue.Full:
-			if not self.queue_full_error:
-				self.queue_full_error = True
-				self.terminal.write("WARNING: Install status message queue is full (possibly GUI was closed but console left open)")
+		return self.eventBus.takeLogMessages()
 
 	def trySetSecondaryLoggingPath(self, newLogFilePath):
 		# type: (str) -> None
@@ -112,6 +112,18 @@ def installerCommonStartupTasks():
 		)
 	)
 
+	parser.add_argument(
+		'--download-engine',
+		dest="download_engine",
+		default=common.Globals.DOWNLOAD_ENGINE,
+		choices=[common.Globals.DOWNLOAD_ENGINE_ARIA2C, common.Globals.DOWNLOAD_ENGINE_ARIA2C_RPC, common.Globals.DOWNLOAD_ENGINE_PYTHON],
+		help=(
+			'Select how mod files are downloaded. "aria2c" starts a new aria2c process for each file. '
+			'"aria2c-rpc" uses a single aria2c process controlled via JSON-RPC. '
+			'"python" downloads in-process, without using aria2c.'
+		),
+	)
+
 	args = parser.parse_args()
 
 	if args.no_launch_browser:
@@ -129,6 +141,9 @@ def installerCommonStartupTasks():
 	if common.Globals.FORCE_ASSET_OS_STRING is not None:
 		print("Warning: Force asset argument passed - will install {} assets despite os being {}".format(common.Globals.FORCE_ASSET_OS_STRING, common.Globals.OS_STRING))
 
+	common.Globals.DOWNLOAD_ENGINE = args.download_engine
+	print("Download engine: {}".format(common.Globals.DOWNLOAD_ENGINE))
+
 	# Enable developer mode if we detect the program is run from the git repository
 	# Comment out this line to simulate a 'normal' installation - files will be fetched from the web.
 	if os.path.exists("installData.json"):
@@ -231,6 +246,7 @@ if __name__ == "__main__":
 		# Now parse/load the downloaded files. Note that some files may be used later in the installer.
 		modList = getModList(common.Globals.DEVELOPER_MODE)
 		common.Globals.loadCachedDownloadSizes(modList)
+		common.Globals.loadDownloadChecksums(modList)
 		return getSubModConfigList(modList)
 
 	def thread_unimportantTasks():
@@ -0,0 +1,165 @@
+from __future__ import print_function, unicode_literals
+
+# NOTE: This module requires Python 3.8 or later (for asyncio subprocesses which can be started from any thread).
+# Use getSharedProcessSupervisor(), which returns None on older versions of Python, in which case you should fall
+# back to running processes with one thread per pipe.
+
+import asyncio
+import atexit
+import sys
+import threading
+
+import common
+
+try:
+	from typing import Optional, List, Set, Any
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+class ProcessTimeoutException(Exception):
+	def __init__(self, errorReason):
+		# type: (str) -> None
+		self.errorReason = errorReason  # type: str
+
+	def __str__(self):
+		return self.errorReason
+
+
+class ProcessSupervisor:
+	"""
+	Runs child processes (aria2c, 7z etc.) on a single asyncio event loop, which runs on its own background thread.
+
+	Any number of processes can run at the same time - the stdout and stderr of every process are read on the one
+	event loop, rather than needing a thread per pipe. Output is split into lines in the same way as
+	common.runProcessOutputToTempFile() (see common.ProcessOutputSplitter).
+
+	run() may be called from any thread, and blocks until the process exits. Use submit() to start a process
+	without blocking, and cancelAll() to kill all running processes (for example when the installer is closed).
+	"""
+	READ_SIZE = 65536
+
+	def __init__(self):
+		self.loop = None  # type: Optional[asyncio.AbstractEventLoop]
+		self.thread = None  # type: Optional[threading.Thread]
+		self.lock = threading.Lock()
+		self.processes = set()  # type: Set[asyncio.subprocess.Process]
+
+	def start(self):
+		"""Start the event loop thread. Called automatically by submit(), so usually doesn't need to be called."""
+		with self.lock:
+			if self.loop is not None:
+				return
+
+			loopStarted = threading.Event()
+
+			def runLoop():
+				asyncio.set_event_loop(self.loop)
+				self.loop.call_soon(loopStarted.set)
+				self.loop.run_forever()
+
+			self.loop = asyncio.new_event_loop()
+			self.thread = threading.Thread(target=runLoop, name='ProcessSupervisor')
+			self.thread.daemon = True
+			self.thread.start()
+			loopStarted.wait()
+
+	def stop(self):
+		"""Kill all running processes, then stop the event loop thread"""
+		with self.lock:
+			if self.loop is None:
+				return
+			loop, thread = self.loop, self.thread
+			self.loop = None
+			self.thread = None
+
+		asyncio.run_coroutine_threadsafe(self._killAll(), loop).result()
+		loop.call_soon_threadsafe(loop.stop)
+		thread.join()
+		loop.close()
+
+	def submit(self, arguments, ariaMode=False, sevenZipMode=False, lineMonitor=None, timeout=None):
+		# type: (List[str], bool, bool, Any, Optional[float]) -> Any
+		"""
+		Start running a process, without waiting for it to finish.
+		:return: a concurrent.futures.Future. Its result is the process return code, or it raises
+		         ProcessTimeoutException if the process ran longer than timeout seconds (the process is then killed).
+		         Calling cancel() on the future kills the process.
+		"""
+		self.start()
+		return asyncio.run_coroutine_threadsafe(self._run(arguments, ariaMode, sevenZipMode, lineMonitor, timeout), self.loop)
+
+	def run(self, arguments, ariaMode=False, sevenZipMode=False, lineMonitor=None, timeout=None):
+		# type: (List[str], bool, bool, Any, Optional[float]) -> int
+		"""Same as submit(), but blocks until the process exits and returns its return code"""
+		return self.submit(arguments, ariaMode, sevenZipMode, lineMonitor, timeout).result()
+
+	def cancelAll(self):
+		"""Kill all running processes. Their run() calls will return the return code of the killed process."""
+		with self.lock:
+			loop = self.loop
+
+		if loop is not None:
+			asyncio.run_coroutine_threadsafe(self._killAll(), loop).result()
+
+	def numRunningProcesses(self):
+		# type: () -> int
+		return len(self.processes)
+
+	async def _killAll(self):
+		for process in list(self.processes):
+			ProcessSupervisor._tryKill(process)
+
+	@staticmethod
+	def _tryKill(process):
+		try:
+			process.kill()
+		except ProcessLookupError:
+			# The process has already exited
+			pass
+
+	async def _run(self, arguments, ariaMode, sevenZipMode, lineMonitor, timeout):
+		process = await asyncio.create_subprocess_exec(*arguments, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+		self.processes.add(process)
+
+		async def readUntilEOF(stream):
+			splitter = common.ProcessOutputSplitter(ariaMode=ariaMode, sevenZipMode=sevenZipMode)
+			while True:
+				data = await stream.read(ProcessSupervisor.READ_SIZE)
+				if not data:
+					break
+				common.outputProcessLines(splitter.feed(data), lineMonitor)
+			common.outputProcessLines(splitter.finish(), lineMonitor)
+
+		try:
+			await asyncio.wait_for(asyncio.gather(readUntilEOF(process.stdout), readUntilEOF(process.stderr), process.wait()), timeout)
+		except asyncio.TimeoutError:
+			ProcessSupervisor._tryKill(process)
+			await process.wait()
+			raise ProcessTimeoutException("Process [{}] did not finish within {} seconds and was killed".format(" ".join(arguments), timeout))
+		except asyncio.CancelledError:
+			ProcessSupervisor._tryKill(process)
+			await process.wait()
+			raise
+		finally:
+			self.processes.discard(process)
+
+		return process.returncode
+
+
+_sharedProcessSupervisor = None
+_sharedProcessSupervisorLock = threading.Lock()
+
+def getSharedProcessSupervisor():
+	# type: () -> Optional[ProcessSupervisor]
+	""":return: The ProcessSupervisor shared by the whole installer, or None if not supported on this version of Python"""
+	global _sharedProcessSupervisor
+	if sys.version_info < (3, 8):
+		return None
+
+	with _sharedProcessSupervisorLock:
+		if _sharedProcessSupervisor is None:
+			_sharedProcessSupervisor = ProcessSupervisor()
+			# Don't leave any aria2c/7z processes running after the installer exits
+			atexit.register(_sharedProcessSupervisor.cancelAll)
+		return _sharedProcessSupervisor
@@ -0,0 +1,151 @@
+from __future__ import print_function, unicode_literals
+
+import collections
+import threading
+
+try:
+	from typing import Optional, List, Dict, Any, Callable, Tuple
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+class ProgressEventBus:
+	"""
+	Collects the installer's status for the GUI, so that each statusUpdate request receives a small, coalesced
+	snapshot rather than every line ever printed.
+
+	There are three kinds of events:
+	- Log text: everything written to the log (see logger.Logger.write()). All new log text is included in each
+	  snapshot, up to maxLogMessages - if more arrives between snapshots, the oldest messages are dropped.
+	- Overall status (see commandLineParser.printSeventhModStatusUpdate()). Only the latest is kept.
+	- Progress lines: aria2c/7z progress ticks (see printProgressLine()). These are very frequent and each one
+	  supersedes the last, so only the most recent few are kept, and they are only parsed when a snapshot is taken.
+	  In-process tasks (like zipExtractor) can instead publish their progress directly with publishSubTaskProgress().
+
+	Progress lines and the overall status are printed to the log as usual, but with log events suppressed, so they
+	aren't also sent to the GUI as log text.
+	"""
+	def __init__(self, maxLogMessages=5000, maxProgressLines=32):
+		# type: (int, int) -> None
+		self.lock = threading.Lock()
+		self.threadLocal = threading.local()
+		self.nextSequenceNumber = 0
+
+		self.logMessages = collections.deque(maxlen=maxLogMessages)  # type: collections.deque[Tuple[int, str]]
+		self.numDroppedLogMessages = 0
+		self.overallStatus = None  # type: Optional[Tuple[int, int, str]]
+		# Each item is a progress line, or a status dict from publishSubTaskProgress()
+		self.progressLines = collections.deque(maxlen=maxProgressLines)  # type: collections.deque[Tuple[int, Any]]
+
+	def _takeSequenceNumber(self):
+		# Must be called with the lock held
+		self.nextSequenceNumber += 1
+		return self.nextSequenceNumber
+
+	def publishLog(self, message):
+		# type: (str) -> None
+		if getattr(self.threadLocal, 'suppressLog', False):
+			return
+
+		with self.lock:
+			if len(self.logMessages) == self.logMessages.maxlen:
+				self.numDroppedLogMessages += 1
+			self.logMessages.append((self._takeSequenceNumber(), message))
+
+	def publishOverallStatus(self, overallPercentage, currentTask):
+		# type: (int, str) -> None
+		with self.lock:
+			self.overallStatus = (self._takeSequenceNumber(), overallPercentage, currentTask)
+
+	def publishProgressLine(self, line):
+		# type: (str) -> None
+		with self.lock:
+			self.progressLines.append((self._takeSequenceNumber(), line))
+
+	def publishSubTaskProgress(self, subTaskPercentage, subTaskDescription):
+		# type: (int, str) -> None
+		with self.lock:
+			self.progressLines.append((self._takeSequenceNumber(), {
+				'subTaskPercentage': subTaskPercentage,
+				'subTaskDescription': subTaskDescription,
+			}))
+
+	def printWithoutLogEvent(self, text):
+		# type: (str) -> None
+		"""print() text (so it still appears in the console and log file) without publishing it as log text"""
+		self.threadLocal.suppressLog = True
+		try:
+			print(text, end='')
+		finally:
+			self.threadLocal.suppressLog = False
+
+	def takeLogMessages(self):
+		# type: () -> List[str]
+		"""Remove and return all log text received since the last call"""
+		with self.lock:
+			return [message for _, message in self._takeLogMessagesLocked()]
+
+	def _takeLogMessagesLocked(self):
+		messages = list(self.logMessages)
+		if self.numDroppedLogMessages:
+			messages.insert(0, (0, "--- {} log messages were skipped, see the log file for the full log ---\n".format(self.numDroppedLogMessages)))
+			self.numDroppedLogMessages = 0
+		self.logMessages.clear()
+		return messages
+
+	def takeSnapshot(self, messageToStatusDict):
+		# type: (Callable[[str], Dict[str, Any]]) -> List[Dict[str, Any]]
+		"""
+		Remove and return all events received since the last call, as a list of status dicts in the order they happened.
+
+		:param messageToStatusDict: Converts a line of text to a status dict (see httpGUI._loggerMessageToStatusDict())
+		:return: One status dict for each new log message, followed by at most one overall status and one progress
+		status. The progress status merges the latest subtask percentage and description from the progress lines.
+		"""
+		with self.lock:
+			logMessages = self._takeLogMessagesLocked()
+			overallStatus = self.overallStatus
+			self.overallStatus = None
+			progressLines = list(self.progressLines)
+			self.progressLines.clear()
+
+		statuses = [(sequenceNumber, messageToStatusDict(message)) for sequenceNumber, message in logMessages]
+
+		if overallStatus is not None:
+			sequenceNumber, overallPercentage, currentTask = overallStatus
+			statuses.append((sequenceNumber, {
+				"overallPercentage": overallPercentage,
+				"overallTaskDescription": "{}".format(currentTask),
+			}))
+			# The GUI resets the subtask status when the overall status changes, so older progress is out of date
+			progressLines = [x for x in progressLines if x[0] > sequenceNumber]
+
+		# Only parse as many of the latest progress lines as needed to find the latest subtask percentage/description
+		progressStatus = {}
+		for _, line in reversed(progressLines):
+			status = line if isinstance(line, dict) else messageToStatusDict(line)
+			for key in ['subTaskPercentage', 'subTaskDescription']:
+				if key in status and key not in progressStatus:
+					progressStatus[key] = status[key]
+
+			if len(progressStatus) == 2:
+				break
+
+		if progressStatus:
+			statuses.append((progressLines[-1][0], progressStatus))
+
+		statuses.sort(key=lambda x: x[0])
+		return [status for _, status in statuses]
+
+
+_eventBus = ProgressEventBus()
+
+def getEventBus():
+	# type: () -> ProgressEventBus
+	return _eventBus
+
+def printProgressLine(line):
+	# type: (str) -> None
+	"""Print a progress tick from aria2c/7z/a download engine, which only needs to reach the GUI if it is the latest"""
+	_eventBus.publishProgressLine(line)
+	_eventBus.printWithoutLogEvent(line if line.endswith('\n') else line + '\n')
@@ -168,6 +168,7 @@ ignore_paths = [
 	'github_actions_changelog_template.md',
 	'github_actions_changelog_template_generated.md',
 	'07th-mod_temp_dir',
+	'07th-mod_cache',
 	'travis_build_script.py',
 	'server-info.json',
 	'server-info-old.json',
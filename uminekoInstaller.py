@@ -7,6 +7,7 @@ import os, shutil, subprocess, hashlib
 import fileVersionManagement
 import gameScanner
 import installConfiguration
+import installJournal
 import logger
 import steamGridExtractor
 
@@ -128,36 +129,21 @@ def mainUmineko(conf):
 	filesRequiringUpdate = fileVersionManager.getFilesRequiringUpdate()
 	print("Perform Full Install: {}".format(fileVersionManager.fullUpdateRequired()))
 	conf.subModConfig.printEnabledOptions()
-	downloaderAndExtractor = common.DownloaderAndExtractor(filesRequiringUpdate, downloadTempDir, conf.installPath, downloadProgressAmount=45, extractionProgressAmount=45, skipDownload=skipDownload)
+	downloaderAndExtractor = common.DownloaderAndExtractor(filesRequiringUpdate, downloadTempDir, conf.installPath, downloadProgressAmount=45, extractionProgressAmount=45, skipDownload=skipDownload, segmentedDownloads=optionParser.segmentedDownloads)
 	downloaderAndExtractor.buildDownloadAndExtractionList()
 
-	for opt in optionParser.downloadAndExtractOptionsByPriority:
-		downloaderAndExtractor.addItemManually(
-			url=opt.url,
-			extractionDir=os.path.join(conf.installPath, opt.relativeExtractionPath),
-		)
+	downloaderAndExtractor.addItemsManually([
+		(opt.url, os.path.join(conf.installPath, opt.relativeExtractionPath))
+		for opt in optionParser.downloadAndExtractOptionsByPriority
+	], sourceIDs=[opt.name for opt in optionParser.downloadAndExtractOptionsByPriority])
 
 	downloaderAndExtractor.printPreview()
 
-	downloaderAndExtractor.download()
-
-	# Treat the install as "started" once the "download" stage is complete
-	fileVersionManager.saveVersionInstallStarted()
-
-	###################### Backup/clear the .exe and script files, and old graphics ####################################
-	backupOrRemoveFiles(conf.installPath)
-
-	if fileVersionManager.fullUpdateRequired():
-		# Remove old graphics from a previous installation, as they can conflict with the voice-only patch
-		graphicsPathsToDelete = [os.path.join(conf.installPath, x) for x in ['big', 'bmp', 'en']]
-
-		for folderPath in graphicsPathsToDelete:
-			if os.path.exists(folderPath):
-				print("Deleting {}".format(folderPath))
-				try:
-					shutil.rmtree(folderPath)
-				except:
-					print("WARNING: failed to remove folder {}".format(folderPath))
+	# If the same install was stopped part way through, continue from the last completed step
+	journal = installJournal.openInstallJournal(conf.installPath, fileVersionManager, downloaderAndExtractor.extractList)
+	downloaderAndExtractor.journal = journal
+	# Record each mod file as installed as soon as it has been extracted, so if the install is stopped, it won't be installed again
+	downloaderAndExtractor.onSourceExtracted = lambda sourceID: fileVersionManager.saveVersionCheckpoint(sourceID, installedFiles=downloaderAndExtractor.installedFiles)
 
 	######################################## Extract Archives ##########################################################
 	def remapPaths(originalFolder, originalFilename):
@@ -167,10 +153,31 @@ def mainUmineko(conf):
 		else:
 			return originalFolder, originalFilename
 
-	# If any mod options request deletion of a folder, do it before the extraction
-	common.applyDeletions(conf.installPath, optionParser)
+	def prepareGameDirectory():
+		# Treat the install as "started" once the first file has been downloaded
+		fileVersionManager.saveVersionInstallStarted()
+
+		###################### Backup/clear the .exe and script files, and old graphics ################################
+		backupOrRemoveFiles(conf.installPath)
+
+		if fileVersionManager.fullUpdateRequired():
+			# Remove old graphics from a previous installation, as they can conflict with the voice-only patch
+			graphicsPathsToDelete = [os.path.join(conf.installPath, x) for x in ['big', 'bmp', 'en']]
+
+			for folderPath in graphicsPathsToDelete:
+				if os.path.exists(folderPath):
+					print("Deleting {}".format(folderPath))
+					try:
+						shutil.rmtree(folderPath)
+					except:
+						print("WARNING: failed to remove folder {}".format(folderPath))
+
+		# If any mod options request deletion of a folder, do it before the extraction
+		common.applyDeletions(conf.installPath, optionParser, installedFiles=downloaderAndExtractor.installedFiles)
 
-	downloaderAndExtractor.extract(remapPaths)
+	# Each archive is extracted while the following archives are still downloading.
+	# Files extracted by a previous (stopped) install must not be backed up or deleted again.
+	downloaderAndExtractor.downloadAndExtract(remapPaths, beforeExtraction=lambda: installJournal.runStepOnce(journal, installJournal.STEP_PREPARE_GAME_FOLDER, prepareGameDirectory))
 
 	############################################# FIX .ARC FILE NAMING #################################################
 	# Steam release has arc files labeled arc.nsa, arc1.nsa, arc2.nsa, arc3.nsa.
@@ -229,7 +236,9 @@ pause
 	# For now, don't copy save data
 	if optionParser.installSteamGrid:
 		steamGridExtractor.extractSteamGrid(downloadTempDir)
-	fileVersionManager.saveVersionInstallFinished()
+	fileVersionManager.saveVersionInstallFinished(installedFiles=downloaderAndExtractor.installedFiles)
+	if journal is not None:
+		journal.delete()
 
 	if not optionParser.keepDownloads and not skipDownload:
 		print("Removing temporary downloads:")
@@ -7,6 +7,7 @@ import os
 import fileVersionManagement
 import gameScanner
 import installConfiguration
+import installJournal
 import logger
 
 #do install given a installer config object
@@ -52,26 +53,31 @@ def main(conf):
 
 	filesRequiringUpdate = fileVersionManager.getFilesRequiringUpdate()
 	conf.subModConfig.printEnabledOptions()
-	downloaderAndExtractor = common.DownloaderAndExtractor(filesRequiringUpdate, downloadTempDir, conf.installPath, downloadProgressAmount=45, extractionProgressAmount=45, skipDownload=skipDownload)
+	downloaderAndExtractor = common.DownloaderAndExtractor(filesRequiringUpdate, downloadTempDir, conf.installPath, downloadProgressAmount=45, extractionProgressAmount=45, skipDownload=skipDownload, segmentedDownloads=parser.segmentedDownloads)
 	downloaderAndExtractor.buildDownloadAndExtractionList()
 
-	for opt in parser.downloadAndExtractOptionsByPriority:
-		downloaderAndExtractor.addItemManually(
-			url=opt.url,
-			extractionDir=os.path.join(conf.installPath, opt.relativeExtractionPath),
-		)
+	downloaderAndExtractor.addItemsManually([
+		(opt.url, os.path.join(conf.installPath, opt.relativeExtractionPath))
+		for opt in parser.downloadAndExtractOptionsByPriority
+	], sourceIDs=[opt.name for opt in parser.downloadAndExtractOptionsByPriority])
 
 	downloaderAndExtractor.printPreview()
 
-	# Download files
-	downloaderAndExtractor.download()
+	# If the same install was stopped part way through, continue from the last completed step
+	journal = installJournal.openInstallJournal(conf.installPath, fileVersionManager, downloaderAndExtractor.extractList)
+	downloaderAndExtractor.journal = journal
+	# Record each mod file as installed as soon as it has been extracted, so if the install is stopped, it won't be installed again
+	downloaderAndExtractor.onSourceExtracted = lambda sourceID: fileVersionManager.saveVersionCheckpoint(sourceID, installedFiles=downloaderAndExtractor.installedFiles)
 
-	# If any mod options request deletion of a folder, do it before the extraction
-	common.applyDeletions(conf.installPath, parser)
+	def prepareGameDirectory():
+		# If any mod options request deletion of a folder, do it before the extraction
+		common.applyDeletions(conf.installPath, parser, installedFiles=downloaderAndExtractor.installedFiles)
+		fileVersionManager.saveVersionInstallStarted()
 
-	# Extract files
-	fileVersionManager.saveVersionInstallStarted()
-	downloaderAndExtractor.extract()
+	# Download and extract files - each file is extracted while the following files are still downloading
+	downloaderAndExtractor.downloadAndExtract(beforeExtraction=lambda: installJournal.runStepOnce(journal, installJournal.STEP_PREPARE_GAME_FOLDER, prepareGameDirectory))
 
-	fileVersionManager.saveVersionInstallFinished()
+	fileVersionManager.saveVersionInstallFinished(installedFiles=downloaderAndExtractor.installedFiles)
+	if journal is not None:
+		journal.delete()
 	commandLineParser.printSeventhModStatusUpdate(100, "Umineko Hane install script completed!")
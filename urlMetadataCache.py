@@ -0,0 +1,119 @@
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import threading
+import time
+import traceback
+
+import common
+
+try:
+	from typing import Optional, Dict, Any, Tuple
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+class URLMetadataCache:
+	"""
+	A persistent (on-disk) cache of the metadata retrieved when querying a download url, so that the
+	same urls don't need to be queried again each time the installer is started.
+
+	Each entry is keyed by url, and is a dict containing:
+	- 'filename': the filename the url downloads as (None for metalinks)
+	- 'length': the file size in bytes (0 if unknown, or for metalinks)
+	- 'lastModified': the Last-Modified http header, if any
+	- 'etag': the ETag http header, if any
+	- 'metalink': the text of the metalink file, if the url is a metalink
+	- 'fetchTime': the time the entry was last retrieved or revalidated
+
+	Entries younger than ttlSeconds are used as-is. Older entries should be revalidated with the server using
+	their 'etag' and 'lastModified' values (conditional request) - if the server says the url is unchanged,
+	call markRevalidated() to reset the entry's age.
+	"""
+	VERSION = 1
+
+	def __init__(self, cachePath, ttlSeconds):
+		# type: (str, float) -> None
+		self.cachePath = cachePath
+		self.ttlSeconds = ttlSeconds
+		self.lock = threading.Lock()
+		self.entries = self._load()  # type: Dict[str, Dict[str, Any]]
+
+	def _load(self):
+		# type: () -> Dict[str, Dict[str, Any]]
+		if not os.path.exists(self.cachePath):
+			return {}
+
+		try:
+			with io.open(self.cachePath, 'r', encoding='utf-8') as f:
+				cacheJSON = json.load(f)
+
+			if cacheJSON.get('version') != URLMetadataCache.VERSION:
+				print("URLMetadataCache: Ignoring cache file [{}] with different version".format(self.cachePath))
+				return {}
+
+			return cacheJSON['entries']
+		except Exception:
+			print("URLMetadataCache: Failed to load cache file [{}] - cache will be reset".format(self.cachePath))
+			traceback.print_exc()
+			return {}
+
+	def _save(self):
+		# Must be called with the lock held
+		try:
+			cacheFolder = os.path.dirname(self.cachePath)
+			if cacheFolder and not os.path.exists(cacheFolder):
+				os.makedirs(cacheFolder)
+
+			common.atomicWriteText(self.cachePath, json.dumps({'version': URLMetadataCache.VERSION, 'entries': self.entries}, indent=1, sort_keys=True))
+		except Exception:
+			# The cache is only an optimization, so don't stop the install if it can't be saved
+			print("URLMetadataCache: Failed to save cache file [{}]".format(self.cachePath))
+			traceback.print_exc()
+
+	def lookup(self, url):
+		# type: (str) -> Tuple[Optional[Dict[str, Any]], bool]
+		"""
+		:return: A tuple of (entry, isFresh). entry is None if the url is not in the cache.
+		If isFresh is False, the entry should be revalidated before it is used.
+		"""
+		with self.lock:
+			entry = self.entries.get(url)
+			if entry is None:
+				return None, False
+
+			age = time.time() - entry.get('fetchTime', 0)
+			return dict(entry), 0 <= age < self.ttlSeconds
+
+	def store(self, url, filename=None, length=0, lastModified=None, etag=None, metalink=None):
+		# type: (str, Optional[str], int, Optional[str], Optional[str], Optional[str]) -> Dict[str, Any]
+		entry = {
+			'filename': filename,
+			'length': length,
+			'lastModified': lastModified,
+			'etag': etag,
+			'metalink': metalink,
+			'fetchTime': time.time(),
+		}
+
+		with self.lock:
+			self.entries[url] = entry
+			self._save()
+
+		return dict(entry)
+
+	def markRevalidated(self, url):
+		# type: (str) -> None
+		"""Call this when the server confirms a cached url has not changed (eg. HTTP 304 Not Modified)"""
+		with self.lock:
+			if url in self.entries:
+				self.entries[url]['fetchTime'] = time.time()
+				self._save()
+
+	def remove(self, url):
+		# type: (str) -> None
+		with self.lock:
+			if self.entries.pop(url, None) is not None:
+				self._save()
@@ -0,0 +1,181 @@
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import stat
+import threading
+import time
+import zipfile
+
+import common
+import progressEvents
+
+try:
+	from typing import Optional, List, Tuple, Set
+except ImportError:
+	pass # Just needed for pycharm comments
+
+
+class ZipExtractionException(Exception):
+	def __init__(self, errorReason):
+		# type: (str) -> None
+		self.errorReason = errorReason  # type: str
+
+	def __str__(self):
+		return self.errorReason
+
+
+# Compression methods which Python's zipfile module can decompress
+SUPPORTED_COMPRESSION_TYPES = set([zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED] +
+                                  [getattr(zipfile, name) for name in ['ZIP_BZIP2', 'ZIP_LZMA'] if hasattr(zipfile, name)])
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+PROGRESS_INTERVAL_SECONDS = 0.2
+
+
+def _unixMode(info):
+	# type: (zipfile.ZipInfo) -> int
+	"""The unix file mode stored in a zip member (0 if the zip was not made on a unix-like system)"""
+	return (info.external_attr >> 16) & 0xFFFF
+
+def canExtractInProcess(archivePath):
+	# type: (str) -> bool
+	"""
+	Returns True if the archive is a (non-split) zip file which extractZip() can extract. Returns False for
+	.7z files, split archives, and zips which use features zipfile doesn't support (encryption, unusual compression
+	methods, symlinks), which should be extracted with 7z instead.
+
+	Also returns False if any member has a non-ASCII name which isn't flagged as UTF-8. zipfile always decodes these
+	names as cp437, while 7z uses the system's code page, so (for example) Japanese file names would be mangled.
+	"""
+	if not archivePath.lower().endswith('.zip') or not zipfile.is_zipfile(archivePath):
+		return False
+
+	try:
+		with zipfile.ZipFile(archivePath) as archive:
+			for info in archive.infolist():
+				if info.flag_bits & 0x1:
+					return False
+				if info.compress_type not in SUPPORTED_COMPRESSION_TYPES:
+					return False
+				if stat.S_ISLNK(_unixMode(info)):
+					return False
+				if not info.flag_bits & 0x800 and any(ord(c) > 127 for c in info.filename):
+					return False
+	except Exception as e:
+		print("zipExtractor: Can't read [{}] ({}), will use 7z instead".format(archivePath, e))
+		return False
+
+	return True
+
+def _safeMemberPath(outputDir, memberName):
+	# type: (str, str) -> Optional[str]
+	"""
+	Convert a zip member name to a path within outputDir, in the same way as zipfile.ZipFile.extract() -
+	absolute paths, drive letters and '..' components are removed, so a member can't be written outside outputDir.
+	"""
+	arcname = memberName.replace('\\', '/')
+	arcname = os.path.splitdrive(arcname)[1]
+	parts = [x for x in arcname.split('/') if x not in ('', os.path.curdir, os.path.pardir)]
+	if not parts:
+		return None
+
+	return os.path.join(outputDir, *parts)
+
+def _splitIntoBatches(members, numBatches):
+	# type: (List[Tuple[zipfile.ZipInfo, str]], int) -> List[List[Tuple[zipfile.ZipInfo, str]]]
+	"""Split the members into batches of roughly equal (uncompressed) size, largest members first"""
+	batches = [[] for _ in range(numBatches)]
+	batchSizes = [0] * numBatches
+	for member in sorted(members, key=lambda x: x[0].file_size, reverse=True):
+		smallestBatch = batchSizes.index(min(batchSizes))
+		batches[smallestBatch].append(member)
+		batchSizes[smallestBatch] += member[0].file_size
+
+	return [batch for batch in batches if batch]
+
+def extractZip(archivePath, outputDir, maxWorkers=None, excludedMembers=None):
+	# type: (str, str, Optional[int], Optional[Set[str]]) -> None
+	"""
+	Extract a zip file to outputDir, overwriting any existing files (like 'sevenZipExtract()' with '-aoa').
+
+	Members are extracted in parallel on a thread pool - each thread has its own handle to the zip file, and zlib
+	releases the GIL while decompressing. Progress is published directly to the GUI (see progressEvents).
+	Check canExtractInProcess() before calling this function.
+
+	:param maxWorkers: The number of threads to use. Defaults to Globals.ZIP_EXTRACTION_THREADS
+	:param excludedMembers: Names of members which should not be extracted (see extractionPlanner.py)
+	"""
+	if maxWorkers is None:
+		maxWorkers = common.Globals.ZIP_EXTRACTION_THREADS
+
+	print("zipExtractor: Extracting [{}] to [{}]".format(archivePath, outputDir))
+	startTime = time.time()
+
+	with zipfile.ZipFile(archivePath) as archive:
+		infoList = archive.infolist()
+
+	# Create all folders up front, so that threads don't race to create the same folders
+	members = []
+	folders = set([outputDir])
+	for info in infoList:
+		path = _safeMemberPath(outputDir, info.filename)
+		if path is None or (excludedMembers and info.filename in excludedMembers):
+			continue
+
+		if info.filename.endswith('/'):
+			folders.add(path)
+		else:
+			folders.add(os.path.dirname(path))
+			members.append((info, path))
+
+	for folder in sorted(folders):
+		common.makeDirsExistOK(folder)
+
+	totalSize = max(1, sum(info.file_size for info, _ in members))
+	eventBus = progressEvents.getEventBus()
+	progressLock = threading.Lock()
+	progress = {'numExtracted': 0, 'extractedSize': 0, 'lastPublishTime': 0.0}
+	errors = []
+
+	def extractBatch(batch):
+		with zipfile.ZipFile(archivePath) as archive:
+			for info, path in batch:
+				if errors:
+					return
+
+				try:
+					with archive.open(info) as source, open(path, 'wb') as destination:
+						shutil.copyfileobj(source, destination, WRITE_BUFFER_SIZE)
+
+					# Keep the modified time and unix permissions (eg. executable bits), like 7z does
+					modifiedTime = time.mktime(info.date_time + (0, 0, -1))
+					os.utime(path, (modifiedTime, modifiedTime))
+					mode = _unixMode(info) & 0o777
+					if mode and not common.Globals.IS_WINDOWS:
+						os.chmod(path, mode)
+				except Exception as e:
+					errors.append("Failed to extract [{}] from [{}]: {}".format(info.filename, archivePath, e))
+					return
+
+				with progressLock:
+					progress['numExtracted'] += 1
+					progress['extractedSize'] += info.file_size
+					now = time.time()
+					if now - progress['lastPublishTime'] >= PROGRESS_INTERVAL_SECONDS:
+						progress['lastPublishTime'] = now
+						eventBus.publishSubTaskProgress(int(progress['extractedSize'] * 100 / totalSize),
+						                                "Extracting - {} - {}".format(progress['numExtracted'], info.filename))
+
+	batches = _splitIntoBatches(members, max(1, maxWorkers))
+	common.parallelMap(extractBatch, batches, len(batches))
+
+	if errors:
+		errorMessage = errors[0]
+		if 'Permission denied' in errorMessage or 'Access is denied' in errorMessage or 'WinError 5' in errorMessage:
+			errorMessage = "{}\n\n{}".format(common.Globals.PERMISSON_DENIED_ERROR_MESSAGE, errorMessage)
+		raise ZipExtractionException(errorMessage)
+
+	eventBus.publishSubTaskProgress(100, "Extracting - {} files".format(len(members)))
+	print("zipExtractor: Extracted {} files ({}) in {:.1f}s using {} threads".format(
+		len(members), common.prettyPrintFileSize(totalSize), time.time() - startTime, len(batches)))